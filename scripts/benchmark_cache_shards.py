@@ -0,0 +1,91 @@
+"""
+Benchmarks mixed read and write throughput of a single-file and a sharded
+cache as the number of concurrent writer threads grows, like the cache thread
+pool serving a /sync merge, a bootstrap pass and list requests at once.
+
+Usage: python scripts/benchmark_cache_shards.py [shards] [seconds]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.cache_layout import open_cache  # noqa: E402
+from src.sync import merge_imdb_items  # noqa: E402
+
+KEYS = 10000
+READERS = 4
+WRITER_COUNTS = [1, 2, 4, 8]
+# Items per /sync-like bulk merge, run by one more thread during each run.
+MERGE_SIZE = 2000
+
+
+def run(cache, writers: int, seconds: float):
+    reads = [0] * READERS
+    writes = [0] * writers
+    merged = [0]
+    stop = threading.Event()
+
+    def read(i):
+        while not stop.is_set():
+            cache.get(str(random.randrange(KEYS)))
+            reads[i] += 1
+
+    def write(i):
+        while not stop.is_set():
+            cache.set(str(random.randrange(KEYS)), os.urandom(100))
+            writes[i] += 1
+
+    def merge():
+        while not stop.is_set():
+            items = [
+                {
+                    "key": str(random.randrange(KEYS)),
+                    "value": os.urandom(100),
+                    "expire_time": None,
+                }
+                for _ in range(MERGE_SIZE)
+            ]
+            merge_imdb_items(cache, items)
+            merged[0] += len(items)
+
+    threads = [threading.Thread(target=merge)]
+    threads += [threading.Thread(target=read, args=(i,)) for i in range(READERS)]
+    threads += [threading.Thread(target=write, args=(i,)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(reads) / seconds, sum(writes) / seconds, merged[0] / seconds
+
+
+def main(shards: int = 8, seconds: float = 3):
+    print(
+        f"{READERS} reader threads and a bulk merge of {MERGE_SIZE} items at a "
+        + f"time, {KEYS} keys, {seconds} seconds per run"
+    )
+    print("| shards | writers | reads/s | writes/s | merged items/s |")
+    print("| --- | --- | --- | --- | --- |")
+    for shard_count in [1, shards]:
+        with tempfile.TemporaryDirectory() as directory:
+            cache = open_cache(directory, shard_count)
+            for i in range(KEYS):
+                cache.set(str(i), os.urandom(100))
+            for writers in WRITER_COUNTS:
+                reads, writes, merged = run(cache, writers, seconds)
+                print(
+                    f"| {shard_count} | {writers} | {reads:.0f} | {writes:.0f} "
+                    + f"| {merged:.0f} |"
+                )
+            cache.close()
+
+
+if __name__ == "__main__":
+    main(*[parse(_) for parse, _ in zip([int, float], sys.argv[1:3])])
@@ -0,0 +1,101 @@
+"""
+Benchmarks a bootstrap-like pass over cached lists: how many IMDb cache probes
+it takes and how long it runs, with and without the in-memory key filter.
+
+Usage: python scripts/benchmark_membership.py [cached_keys] [lists] [list_size]
+"""
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+async def run_pass(api, lists, per_item: bool):
+    probes = 0
+    get = api.async_cache.get
+    get_many = api.async_cache.get_many
+
+    async def counting_get(key, *args, **kwargs):
+        nonlocal probes
+        probes += 1
+        return await get(key, *args, **kwargs)
+
+    async def counting_get_many(keys, *args, **kwargs):
+        nonlocal probes
+        keys = list(keys)
+        probes += len(keys)
+        return await get_many(keys, *args, **kwargs)
+
+    api.async_cache.get = counting_get
+    api.async_cache.get_many = counting_get_many
+    start = time.monotonic()
+    for items in lists:
+        if per_item:
+            # Bootstrap before the key filter: one cache read per item.
+            douban_ids = items
+        else:
+            douban_ids = await api.get_uncached_douban_ids(items)
+        for douban_id in douban_ids:
+            await api.get_imdb_id(douban_id, items[douban_id])
+    duration = time.monotonic() - start
+    api.async_cache.get = get
+    api.async_cache.get_many = get_many
+    return probes, duration
+
+
+async def main(cached_keys: int = 100000, list_count: int = 100, list_size: int = 500):
+    from src.imdb import ImdbApi
+
+    class BenchmarkImdbApi(ImdbApi):
+        async def fetch_imdb_id(self, douban_id, douban_item):
+            return f"tt{douban_id}"
+
+    api = BenchmarkImdbApi()
+    print(f"Filling the IMDb cache with {cached_keys} keys...")
+    with api.cache.transact():
+        for i in range(cached_keys):
+            api.cache.set(str(i), f"tt{i}")
+
+    # Nearly all list items are cached already, as in a steady-state bootstrap.
+    def new_lists():
+        return [
+            {
+                str(
+                    random.randrange(cached_keys)
+                    if random.random() < 0.98
+                    else cached_keys + random.randrange(10**9)
+                ): {"title": ""}
+                for _ in range(list_size)
+            }
+            for _ in range(list_count)
+        ]
+
+    for name, per_item in [("Per item", True), ("Batched", False)]:
+        probes, duration = await run_pass(api, new_lists(), per_item)
+        print(f"{name}, without key filter: {probes} probes, {duration:.3f} seconds")
+
+    start = time.monotonic()
+    api.key_filter.build(api.cache)
+    build_duration = time.monotonic() - start
+    info = api.key_filter.get_info()
+    print(
+        f"Built key filter in {build_duration:.3f} seconds, "
+        + f"{info['size_bytes']} bytes"
+    )
+
+    probes, duration = await run_pass(api, new_lists(), False)
+    print(f"With key filter: {probes} probes, {duration:.3f} seconds")
+    api.cache.close()
+    api.reverse_index.close()
+
+
+if __name__ == "__main__":
+    args = [int(_) for _ in sys.argv[1:4]]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["DOUDARR_CACHE_BASE_DIR"] = cache_dir
+        asyncio.run(main(*args))
@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import logging
+import os
+
+from .aggregate import AggregateCache
+from .config import app_config
+from .imdb import get_imdb_api
+from .changes import ListChangeLog
+from .indexes import ImdbReverseIndex, ListMembershipIndex
+from .lists import CollectionApi, DoulistApi
+from .resolve import BulkResolver, read_list_specs
+from .snapshot import export_snapshot, import_snapshot
+from .utils import new_cache
+
+
+def snapshot_export(args: argparse.Namespace):
+    cache = new_cache("imdb")
+    try:
+        with open(args.path, "wb") as f:
+            export_snapshot(cache, f)
+    finally:
+        cache.close()
+
+
+def snapshot_import(args: argparse.Namespace):
+    cache = new_cache("imdb")
+    reverse_index = ImdbReverseIndex()
+    aggregate_cache = AggregateCache()
+    try:
+        with open(args.path, "rb") as f:
+            if import_snapshot(cache, f, reverse_index)["count"]:
+                # Cached results may lack the imported IMDb IDs.
+                aggregate_cache.invalidate_all()
+    finally:
+        cache.close()
+        reverse_index.close()
+        aggregate_cache.close()
+
+
+def resolve(args: argparse.Namespace):
+    specs = [f"collection:{id}" for id in args.collection] + [
+        f"doulist:{id}" for id in args.doulist
+    ]
+    lists = read_list_specs(specs, args.file)
+    state_path = args.state_file or os.path.join(
+        app_config.cache_base_dir, "resolve_state.json"
+    )
+    if args.restart and os.path.exists(state_path):
+        os.remove(state_path)
+
+    membership_index = ListMembershipIndex()
+    change_log = ListChangeLog(membership_index)
+    resolver = BulkResolver(
+        {
+            "collection": CollectionApi(membership_index, change_log),
+            "doulist": DoulistApi(membership_index, change_log),
+        },
+        get_imdb_api(),
+        concurrency=args.concurrency,
+        state_path=state_path,
+    )
+    asyncio.run(resolver.run(lists))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="doudarr")
+    subparsers = parser.add_subparsers(required=True)
+
+    snapshot_parser = subparsers.add_parser(
+        "snapshot", help="Export or import the IMDb cache."
+    )
+    snapshot_subparsers = snapshot_parser.add_subparsers(required=True)
+    export_parser = snapshot_subparsers.add_parser(
+        "export", help="Export the IMDb cache to a snapshot file."
+    )
+    export_parser.add_argument("path", help="Path of the snapshot file to write.")
+    export_parser.set_defaults(func=snapshot_export)
+    import_parser = snapshot_subparsers.add_parser(
+        "import", help="Import a snapshot file into the IMDb cache."
+    )
+    import_parser.add_argument("path", help="Path of the snapshot file to read.")
+    import_parser.set_defaults(func=snapshot_import)
+
+    resolve_parser = subparsers.add_parser(
+        "resolve", help="Fetch lists and resolve their items to IMDb IDs."
+    )
+    resolve_parser.add_argument(
+        "--collection", action="append", default=[], help="Collection ID."
+    )
+    resolve_parser.add_argument(
+        "--doulist", action="append", default=[], help="Doulist ID."
+    )
+    resolve_parser.add_argument(
+        "--file",
+        help="File with one list per line, as `collection:<id>`, `doulist:<id>` "
+        + "or a Douban list URL.",
+    )
+    resolve_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of concurrent list fetches and IMDb lookups.",
+    )
+    resolve_parser.add_argument(
+        "--state-file",
+        help="Where to record finished lists. Defaults to the cache directory.",
+    )
+    resolve_parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore lists finished in previous runs.",
+    )
+    resolve_parser.set_defaults(func=resolve)
+
+    args = parser.parse_args()
+    logging.basicConfig(
+        format="%(asctime)s - %(levelname)s - %(message)s", level=logging.INFO
+    )
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
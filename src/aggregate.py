@@ -0,0 +1,92 @@
+import hashlib
+import json
+from typing import Any, List, Optional, Set, Tuple
+
+from .config import app_config
+from .utils import get_douban_id, new_cache
+
+AGGREGATE_OPS = ("union", "intersection", "difference")
+
+
+def combine_lists(item_lists: List[List[Any]], op: str) -> List[Any]:
+    """
+    Combines lists of Douban items with a set operation, keyed by Douban ID.
+    `difference` keeps the items of the first list that are in no other list.
+    Items keep the order of their first appearance and are deduplicated.
+    """
+    id_sets = [{get_douban_id(item) for item in items} for items in item_lists]
+    if op == "union":
+        candidates = [item for items in item_lists for item in items]
+        keep = set().union(*id_sets)
+    elif op == "intersection":
+        candidates = item_lists[0]
+        keep = set.intersection(*id_sets)
+    elif op == "difference":
+        candidates = item_lists[0]
+        keep = id_sets[0].difference(*id_sets[1:])
+    else:
+        raise ValueError(f"Unknown operation: {op}")
+
+    result = []
+    seen = set()
+    for item in candidates:
+        douban_id = get_douban_id(item)
+        if douban_id in keep and douban_id not in seen:
+            seen.add(douban_id)
+            result.append(item)
+    return result
+
+
+def get_etag(items: List[Any]) -> str:
+    return '"' + hashlib.sha1(json.dumps(items).encode()).hexdigest() + '"'
+
+
+class AggregateCache:
+    """
+    Caches aggregated list responses with their ETags.
+
+    Entries are dropped when one of their lists is refetched or when the IMDb
+    ID of one of their members changes, so they don't have to wait for the TTL.
+    IMDb IDs merged in bulk, by `/sync` or a snapshot import, drop all entries.
+    """
+
+    def __init__(self):
+        self.cache = new_cache("aggregate")
+
+    def close(self):
+        self.cache.close()
+
+    def get_key(self, list_keys: List[str], op: str, min_rating: float) -> str:
+        if op != "difference":
+            list_keys = sorted(list_keys)
+        return json.dumps([op, list_keys, min_rating])
+
+    def get(self, key: str) -> Optional[Tuple[List[Any], str]]:
+        return self.cache.get(f"result:{key}")
+
+    def set(self, key: str, list_keys: List[str], items: List[Any]) -> str:
+        etag = get_etag(items)
+        with self.cache.transact():
+            self.cache.set(
+                f"result:{key}",
+                (items, etag),
+                expire=app_config.aggregate_cache_ttl_seconds,
+            )
+            for list_key in list_keys:
+                keys = self.cache.get(f"list:{list_key}", default=set())
+                keys.add(key)
+                # Outlives the results it points to, which are set no later.
+                self.cache.set(
+                    f"list:{list_key}",
+                    keys,
+                    expire=app_config.aggregate_cache_ttl_seconds,
+                )
+        return etag
+
+    def invalidate_list(self, list_key: str):
+        keys: Set[str] = self.cache.pop(f"list:{list_key}", default=set())
+        for key in keys:
+            self.cache.delete(f"result:{key}")
+
+    def invalidate_all(self):
+        self.cache.clear()
@@ -0,0 +1,84 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, TypeVar
+
+from diskcache import Cache
+
+from .cache_backends import CacheBackend
+from .cache_layout import split_by_shard
+from .config import app_config
+
+T = TypeVar("T")
+
+# SQLite I/O of all caches runs here, so it never blocks the event loop.
+# diskcache opens one connection per thread.
+cache_executor = ThreadPoolExecutor(
+    max_workers=app_config.cache_thread_pool_size, thread_name_prefix="cache"
+)
+
+
+async def run_in_cache_executor(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Runs a blocking cache call on the cache thread pool."""
+    return await asyncio.get_running_loop().run_in_executor(
+        cache_executor, functools.partial(fn, *args, **kwargs)
+    )
+
+
+class AsyncCache:
+    """
+    Async facade of a diskcache `Cache`. Calls run on the cache thread pool;
+    `get_many` and `set_many` run in one SQLite transaction each.
+    """
+
+    def __init__(self, cache: Cache):
+        self.cache = cache
+
+    async def get(self, key: str, default: Any = None, expire_time: bool = False):
+        return await run_in_cache_executor(
+            self.cache.get, key, default=default, expire_time=expire_time
+        )
+
+    async def set(self, key: str, value: Any, expire: Optional[float] = None):
+        return await run_in_cache_executor(self.cache.set, key, value, expire=expire)
+
+    async def delete(self, key: str):
+        return await run_in_cache_executor(self.cache.delete, key)
+
+    async def get_many(
+        self, keys: Iterable[str], expire_time: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Returns the cached values of `keys`, or `(value, expire_time)` tuples
+        with `expire_time`. Keys that are not cached are left out.
+        """
+        return await run_in_cache_executor(self._get_many, list(keys), expire_time)
+
+    async def set_many(
+        self, items: Iterable[Tuple[str, Any]], expire: Optional[float] = None
+    ):
+        await run_in_cache_executor(self._set_many, list(items), expire)
+
+    def _get_many(self, keys, expire_time):
+        if isinstance(self.cache, CacheBackend):
+            return self.cache.get_many(keys, expire_time=expire_time)
+        result = {}
+        missing = object()
+        # One transaction per shard, rather than locking all shards at once.
+        for shard, shard_keys in split_by_shard(self.cache, keys):
+            with shard.transact():
+                for key in shard_keys:
+                    value = shard.get(key, default=missing, expire_time=expire_time)
+                    if (value[0] if expire_time else value) is not missing:
+                        result[key] = value
+        return result
+
+    def _set_many(self, items, expire):
+        if isinstance(self.cache, CacheBackend):
+            expire_time = time.time() + expire if expire else None
+            self.cache.set_many((key, value, expire_time) for key, value in items)
+            return
+        with self.cache.transact():
+            for key, value in items:
+                self.cache.set(key, value, expire=expire)
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from typing import Any, Dict, Set
+
+from .deadline import current_deadline
+from .imdb import ImdbApi
+from .lists import BaseApi
+from .list_index import ListIndex
+from .retry import BACKGROUND, current_priority
+from .throttler import RateLimitedError
+
+
+class BackgroundResolver:
+    """
+    Finishes work that requests handed off when they ran out of time, so the
+    results are cached for the next request.
+
+    List fetches run as shared tasks without a deadline: a request only waits
+    for them within its own budget. IMDb lookups are queued and resolved by a
+    few workers, at most `max_pending` at a time.
+    """
+
+    def __init__(self, imdb_api: ImdbApi, concurrency: int, max_pending: int):
+        self.imdb_api = imdb_api
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.pending: Dict[str, Any] = {}
+        self.in_flight: Set[str] = set()
+        self.has_pending = asyncio.Event()
+        self.fetches: Dict[str, asyncio.Task] = {}
+        self.submitted = 0
+        self.resolved = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def fetch_index(self, list_api: BaseApi, id: str) -> "asyncio.Task[ListIndex]":
+        """Returns the task fetching the index of a list, starting it if needed."""
+        list_key = list_api.get_list_key(id)
+        task = self.fetches.get(list_key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_index(list_api, id))
+            self.fetches[list_key] = task
+            task.add_done_callback(lambda task: self._on_fetch_done(list_key, task))
+        return task
+
+    def submit(self, douban_id: str, douban_item: Any) -> bool:
+        """Queues an IMDb lookup. Returns False if it's already queued or dropped."""
+        if self.is_pending(douban_id):
+            return False
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            return False
+        self.pending[douban_id] = douban_item
+        self.submitted += 1
+        self.has_pending.set()
+        return True
+
+    def is_pending(self, douban_id: str) -> bool:
+        return douban_id in self.pending or douban_id in self.in_flight
+
+    async def run(self):
+        await asyncio.gather(*(self._work() for _ in range(self.concurrency)))
+
+    def get_info(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self.pending),
+            "in_flight": len(self.in_flight),
+            "list_fetches": len(self.fetches),
+            "submitted": self.submitted,
+            "resolved": self.resolved,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    async def _fetch_index(self, list_api: BaseApi, id: str) -> ListIndex:
+        # The fetch outlives the request that started it.
+        current_deadline.set(None)
+        current_priority.set(BACKGROUND)
+        return await list_api.get_index(id)
+
+    def _on_fetch_done(self, list_key: str, task: asyncio.Task):
+        self.fetches.pop(list_key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logging.warning(f"Failed to fetch {list_key}: {task.exception()}")
+
+    async def _work(self):
+        current_priority.set(BACKGROUND)
+        while True:
+            if not self.pending:
+                self.has_pending.clear()
+                await self.has_pending.wait()
+                continue
+            douban_id = next(iter(self.pending))
+            douban_item = self.pending.pop(douban_id)
+            self.in_flight.add(douban_id)
+            try:
+                await self.imdb_api.get_imdb_id(douban_id, douban_item)
+                self.resolved += 1
+            except RateLimitedError as e:
+                # Try again once the host accepts requests.
+                self.pending[douban_id] = douban_item
+                await asyncio.sleep(e.wait_time)
+            except Exception as e:
+                logging.warning(
+                    f"Failed to resolve douban ID {douban_id} in background: {e}"
+                )
+                self.failed += 1
+            finally:
+                self.in_flight.discard(douban_id)
@@ -1,22 +1,34 @@
 import asyncio
 import logging
 import random
-from typing import List, Tuple
+import time
+from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import urlparse, parse_qs
-from .lists import CollectionApi, DoulistApi, ListsApi
+import httpx
+from diskcache import Cache
+from .async_cache import AsyncCache, run_in_cache_executor
+from .bulk_cache import read_keys
+from .lists import BaseApi, CollectionApi, DoulistApi, ListsApi
 from .imdb import ImdbApi
 from .config import app_config
-from .utils import get_douban_id
+from .retry import BACKGROUND, current_priority
+from .utils import get_douban_id, new_cache
+
+# Discovery stops after this many lists in a row that are known already.
+KNOWN_LISTS_TO_STOP = 50
+# Pages of movies fetched ahead of IMDb resolution during bootstrap.
+BOOTSTRAP_QUEUE_PAGES = 10
 
 
 async def bootstrap(
-    collection_api: CollectionApi, doulist_api: DoulistApi, imdb_api: ImdbApi
+    collection_api: CollectionApi,
+    doulist_api: DoulistApi,
+    imdb_api: ImdbApi,
+    catalog: "ListCatalog",
 ):
     """
-    This function is called at the start of the application to regularly send
-    HTTP requests and cache the results.
-
-    This can help saving time on incoming requests.
+    Warms the caches with the lists of the catalog, a sample at a time. It is
+    scheduled regularly, so that incoming requests find more items cached.
     """
 
     list_apis = {
@@ -24,52 +36,173 @@ async def bootstrap(
         "doulist": doulist_api,
     }
 
-    while True:
-        logging.info("Bootstrapping...")
+    current_priority.set(BACKGROUND)
+    logging.info("Bootstrapping...")
+    try:
+        await catalog.discover()
+    except Exception:
+        logging.exception("Failed to discover new lists.")
+    lists = await catalog.sample(app_config.bootstrap_lists_max)
+
+    # Lists are fetched from Douban while the movies of the pages fetched so far
+    # are resolved, so both hosts are kept busy. The queue holds pages of movies
+    # and bounds how far fetching can run ahead of resolving.
+    queue: asyncio.Queue[Optional[Dict[str, Any]]] = asyncio.Queue(
+        BOOTSTRAP_QUEUE_PAGES
+    )
+    resolver = asyncio.create_task(resolve_pages(imdb_api, queue))
+    try:
+        for type, id in lists:
+            await fetch_list(list_apis[type], type, id, catalog, queue)
+            await asyncio.sleep(app_config.bootstrap_list_interval_seconds)
+        await queue.put(None)
+        await resolver
+    finally:
+        resolver.cancel()
+    logging.info("Bootstrapping done.")
+
+
+async def fetch_list(
+    list_api: BaseApi,
+    type: str,
+    id: str,
+    catalog: "ListCatalog",
+    queue: asyncio.Queue,
+):
+    """Queues the movies of a list a page at a time, pruning it if it's gone."""
+    has_movies = False
+    try:
+        async for page in list_api.iter_pages(id):
+            # Keep only movies
+            items = {
+                get_douban_id(item): item for item in page if item["type"] == "movie"
+            }
+            if items:
+                has_movies = True
+                await queue.put(items)
+        if not has_movies:
+            logging.info(f"Pruning {type} {id} without movies.")
+            await catalog.remove(type, id)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            logging.info(f"Pruning {type} {id} that no longer exists.")
+            await catalog.remove(type, id)
+        else:
+            logging.exception(f"Failed to fetch {type} {id}.")
+    except Exception:
+        logging.exception(f"Failed to fetch {type} {id}.")
+
+
+async def resolve_pages(
+    imdb_api: ImdbApi, queue: asyncio.Queue[Optional[Dict[str, Any]]]
+):
+    """Resolves the IMDb IDs of queued pages of movies, until it gets None."""
+    while (items := await queue.get()) is not None:
         try:
-            lists = await get_lists_to_bootstrap()
-            for type, id in lists:
-                try:
-                    list_api = list_apis[type]
-                    items = await list_api.get_items(id)
-                    # Keep only movies
-                    items = [item for item in items if item["type"] == "movie"]
-                    for item in items:
-                        douban_id = get_douban_id(item)
-                        await imdb_api.get_imdb_id(douban_id, item)
-                except Exception:
-                    logging.exception(f"Failed to fetch {type} {id}.")
-
-                await asyncio.sleep(app_config.bootstrap_list_interval_seconds)
-            logging.info("Bootstrapping done.")
+            # Only resolve the ones that are not cached yet
+            for douban_id in await imdb_api.get_uncached_douban_ids(items):
+                await imdb_api.get_imdb_id(douban_id, items[douban_id])
         except Exception:
-            logging.exception("Failed to bootstrap.")
-        await asyncio.sleep(app_config.bootstrap_interval_seconds)
+            logging.exception("Failed to resolve IMDb IDs.")
 
 
-async def get_lists_to_bootstrap() -> List[Tuple[str, str]]:
-    lists_api = ListsApi()
-    lists = set()
-    async for item in lists_api.iter_lists():
-        parsed_url = urlparse(item["sharing_url"])
-        url_parts = [_ for _ in parsed_url.path.split("/") if _][-2:]
-        list_type = url_parts[0]
+def parse_list_url(url: str) -> Optional[Tuple[str, str]]:
+    """Returns `(type, id)` of a Douban list sharing URL, or None if unknown."""
+    parsed_url = urlparse(url)
+    url_parts = [_ for _ in parsed_url.path.split("/") if _][-2:]
+    list_type = url_parts[0]
+    list_id = url_parts[1]
+    if list_type == "doubanapp" and list_id == "dispatch":
+        query_params = parse_qs(parsed_url.query)
+        uri = query_params.get("uri", [None])[0]
+        if uri:
+            url_parts = [_ for _ in uri.split("/") if _][-2:]
+            list_type = url_parts[0]
         list_id = url_parts[1]
-        if list_type == "doubanapp" and list_id == "dispatch":
-            query_params = parse_qs(parsed_url.query)
-            uri = query_params.get("uri", [None])[0]
-            if uri:
-                url_parts = [_ for _ in uri.split("/") if _][-2:]
-                list_type = url_parts[0]
-            list_id = url_parts[1]
-        if list_type == "subject_collection":
-            lists.add(("collection", list_id))
-        elif list_type == "doulist":
-            lists.add(("doulist", list_id))
-        else:
-            logging.warning(f"Unknown list type: {list_type}")
-        if len(lists) >= app_config.bootstrap_lists_max * 10:
-            break
+    if list_type == "subject_collection":
+        return ("collection", list_id)
+    elif list_type == "doulist":
+        return ("doulist", list_id)
+    logging.warning(f"Unknown list type: {list_type}")
+    return None
+
+
+class ListCatalog:
+    """
+    The lists discovered from the `new_playlists` feed, persisted so that each
+    bootstrap pass only reads the newest pages of the feed. Discovery stops at
+    a run of lists that are known already; the first pass reads up to
+    `bootstrap_lists_max * 10` lists like before.
+
+    Lists expire from the catalog `bootstrap_catalog_ttl_seconds` after they
+    were last seen in the feed. Lists that are gone or have no movies are
+    removed by bootstrap.
+    """
+
+    def __init__(
+        self, cache: Optional[Cache] = None, lists_api: Optional[ListsApi] = None
+    ):
+        self.cache = cache if cache is not None else new_cache("list_catalog")
+        self.async_cache = AsyncCache(self.cache)
+        self.lists_api = lists_api if lists_api is not None else ListsApi()
+        self.last_discovery: Dict[str, Any] = {}
+
+    async def discover(self) -> int:
+        """Reads the newest lists of the feed. Returns how many were new."""
+        start = time.monotonic()
+        found = {}
+        known_in_a_row = 0
+        async for item in self.lists_api.iter_lists():
+            parsed = parse_list_url(item["sharing_url"])
+            if parsed is None or parsed in found:
+                continue
+            found[parsed] = await self.async_cache.get(
+                self._get_key(*parsed), default=None
+            )
+            if found[parsed] is None:
+                known_in_a_row = 0
+            else:
+                known_in_a_row += 1
+                if known_in_a_row >= KNOWN_LISTS_TO_STOP:
+                    break
+            if len(found) >= app_config.bootstrap_lists_max * 10:
+                break
+        # Lists seen again stay in the catalog for another TTL.
+        now = time.time()
+        await self.async_cache.set_many(
+            [
+                (self._get_key(*parsed), discovered_time or now)
+                for parsed, discovered_time in found.items()
+            ],
+            expire=app_config.bootstrap_catalog_ttl_seconds,
+        )
+        new = len([_ for _ in found.values() if _ is None])
+        self.last_discovery = {
+            "time": now,
+            "duration_seconds": time.monotonic() - start,
+            "seen": len(found),
+            "new": new,
+        }
+        logging.info(f"Discovered {new} new lists, {len(found)} seen.")
+        return new
+
+    async def sample(self, count: int) -> List[Tuple[str, str]]:
+        lists = await run_in_cache_executor(self.get_lists)
+        return random.sample(lists, min(count, len(lists)))
+
+    def get_lists(self) -> List[Tuple[str, str]]:
+        now = time.time()
+        return [
+            tuple(key.split(":", 1))
+            for key, expire_time in read_keys(self.cache)
+            if expire_time is None or expire_time > now
+        ]
+
+    async def remove(self, type: str, id: str):
+        await self.async_cache.delete(self._get_key(type, id))
+
+    def get_info(self) -> Dict[str, Any]:
+        return {"lists": len(self.cache), "last_discovery": self.last_discovery}
 
-    lists = random.sample(list(lists), app_config.bootstrap_lists_max)
-    return lists
+    def _get_key(self, type: str, id: str) -> str:
+        return f"{type}:{id}"
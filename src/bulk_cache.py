@@ -0,0 +1,122 @@
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from diskcache import Cache, FanoutCache
+
+from .cache_backends import CacheBackend
+from .cache_layout import MigratingCache, has_known_internals, split_by_shard
+
+# Keys per transaction. A transaction holds the cache's write lock, so keep
+# them short enough not to stall other processes.
+BATCH_SIZE = 1000
+
+# Bulk reads and writes that take the cache's lock once per batch of keys,
+# instead of once per key. Keys must be strings. Sharded and migrating caches
+# (see `cache_layout`) are handled shard by shard, other backends (see
+# `cache_backends`) bring their own bulk operations.
+
+
+def read_many(cache: Cache, keys: Iterable[str]) -> Dict[str, Tuple[Any, float]]:
+    """
+    Returns `(value, expire_time)` of the given keys that are cached and not
+    expired.
+    """
+    keys = list(keys)
+    if isinstance(cache, CacheBackend):
+        return cache.get_many(keys, expire_time=True)
+    if isinstance(cache, MigratingCache):
+        # Legacy caches first, like `MigratingCache.get`.
+        result = {}
+        for shard in [*cache.legacies, cache.current]:
+            result.update(read_many(shard, [_ for _ in keys if _ not in result]))
+        return result
+    if isinstance(cache, FanoutCache) and has_known_internals():
+        result = {}
+        for shard, shard_keys in split_by_shard(cache, keys):
+            result.update(read_many(shard, shard_keys))
+        return result
+    missing = object()
+    result = {}
+    for i in range(0, len(keys), BATCH_SIZE):
+        with cache.transact():
+            for key in keys[i : i + BATCH_SIZE]:
+                value, expire_time = cache.get(key, missing, expire_time=True)
+                if value is not missing:
+                    result[key] = (value, expire_time)
+    return result
+
+
+def write_many(
+    cache: Cache, entries: Iterable[Tuple[str, Any, Optional[float]]]
+) -> int:
+    """
+    Writes `(key, value, expire_time)` entries in one transaction, replacing
+    existing ones. `expire_time` is an absolute timestamp, or None. If a key is
+    given more than once, the last entry wins. Returns the number of keys.
+    """
+    if isinstance(cache, CacheBackend):
+        # Like here, the last entry of a key wins.
+        return cache.set_many(entries)
+    if isinstance(cache, MigratingCache):
+        entries = list(entries)
+        count = write_many(cache.current, entries)
+        for legacy in cache.legacies:
+            delete_many(legacy, {key for key, _, _ in entries})
+        return count
+    if isinstance(cache, FanoutCache) and has_known_internals():
+        entries = {
+            key: (key, value, expire_time) for key, value, expire_time in entries
+        }
+        return sum(
+            write_many(shard, [entries[_] for _ in shard_keys])
+            for shard, shard_keys in split_by_shard(cache, entries)
+        )
+    entries = {key: (value, expire_time) for key, value, expire_time in entries}
+    now = time.time()
+    with cache.transact():
+        for key, (value, expire_time) in entries.items():
+            expire = expire_time - now if expire_time is not None else None
+            cache.set(key, value, expire=expire)
+    return len(entries)
+
+
+def delete_many(cache: Cache, keys: Iterable[str]):
+    """Deletes the given keys in one transaction per shard."""
+    if isinstance(cache, CacheBackend):
+        cache.delete_many(keys)
+        return
+    if isinstance(cache, MigratingCache):
+        keys = list(keys)
+        for shard in [cache.current, *cache.legacies]:
+            delete_many(shard, keys)
+        return
+    for shard, shard_keys in split_by_shard(cache, keys):
+        with shard.transact():
+            for key in shard_keys:
+                shard.delete(key)
+
+
+def read_keys(cache: Cache) -> List[Tuple[str, Optional[float]]]:
+    """
+    Returns `(key, expire_time)` of all keys. Expired keys may be included, so
+    callers check `expire_time` themselves.
+    """
+    if isinstance(cache, CacheBackend):
+        return cache.read_keys()
+    if isinstance(cache, MigratingCache):
+        keys = {}
+        for shard in [*cache.legacies, cache.current]:
+            keys.update(read_keys(shard))
+        return list(keys.items())
+    if has_known_internals():
+        # Without loading every value, by reading the `Cache` table directly.
+        if isinstance(cache, FanoutCache):
+            return [_ for shard in cache._shards for _ in read_keys(shard)]
+        return cache._sql("SELECT key, expire_time FROM Cache WHERE raw = 1").fetchall()
+    missing = object()
+    result = []
+    for key in cache:
+        value, expire_time = cache.get(key, missing, expire_time=True)
+        if value is not missing:
+            result.append((key, expire_time))
+    return result
@@ -0,0 +1,370 @@
+import pickle
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+# Timeout of connecting to and waiting for the Redis server.
+REDIS_TIMEOUT_SECONDS = 5
+# Keys per SCAN call, and per MGET or pipeline when reading or writing many.
+REDIS_BATCH_SIZE = 1000
+
+
+class CacheBackend(ABC):
+    """
+    A cache that is not a diskcache `Cache`, with the part of its interface
+    used here: `get`, `set` (with `expire`), `delete`, `pop`, `transact`,
+    iteration, `len`, `in` and the maintenance calls. Bulk reads and writes go
+    through `get_many`, `set_many` and `delete_many`, see `bulk_cache`.
+
+    `transact` only serializes transactions within this process. A `shared`
+    cache is written by other processes too, so nothing may assume to know
+    all of its keys.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self.lock = threading.RLock()
+
+    @abstractmethod
+    def get_many(
+        self, keys: Iterable[str], expire_time: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Returns the cached values of `keys`, or `(value, expire_time)` tuples
+        with `expire_time`. Keys that are not cached are left out.
+        """
+
+    @abstractmethod
+    def set_many(self, entries: Iterable[Tuple[str, Any, Optional[float]]]) -> int:
+        """
+        Writes `(key, value, expire_time)` entries, where `expire_time` is an
+        absolute timestamp or None. Returns the number of entries.
+        """
+
+    @abstractmethod
+    def delete_many(self, keys: Iterable[str]) -> int:
+        """Deletes the given keys. Returns the number of keys deleted."""
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[str]:
+        pass
+
+    @abstractmethod
+    def clear(self, retry=False) -> int:
+        pass
+
+    def get(self, key: str, default=None, expire_time=False, retry=False):
+        result = self.get_many([key], expire_time=expire_time)
+        if key in result:
+            return result[key]
+        return (default, None) if expire_time else default
+
+    def set(self, key: str, value: Any, expire=None, retry=False) -> bool:
+        self.set_many([(key, value, time.time() + expire if expire else None)])
+        return True
+
+    def delete(self, key: str, retry=False) -> bool:
+        return self.delete_many([key]) > 0
+
+    def pop(self, key: str, default=None, expire_time=False, retry=False):
+        with self.transact():
+            result = self.get(key, default=default, expire_time=expire_time)
+            self.delete(key)
+        return result
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.get_many([key])
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def read_keys(self) -> List[Tuple[str, Optional[float]]]:
+        """Returns `(key, expire_time)` of all keys."""
+        result = []
+        keys = list(self)
+        for i in range(0, len(keys), REDIS_BATCH_SIZE):
+            entries = self.get_many(keys[i : i + REDIS_BATCH_SIZE], expire_time=True)
+            result += [(key, expire_time) for key, (_, expire_time) in entries.items()]
+        return result
+
+    @contextmanager
+    def transact(self, retry=True):
+        with self.lock:
+            yield
+
+    def expire(self, retry=False) -> int:
+        # Expired entries are dropped by the backend itself.
+        return 0
+
+    def cull(self, retry=False) -> int:
+        return 0
+
+    def check(self, fix=False, retry=False) -> List[Any]:
+        return []
+
+    def volume(self) -> int:
+        return 0
+
+    @abstractmethod
+    def close(self):
+        pass
+
+
+class MemoryCache(CacheBackend):
+    """An unbounded in-process cache, for tests and benchmarks."""
+
+    def __init__(self):
+        super().__init__()
+        self.entries: Dict[str, Tuple[Any, Optional[float]]] = {}
+
+    def get_many(
+        self, keys: Iterable[str], expire_time: bool = False
+    ) -> Dict[str, Any]:
+        now = time.time()
+        result = {}
+        for key in keys:
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+            if entry[1] is not None and entry[1] <= now:
+                self.entries.pop(key, None)
+                continue
+            result[key] = entry if expire_time else entry[0]
+        return result
+
+    def set_many(self, entries: Iterable[Tuple[str, Any, Optional[float]]]) -> int:
+        count = 0
+        with self.lock:
+            for key, value, expire_time in entries:
+                self.entries[key] = (value, expire_time)
+                count += 1
+        return count
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        with self.lock:
+            return len([_ for _ in keys if self.entries.pop(_, None) is not None])
+
+    def __iter__(self) -> Iterator[str]:
+        now = time.time()
+        for key, (_, expire_time) in list(self.entries.items()):
+            if expire_time is None or expire_time > now:
+                yield key
+
+    def clear(self, retry=False) -> int:
+        with self.lock:
+            count = len(self.entries)
+            self.entries.clear()
+        return count
+
+    def expire(self, retry=False) -> int:
+        with self.lock:
+            now = time.time()
+            expired = [
+                key
+                for key, (_, expire_time) in self.entries.items()
+                if expire_time is not None and expire_time <= now
+            ]
+            for key in expired:
+                del self.entries[key]
+        return len(expired)
+
+    def close(self):
+        # Entries live as long as the instance.
+        pass
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConnection:
+    """
+    A blocking connection speaking the Redis protocol (RESP2). Commands can
+    be pipelined: all are sent at once, then all replies are read.
+    """
+
+    def __init__(self, url: str):
+        parsed_url = urlparse(url)
+        if parsed_url.scheme != "redis":
+            raise ValueError(f"Unsupported Redis URL: {url}")
+        self.sock = socket.create_connection(
+            (parsed_url.hostname or "localhost", parsed_url.port or 6379),
+            timeout=REDIS_TIMEOUT_SECONDS,
+        )
+        self.reader = self.sock.makefile("rb")
+        try:
+            if parsed_url.password is not None:
+                auth = [unquote(parsed_url.password)]
+                if parsed_url.username:
+                    auth.insert(0, unquote(parsed_url.username))
+                self.execute("AUTH", *auth)
+            db = parsed_url.path.strip("/")
+            if db:
+                self.execute("SELECT", db)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+    def execute(self, *args) -> Any:
+        return self.pipeline([args])[0]
+
+    def pipeline(self, commands: List[Iterable[Any]]) -> List[Any]:
+        self.sock.sendall(b"".join(_encode_command(_) for _ in commands))
+        replies = [self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def _read_reply(self) -> Any:
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the Redis server.")
+        kind, data = line[:1], line[1:-2]
+        if kind == b"+":
+            return data.decode()
+        if kind == b"-":
+            return RedisError(data.decode())
+        if kind == b":":
+            return int(data)
+        if kind == b"$":
+            length = int(data)
+            if length < 0:
+                return None
+            value = self.reader.read(length + 2)
+            return value[:-2]
+        if kind == b"*":
+            length = int(data)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisError(f"Unexpected reply from the Redis server: {line!r}")
+
+
+def _encode_command(args: Iterable[Any]) -> bytes:
+    parts = []
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"*%d\r\n" % len(parts) + b"".join(parts)
+
+
+class RedisCache(CacheBackend):
+    """
+    A cache on a Redis server (or anything speaking its protocol), which
+    several Doudarr instances can share. Keys are prefixed with `prefix`,
+    values are pickled like diskcache does, so only connect to a trusted
+    server. TTLs are Redis key expirations.
+
+    Each thread gets its own connection; a connection that failed is dropped
+    and the next call reconnects.
+    """
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str):
+        super().__init__()
+        self.url = url
+        self.prefix = prefix
+        self.local = threading.local()
+
+    def get_many(
+        self, keys: Iterable[str], expire_time: bool = False
+    ) -> Dict[str, Any]:
+        keys = list(keys)
+        result = {}
+        for i in range(0, len(keys), REDIS_BATCH_SIZE):
+            chunk = keys[i : i + REDIS_BATCH_SIZE]
+            commands = [["MGET", *[self.prefix + _ for _ in chunk]]]
+            if expire_time:
+                commands += [["PTTL", self.prefix + _] for _ in chunk]
+            now = time.time()
+            replies = self._pipeline(commands)
+            for j, (key, value) in enumerate(zip(chunk, replies[0])):
+                if value is None:
+                    continue
+                value = pickle.loads(value)
+                if expire_time:
+                    ttl = replies[j + 1]
+                    value = (value, now + ttl / 1000 if ttl >= 0 else None)
+                result[key] = value
+        return result
+
+    def set_many(self, entries: Iterable[Tuple[str, Any, Optional[float]]]) -> int:
+        commands = []
+        now = time.time()
+        for key, value, expire_time in entries:
+            command = ["SET", self.prefix + key, pickle.dumps(value)]
+            if expire_time is not None:
+                if expire_time <= now:
+                    commands.append(["DEL", self.prefix + key])
+                    continue
+                command += ["PX", max(1, int((expire_time - now) * 1000))]
+            commands.append(command)
+        for i in range(0, len(commands), REDIS_BATCH_SIZE):
+            self._pipeline(commands[i : i + REDIS_BATCH_SIZE])
+        return len(commands)
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        keys = [self.prefix + _ for _ in keys]
+        deleted = 0
+        for i in range(0, len(keys), REDIS_BATCH_SIZE):
+            deleted += self._execute("DEL", *keys[i : i + REDIS_BATCH_SIZE])
+        return deleted
+
+    def __iter__(self) -> Iterator[str]:
+        cursor = b"0"
+        pattern = _escape_pattern(self.prefix) + "*"
+        while True:
+            cursor, keys = self._execute(
+                "SCAN", cursor, "MATCH", pattern, "COUNT", REDIS_BATCH_SIZE
+            )
+            for key in keys:
+                yield key.decode()[len(self.prefix) :]
+            if cursor == b"0":
+                return
+
+    def clear(self, retry=False) -> int:
+        return self.delete_many(list(self))
+
+    def close(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            self.local.connection = None
+            connection.close()
+
+    def _execute(self, *args) -> Any:
+        return self._pipeline([args])[0]
+
+    def _pipeline(self, commands: List[Iterable[Any]]) -> List[Any]:
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = RedisConnection(self.url)
+            self.local.connection = connection
+        try:
+            return connection.pipeline(commands)
+        except OSError:
+            self.local.connection = None
+            connection.close()
+            raise
+
+
+def _escape_pattern(text: str) -> str:
+    for char in "\\*?[]":
+        text = text.replace(char, "\\" + char)
+    return text
+
+
+def is_shared(cache: Any) -> bool:
+    """Whether other processes write to the cache too."""
+    return isinstance(cache, CacheBackend) and cache.shared
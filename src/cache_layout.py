@@ -0,0 +1,206 @@
+import glob
+import logging
+import os
+import time
+from contextlib import ExitStack, contextmanager
+from itertools import islice
+from typing import Any, Iterable, List, Tuple
+
+import diskcache
+from diskcache import Cache, FanoutCache
+
+# SQLite busy timeout of sharded caches. FanoutCache defaults to 10ms and then
+# silently drops the write, a plain Cache waits up to 60 seconds.
+SHARD_TIMEOUT_SECONDS = 60
+# Keys moved out of a legacy cache per transaction.
+MIGRATION_BATCH_SIZE = 100
+# diskcache versions whose internals `split_by_shard` and `bulk_cache.read_keys`
+# use. With other versions, they fall back to the public API.
+KNOWN_DISKCACHE_VERSIONS = ("5.6.",)
+
+# Caches still moving entries out of a previous layout, see
+# `maintenance.migrate_caches`.
+migrating_caches: List["MigratingCache"] = []
+
+
+def open_cache(directory: str, shards: int, **settings) -> Cache:
+    """
+    Opens the cache in `directory` with the given number of shards. A single
+    shard is a plain `Cache` in `directory` itself, more shards are a
+    `FanoutCache` in `directory/shards-<count>`, so that layouts with different
+    shard counts can coexist.
+
+    If entries are left in another layout, they are migrated while the cache
+    is in use; see `MigratingCache`.
+    """
+    if shards > 1:
+        path = os.path.join(directory, f"shards-{shards}")
+        cache = FanoutCache(
+            path, shards=shards, timeout=SHARD_TIMEOUT_SECONDS, **settings
+        )
+    else:
+        path = directory
+        cache = Cache(directory, **settings)
+
+    legacies = []
+    legacy_paths = glob.glob(os.path.join(directory, "shards-*"))
+    if os.path.exists(os.path.join(directory, "cache.db")):
+        legacy_paths.append(directory)
+    for legacy_path in sorted(legacy_paths):
+        if legacy_path == path:
+            continue
+        if legacy_path == directory:
+            legacy = Cache(legacy_path, **settings)
+        else:
+            legacy_shards = int(legacy_path.rsplit("-", 1)[-1])
+            legacy = FanoutCache(
+                legacy_path,
+                shards=legacy_shards,
+                timeout=SHARD_TIMEOUT_SECONDS,
+                **settings,
+            )
+        if len(legacy) > 0:
+            legacies.append(legacy)
+        else:
+            legacy.close()
+    if not legacies:
+        return cache
+    logging.info(
+        f"Migrating {sum(len(_) for _ in legacies)} cache entries to {path}..."
+    )
+    cache = MigratingCache(cache, legacies)
+    migrating_caches.append(cache)
+    return cache
+
+
+def has_known_internals() -> bool:
+    return diskcache.__version__.startswith(KNOWN_DISKCACHE_VERSIONS)
+
+
+def split_by_shard(cache: Cache, keys: Iterable[str]) -> List[Tuple[Cache, List[str]]]:
+    """
+    Groups keys by the shard of a `FanoutCache` they belong to. With an unknown
+    diskcache version, all keys go to the `FanoutCache` itself, whose
+    transactions lock every shard.
+    """
+    keys = list(keys)
+    if not isinstance(cache, FanoutCache) or not has_known_internals():
+        return [(cache, keys)]
+    shards = {}
+    for key in keys:
+        shard = cache._shards[cache._hash(key) % cache._count]
+        shards.setdefault(shard, []).append(key)
+    return list(shards.items())
+
+
+class MigratingCache:
+    """
+    A cache whose entries are being moved from legacy layouts to the current
+    one, with the interface of a diskcache `Cache`.
+
+    Writes go to the current cache and remove the key from the legacy ones.
+    Reads try the legacy caches first: a key found there has not been written
+    since, and a key moved by `migrate_batch` is in the current cache before it
+    is deleted from the legacy one, so a read never misses it in between.
+    """
+
+    def __init__(self, current: Cache, legacies: List[Cache]):
+        self.current = current
+        self.legacies = legacies
+
+    def get(self, key, default=None, expire_time=False, retry=False):
+        missing = object()
+        for cache in [*self.legacies, self.current]:
+            value = cache.get(key, default=missing, expire_time=expire_time)
+            if (value[0] if expire_time else value) is not missing:
+                return value
+        return (default, None) if expire_time else default
+
+    def set(self, key, value, expire=None, retry=False):
+        result = self.current.set(key, value, expire=expire, retry=retry)
+        for cache in self.legacies:
+            cache.delete(key, retry=retry)
+        return result
+
+    def delete(self, key, retry=False):
+        deleted = False
+        for cache in self._all():
+            deleted = cache.delete(key, retry=retry) or deleted
+        return deleted
+
+    def pop(self, key, default=None, expire_time=False, retry=False):
+        missing = object()
+        result = (default, None) if expire_time else default
+        for cache in [*self.legacies, self.current]:
+            value = cache.pop(key, default=missing, expire_time=expire_time)
+            if (value[0] if expire_time else value) is not missing:
+                result = value
+        return result
+
+    def __contains__(self, key) -> bool:
+        return any(key in cache for cache in self._all())
+
+    def __len__(self) -> int:
+        return sum(len(cache) for cache in self._all())
+
+    def __iter__(self):
+        yield from self.current
+        for cache in self.legacies:
+            for key in cache:
+                if key not in self.current:
+                    yield key
+
+    @contextmanager
+    def transact(self, retry=True):
+        with ExitStack() as stack:
+            for cache in self._all():
+                stack.enter_context(cache.transact(retry=retry))
+            yield
+
+    def expire(self, retry=False) -> int:
+        return sum(cache.expire(retry=retry) for cache in self._all())
+
+    def cull(self, retry=False) -> int:
+        return sum(cache.cull(retry=retry) for cache in self._all())
+
+    def check(self, fix=False, retry=False) -> List[Any]:
+        return [_ for cache in self._all() for _ in cache.check(fix, retry)]
+
+    def volume(self) -> int:
+        return sum(cache.volume() for cache in self._all())
+
+    def clear(self, retry=False) -> int:
+        return sum(cache.clear(retry=retry) for cache in self._all())
+
+    def close(self):
+        for cache in self._all():
+            cache.close()
+
+    def migrate_batch(self, batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+        """
+        Moves up to `batch_size` keys from a legacy cache to the current one,
+        keeping entries written to the current cache meanwhile. Returns the
+        number of keys moved; 0 once the migration is done.
+        """
+        legacies = self.legacies
+        if not legacies:
+            return 0
+        legacy = legacies[0]
+        missing = object()
+        with self.transact():
+            keys = list(islice(legacy, batch_size))
+            now = time.time()
+            for key in keys:
+                value, expire_time = legacy.get(key, default=missing, expire_time=True)
+                if value is not missing and key not in self.current:
+                    expire = expire_time - now if expire_time else None
+                    self.current.set(key, value, expire=expire)
+                legacy.delete(key)
+        if not keys:
+            # Reads of other threads may still be using it, so don't close it.
+            self.legacies = legacies[1:]
+            return self.migrate_batch(batch_size)
+        return len(keys)
+
+    def _all(self) -> List[Cache]:
+        return [self.current, *self.legacies]
@@ -0,0 +1,130 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Set
+
+from diskcache import Cache
+
+from .config import app_config
+from .indexes import ListMembershipIndex
+from .utils import new_cache
+
+
+class ListChangeLog:
+    """
+    Keeps a versioned history of the members of each cached list. Every fetch
+    that adds or removes members bumps the version of the list and records
+    the added and removed Douban IDs, so that clients can ask for what changed
+    since the version they have instead of reading the whole list again.
+
+    Only the last `list_change_history_max` changes are kept. Older versions,
+    version 0 and lists without a history (e.g. one that expired, or a list
+    backfilled into the membership index) get the current members instead,
+    marked as a reset.
+    """
+
+    def __init__(
+        self, membership_index: ListMembershipIndex, cache: Optional[Cache] = None
+    ):
+        self.membership_index = membership_index
+        self.cache = cache if cache is not None else new_cache("list_changes")
+        # One per request waiting for a list to change, set when it does.
+        self.events: Dict[str, Set[asyncio.Event]] = {}
+
+    def close(self):
+        self.cache.close()
+
+    def record(self, list_key: str, added: Set[str], removed: Set[str]):
+        """
+        Records a fetch of a list. A fetch without changes keeps the history
+        from expiring.
+        """
+        with self.cache.transact():
+            entry = self.cache.get(list_key)
+            if entry is None:
+                if not added and not removed:
+                    return
+                entry = {"version": 0, "changes": []}
+            if added or removed:
+                version = entry["version"] + 1
+                change = {
+                    "version": version,
+                    "time": time.time(),
+                    "added": sorted(added),
+                    "removed": sorted(removed),
+                }
+                changes = [*entry["changes"], change]
+                changes = changes[-app_config.list_change_history_max :]
+                entry = {"version": version, "changes": changes}
+            self.cache.set(
+                list_key,
+                entry,
+                # Forget lists that are no longer fetched.
+                expire=app_config.list_stale_ttl_seconds,
+            )
+
+    def get_version(self, list_key: str) -> int:
+        entry = self.cache.get(list_key)
+        return entry["version"] if entry else 0
+
+    def get_changes(self, list_key: str, since: int) -> Dict[str, Any]:
+        """
+        Returns the current version of a list, and the members added and
+        removed after version `since`. For version 0, or if the history doesn't
+        go back that far, all current members are returned as added, with
+        `reset` set.
+        """
+        entry = self.cache.get(list_key, default={"version": 0, "changes": []})
+        version = entry["version"]
+        changes = entry["changes"]
+        oldest = changes[0]["version"] - 1 if changes else version
+        if since == 0 or since > version or since < oldest:
+            return {
+                "version": version,
+                "reset": True,
+                "added": self.membership_index.get_members(list_key),
+                "removed": [],
+            }
+        added = set()
+        removed = set()
+        for change in changes:
+            if change["version"] <= since:
+                continue
+            for douban_id in change["added"]:
+                if douban_id in removed:
+                    removed.remove(douban_id)
+                else:
+                    added.add(douban_id)
+            for douban_id in change["removed"]:
+                if douban_id in added:
+                    added.remove(douban_id)
+                else:
+                    removed.add(douban_id)
+        return {
+            "version": version,
+            "reset": False,
+            "added": sorted(added),
+            "removed": sorted(removed),
+        }
+
+    @contextmanager
+    def watch(self, list_key: str) -> Iterator[asyncio.Event]:
+        """
+        Yields an event set on the next change of the list. It's forgotten when
+        the context is left, whether the list changed or not.
+        """
+        event = asyncio.Event()
+        self.events.setdefault(list_key, set()).add(event)
+        try:
+            yield event
+        finally:
+            events = self.events.get(list_key)
+            if events is not None:
+                events.discard(event)
+                if not events:
+                    del self.events[list_key]
+
+    def on_list_updated(self, list_key: str, added: Set[str], removed: Set[str]):
+        if added or removed:
+            for event in self.events.pop(list_key, ()):
+                event.set()
@@ -0,0 +1,90 @@
+import time
+from typing import Any, Dict, Optional
+
+
+class CircuitBreaker:
+    """
+    A minimal circuit breaker.
+
+    The breaker opens after `failure_threshold` consecutive failures, or right
+    away with `trip`. Once `recovery_seconds` have passed it becomes half-open
+    and lets a single probe through. A successful probe closes the breaker, a
+    failed one opens it again. With `probe_timeout_seconds`, a probe that
+    hasn't reported back in time is given up and another one is let through.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        recovery_seconds: float,
+        probe_timeout_seconds: Optional[float] = None,
+    ):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.probe_timeout_seconds = probe_timeout_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # How long the breaker stays open this time, see `trip`.
+        self.open_seconds = recovery_seconds
+        self.probe_time: Optional[float] = None
+
+    def get_state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at < self.open_seconds:
+            return "open"
+        return "half_open"
+
+    def get_wait_time(self) -> float:
+        """Returns the seconds until the breaker is half-open, 0 unless open."""
+        if self.opened_at is None:
+            return 0
+        return max(0, self.opened_at + self.open_seconds - time.time())
+
+    def is_probing(self) -> bool:
+        if self.probe_time is None:
+            return False
+        if self.probe_timeout_seconds is None:
+            return True
+        return time.time() - self.probe_time < self.probe_timeout_seconds
+
+    def allow(self) -> bool:
+        """Returns whether a call may go through. Reserves the probe if half-open."""
+        state = self.get_state()
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.is_probing():
+            self.probe_time = time.time()
+            return True
+        return False
+
+    def release(self):
+        """Gives back a reserved probe without recording an outcome."""
+        self.probe_time = None
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.open_seconds = self.recovery_seconds
+        self.probe_time = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probe_time is not None or self.failures >= self.failure_threshold:
+            self.trip()
+        self.probe_time = None
+
+    def trip(self, recovery_seconds: Optional[float] = None):
+        """Opens the breaker now, for `recovery_seconds` if given."""
+        self.opened_at = time.time()
+        self.open_seconds = (
+            recovery_seconds if recovery_seconds is not None else self.recovery_seconds
+        )
+        self.probe_time = None
+
+    def get_info(self) -> Dict[str, Any]:
+        return {
+            "state": self.get_state(),
+            "failures": self.failures,
+            "wait_time": self.get_wait_time(),
+        }
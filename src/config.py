@@ -1,11 +1,63 @@
 import json
-from typing import List
+from typing import Dict, List
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
 
 class AppConfig(BaseSettings):
     cache_base_dir: str = Field("cache", description="缓存路径。默认值为相对路径，也可以填写绝对路径。")
+    cache_size_limit_bytes: Dict[str, int] = Field(
+        {},
+        description="每个缓存的大小上限（字节），key为缓存名称（`collection`、`doulist`、`imdb`）。"
+        + "未配置的缓存默认上限为1GB。仅适用于`diskcache`后端，为其他后端配置时启动失败。参数示例：`"
+        + json.dumps({"collection": 256 * 1024**2, "imdb": 2 * 1024**3})
+        + "`。",
+    )
+    cache_eviction_policy: Dict[str, str] = Field(
+        {},
+        description="每个缓存超过大小上限时的淘汰策略，key为缓存名称。"
+        + "可选值：`least-recently-stored`（默认）、`least-recently-used`、"
+        + "`least-frequently-used`、`none`（不淘汰）。仅适用于`diskcache`后端，为其他后端配置时启动失败。"
+        + "参数示例：`"
+        + json.dumps({"imdb": "none"})
+        + "`。",
+    )
+    cache_backend: Dict[str, str] = Field(
+        {},
+        description="每个缓存的存储后端，key为缓存名称。"
+        + "可选值：`diskcache`（默认，本地磁盘）、`redis`（Redis服务器，需配置`DOUDARR_REDIS_URL`）、"
+        + "`memory`（内存，重启后丢失，仅用于测试）。"
+        + "多个Doudarr实例使用同一个Redis时可以实时共享IMDb缓存。参数示例：`"
+        + json.dumps({"imdb": "redis"})
+        + "`。",
+    )
+    redis_url: str | None = Field(
+        None,
+        description="Redis服务器地址，格式为`redis://[[用户名]:密码@]主机[:端口][/数据库编号]`，"
+        + "例如`redis://localhost:6379/0`。",
+    )
+    cache_shards: Dict[str, int] = Field(
+        {},
+        description="每个缓存的分片数，key为缓存名称。未配置的缓存不分片。"
+        + "分片后写入分散到多个SQLite文件，同步、缓存预热和列表请求不必等待同一个写锁。"
+        + "修改分片数后，旧布局中的条目会在后台迁移，迁移期间照常读写。参数示例：`"
+        + json.dumps({"imdb": 8, "collection": 4})
+        + "`。",
+    )
+    cache_maintenance_interval_seconds: float = Field(
+        3600,
+        description="缓存维护的时间间隔（秒）。缓存维护会在后台定期清理过期条目，并在缓存超过大小上限时淘汰条目。",
+    )
+    cache_compaction_hours: List[int] = Field(
+        [4],
+        description="缓存压缩的时间窗口（本地时间的小时数，0-23）。"
+        + "每个时间窗口开始时执行一次缓存维护并压缩缓存数据库文件，回收磁盘空间。压缩期间缓存写入会被阻塞，建议选择访问量低的时间。"
+        + "配置为`[]`时不压缩。",
+    )
+    cache_thread_pool_size: int = Field(
+        4,
+        description="读写缓存的线程数。缓存读写在独立的线程池中进行，不会阻塞其他请求。",
+    )
     douban_api_request_delay_max_seconds: float = Field(
         1,
         description="请求豆瓣API时的最大延迟（秒）。两次请求之间的延迟是随机的，这里配置的是最大值。",
@@ -14,6 +66,70 @@ class AppConfig(BaseSettings):
         3600 * 24,
         description="列表缓存的TTL（秒）。列表缓存会在一段时间后过期，过期后会重新抓取。如果豆瓣列表的条目有更新，重新抓取后会拿到最新的条目。",
     )
+    list_refresh_ahead_seconds: float = Field(
+        600,
+        description="列表缓存过期前多久（秒）在后台重新抓取。只重新抓取上次抓取后被请求过的列表，"
+        + "这样常用的列表不会因为过期而让请求等待抓取。设为0则不提前抓取。",
+    )
+    list_stale_ttl_seconds: float = Field(
+        3600 * 24 * 30,
+        description="列表过期后仍保留旧版本的时间（秒）。豆瓣访问受限时，会用保留的旧版本列表和已缓存的IMDb ID返回结果，"
+        + "并在响应头中标记`X-Doudarr-Degraded: true`。",
+    )
+    list_change_history_max: int = Field(
+        100,
+        description="每个列表保留的变更记录数量（`/collection/{id}/changes`）。"
+        + "客户端的版本早于保留的记录时，会返回列表的全部条目。",
+    )
+    list_changes_wait_max_seconds: float = Field(
+        60,
+        description="变更接口长轮询（URL参数`wait`）的最长等待时间（秒）。",
+    )
+    aggregate_cache_ttl_seconds: float = Field(
+        3600,
+        description="合并列表（`/aggregate`）结果缓存的TTL（秒）。其中任一列表重新抓取或条目的IMDb ID变化时，缓存会提前失效。",
+    )
+    list_deadline_seconds: float | None = Field(
+        None,
+        description="列表接口的默认处理时限（秒），可以用URL参数`deadline`覆盖。"
+        + "超时后直接返回已有结果，未完成的列表抓取和IMDb ID查询转到后台继续，下次请求即可使用。"
+        + "客户端断开连接时也会这样处理。默认不限制。",
+    )
+    background_resolver_concurrency: int = Field(
+        2,
+        description="后台查询IMDb ID的并发数。",
+    )
+    background_resolver_max_pending: int = Field(
+        10000,
+        description="后台等待查询IMDb ID的条目数上限，超出的条目会被丢弃，下次请求时再重新提交。",
+    )
+    retry_max_attempts: Dict[str, int] = Field(
+        {"interactive": 2, "background": 4},
+        description="请求上游超时、连接失败或返回5xx错误时的最多尝试次数（含首次），按优先级配置："
+        + "`interactive`为客户端请求，`background`为缓存预热、提前刷新和后台查询。访问受限不会重试。",
+    )
+    retry_budget_per_minute: Dict[str, float] = Field(
+        {"interactive": 10, "background": 30},
+        description="每个域名每分钟最多重试的次数，按优先级配置，"
+        + '也可以用`"<域名>/<优先级>"`单独配置某个域名，例如`{"movie.douban.com/background": 60}`。'
+        + "超出后不再重试，避免上游故障时重试过多。",
+    )
+    retry_backoff_base_seconds: float = Field(
+        1,
+        description="重试的基础等待时间（秒）。第N次重试前最多等待基础时间的2^(N-1)倍，实际等待时间在0和该值之间随机。",
+    )
+    retry_backoff_max_seconds: float = Field(
+        30,
+        description="重试前最长的等待时间（秒）。",
+    )
+    resolve_max_ids: int = Field(
+        10000,
+        description="批量查询IMDb ID接口（`POST /resolve`）每次最多接受的豆瓣条目ID数量。",
+    )
+    resolve_wait_max_seconds: float = Field(
+        300,
+        description="批量查询IMDb ID接口流式返回时，等待后台查询结果的最长时间（秒）。",
+    )
     imdb_request_delay_max_seconds: float = Field(
         30,
         description="抓取IMDb信息时的最大延迟（秒）。两次请求之间的延迟是随机的，这里配置的是最大值。",
@@ -23,6 +139,11 @@ class AppConfig(BaseSettings):
         description="IMDb ID未找到时的缓存TTL（秒）。"
         + "部分豆瓣条目没有IMDb ID（可能是暂时的），没有找到时会缓存一段时间，避免重复查询。TTL到期后会再次查询。",
     )
+    imdb_cache_ttl_id_unconfirmed_not_found_seconds: float = Field(
+        3600,
+        description="部分IMDb ID查询方式没有找到、其余查询方式失败或被跳过（例如豆瓣限制访问）时的缓存TTL（秒）。"
+        + "此时结果不确定，只短暂缓存，到期后会再次查询。",
+    )
     proxy_address: str | None = Field(None, description="代理地址，所有HTTP请求将通过代理转发。")
     enable_bootstrap: bool = Field(True, description="是否启用缓存预热。")
     bootstrap_interval_seconds: float = Field(
@@ -38,6 +159,11 @@ class AppConfig(BaseSettings):
         100,
         description="缓存预热时抓取的列表最大数量。每次缓存预热只会抓取部分列表，这个值越大，抓取的列表数量越多，IMDb信息的预热越充分。",
     )
+    bootstrap_catalog_ttl_seconds: float = Field(
+        3600 * 24 * 30,
+        description="缓存预热发现的列表保留时间（秒）。发现的列表会保存下来，每次缓存预热只抓取最新的列表；"
+        + "超过该时间没有再出现的列表会被移除。已删除或不含电影的列表会被立即移除。",
+    )
     douban_rate_limit_delay_seconds: float = Field(
         3600,
         description="豆瓣API的速率限制延迟（秒）。当遇到豆瓣API返回访问限制时，在配置的时间范围内不再请求豆瓣API，避免访问受限更严重。",
@@ -68,6 +194,15 @@ class AppConfig(BaseSettings):
         description="豆瓣网站的cookie中key为`dbcl2` cookie的值。"
         + "如果想让Doudarr以登录用户的身份去访问豆瓣的接口，请配置该参数。",
     )
+    egress_routes: List[Dict[str, str]] = Field(
+        [],
+        description="额外的出口线路，每条线路是一个代理和一个豆瓣身份，"
+        + '例如`[{"name": "hk", "proxy": "socks5://hk:1080", "cookie_dbcl2": "..."}]`。'
+        + "`proxy`和`cookie_dbcl2`都可省略。"
+        + "豆瓣（`*.douban.com`）的请求轮流经由`DOUDARR_PROXY_ADDRESS`所在的默认线路和这些线路发出，"
+        + "访问受限按线路分别计算，一条线路受限时其他线路照常使用。"
+        + "其他请求（如豆瓣数据库 API、同步）只走默认线路。详见[多出口线路](#多出口线路)。",
+    )
     douban_idatabase_url: str | None = Field(
         None,
         description="豆瓣数据库 API的基础URL（例如：http://localhost:8000）。"
@@ -81,6 +216,50 @@ class AppConfig(BaseSettings):
         10,
         description="调用豆瓣数据库 API的超时时间（秒）。",
     )
+    imdb_resolvers: List[str] | None = Field(
+        None,
+        description="IMDb ID查询来源及顺序。"
+        + "可选值：`douban_idatabase`（豆瓣数据库 API）、`douban_html`（抓取豆瓣网页）。"
+        + "按顺序依次查询，前一个来源查不到或出错时会尝试下一个，建议把快的来源放在前面。参数示例：`"
+        + json.dumps(["douban_idatabase", "douban_html"])
+        + "`。未配置时，如果配置了`DOUDARR_DOUBAN_IDATABASE_URL`则只使用`douban_idatabase`，"
+        + "否则只使用`douban_html`。",
+    )
+    imdb_resolver_timeout_seconds: Dict[str, float] = Field(
+        {},
+        description="每个IMDb ID查询来源的超时时间（秒），key为来源名称。"
+        + "未配置的来源使用默认值。参数示例：`"
+        + json.dumps({"douban_idatabase": 15, "douban_html": 120})
+        + "`。",
+    )
+    imdb_resolver_hedge_delay_seconds: float | None = Field(
+        None,
+        description="IMDb ID查询的对冲延迟（秒）。如果当前来源在该时间内没有返回结果，会同时向下一个来源发起查询，使用先查到的结果。默认不启用。",
+    )
+    imdb_resolver_failure_threshold: int = Field(
+        5,
+        description="IMDb ID查询来源的熔断阈值。某个来源连续失败达到该次数后会被暂时跳过。",
+    )
+    imdb_resolver_recovery_seconds: float = Field(
+        300,
+        description="IMDb ID查询来源的熔断恢复时间（秒）。来源被熔断后，经过该时间会放行一个请求试探，成功后恢复正常。",
+    )
+    loop_monitor_interval_seconds: float = Field(
+        0.1,
+        description="事件循环延迟的采样间隔（秒）。延迟的分位数显示在`/stats`中。",
+    )
+    loop_block_threshold_seconds: float = Field(
+        0.5,
+        description="事件循环被阻塞超过该时间（秒）时，记录阻塞处的调用栈，可以通过`/debug/loop/blocks`查看。",
+    )
+    trace_buffer_size: int = Field(
+        100,
+        description="在内存中保留最近多少条请求耗时追踪记录，可以通过`/debug/traces`查看。设为0则不在内存中保留。",
+    )
+    trace_file: str | None = Field(
+        None,
+        description="请求耗时追踪记录的输出文件路径（JSON Lines格式，每行一条记录）。默认不输出到文件。",
+    )
 
 
 ENV_PREFIX = "DOUDARR_"
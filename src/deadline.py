@@ -0,0 +1,120 @@
+import asyncio
+import contextvars
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Optional
+
+# How often to check whether the client of a request has disconnected.
+DISCONNECT_POLL_SECONDS = 1
+
+
+class DeadlineExceededError(Exception):
+    pass
+
+
+class Deadline:
+    """
+    The time budget of a request. It runs out when the time is up, or earlier
+    when the client disconnects.
+    """
+
+    def __init__(self, seconds: Optional[float]):
+        self.expire_time = time.monotonic() + seconds if seconds else None
+        self.expired = asyncio.Event()
+
+    def get_remaining(self) -> Optional[float]:
+        """Returns the remaining seconds, or None if there's no time limit."""
+        if self.expired.is_set():
+            return 0
+        if self.expire_time is None:
+            return None
+        return max(0, self.expire_time - time.monotonic())
+
+    def is_expired(self) -> bool:
+        return self.get_remaining() == 0
+
+    def expire(self):
+        self.expired.set()
+
+    async def run(self, aw: Awaitable) -> Any:
+        """
+        Awaits `aw` within the remaining time. Raises `DeadlineExceededError`
+        and cancels `aw` if the deadline runs out first.
+        """
+        if self.is_expired():
+            if asyncio.iscoroutine(aw):
+                aw.close()
+            raise DeadlineExceededError("Deadline exceeded.")
+        task = asyncio.ensure_future(aw)
+        waiter = asyncio.create_task(self.expired.wait())
+        try:
+            done, _ = await asyncio.wait(
+                {task, waiter},
+                timeout=self.get_remaining(),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        finally:
+            waiter.cancel()
+            if not task.done():
+                task.cancel()
+        if task not in done:
+            raise DeadlineExceededError("Deadline exceeded.")
+        return task.result()
+
+
+current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar(
+    "current_deadline", default=None
+)
+
+
+def check_deadline(delay: float = 0):
+    """
+    Fails fast if the current request can't wait `delay` more seconds, e.g.
+    before sleeping between upstream requests.
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        return
+    remaining = deadline.get_remaining()
+    if remaining is not None and remaining <= delay:
+        raise DeadlineExceededError(
+            f"Deadline exceeded. {remaining:.2f} seconds left, need {delay:.2f}."
+        )
+
+
+async def run_with_deadline(aw: Awaitable) -> Any:
+    """Awaits `aw` within the deadline of the current request, if any."""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return await aw
+    return await deadline.run(aw)
+
+
+@asynccontextmanager
+async def deadline_scope(
+    seconds: Optional[float],
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+):
+    """
+    Sets the deadline of the current request. If `is_disconnected` is given,
+    the deadline also runs out as soon as it returns True.
+    """
+    deadline = Deadline(seconds)
+    token = current_deadline.set(deadline)
+    watcher = None
+    if is_disconnected is not None:
+        watcher = asyncio.create_task(_watch_disconnect(deadline, is_disconnected))
+    try:
+        yield deadline
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        current_deadline.reset(token)
+
+
+async def _watch_disconnect(
+    deadline: Deadline, is_disconnected: Callable[[], Awaitable[bool]]
+):
+    while not await is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+    deadline.expire()
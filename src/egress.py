@@ -0,0 +1,85 @@
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from .config import app_config
+
+# The route of `proxy_address` and `cookie_douban_com_dbcl2`, always in the pool.
+DEFAULT_ROUTE = "default"
+# Request extension naming the route a request goes through.
+ROUTE_EXTENSION = "doudarr_egress_route"
+# Requests to this domain and its subdomains are spread over the routes. Others,
+# like the IMDb API or sync peers, always go through the default route.
+ROUTED_DOMAIN = "douban.com"
+
+
+class EgressRoute:
+    """A way out to the internet: a proxy (or none) and a Douban identity."""
+
+    def __init__(self, name: str, proxy: Optional[str], cookie_dbcl2: Optional[str]):
+        self.name = name
+        self.proxy = proxy
+        self.transport = httpx.AsyncHTTPTransport(proxy=proxy)
+        # Cookies set by Douban stick to the identity they were set for.
+        self.cookies = httpx.Cookies()
+        if cookie_dbcl2:
+            self.cookies.set("dbcl2", cookie_dbcl2, domain=".douban.com")
+
+
+def _get_route_configs() -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """Returns `(name, proxy, cookie_dbcl2)` of each route."""
+    return [
+        (
+            DEFAULT_ROUTE,
+            app_config.proxy_address,
+            app_config.cookie_douban_com_dbcl2,
+        )
+    ] + [
+        (
+            route.get("name") or f"route{i + 1}",
+            route.get("proxy"),
+            route.get("cookie_dbcl2"),
+        )
+        for i, route in enumerate(app_config.egress_routes)
+    ]
+
+
+def is_routed_host(host: str) -> bool:
+    return host == ROUTED_DOMAIN or host.endswith(f".{ROUTED_DOMAIN}")
+
+
+def get_egress_routes() -> List[EgressRoute]:
+    return [EgressRoute(*_) for _ in _get_route_configs()]
+
+
+def get_egress_route_names() -> List[str]:
+    return [name for name, _, _ in _get_route_configs()]
+
+
+class EgressTransport(httpx.AsyncBaseTransport):
+    """
+    Sends each request through the route the throttler picked for it (see
+    `Throttler._on_request`), with the proxy and cookies of that route. Hosts
+    outside `ROUTED_DOMAIN` always take the default route.
+    """
+
+    def __init__(self, routes: List[EgressRoute]):
+        self.routes: Dict[str, EgressRoute] = {_.name: _ for _ in routes}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        route_name = DEFAULT_ROUTE
+        if is_routed_host(request.url.host):
+            route_name = request.extensions.get(ROUTE_EXTENSION, DEFAULT_ROUTE)
+        route = self.routes[route_name]
+        route.cookies.set_cookie_header(request)
+        response = await route.transport.handle_async_request(request)
+        response.request = request
+        route.cookies.extract_cookies(response)
+        if "Set-Cookie" in response.headers:
+            # Keep them out of the client's cookies, shared by all routes.
+            del response.headers["Set-Cookie"]
+        return response
+
+    async def aclose(self):
+        for route in self.routes.values():
+            await route.transport.aclose()
@@ -1,48 +1,194 @@
 import asyncio
 import logging
-import os
 import random
 import re
+import time
+from collections import deque
 import httpx
-from .utils import get_response, new_http_client
+from .async_cache import AsyncCache, run_in_cache_executor
+from .circuit_breaker import CircuitBreaker
+from .deadline import DeadlineExceededError, check_deadline
+from .indexes import ImdbReverseIndex
+from .membership import CachedKeyFilter
+from .throttler import throttler
+from . import tracing
+from .utils import (
+    get_percentiles,
+    get_response,
+    new_cache,
+    new_http_client,
+    stream_response,
+)
 from diskcache import Cache
 from .config import app_config
 from abc import ABC, abstractmethod
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Iterable, List, Optional
 
 
 class ImdbApi(ABC):
-    def __init__(self):
-        self.cache = Cache(os.path.join(app_config.cache_base_dir, "imdb"))
+    def __init__(
+        self,
+        cache: Optional[Cache] = None,
+        reverse_index: Optional[ImdbReverseIndex] = None,
+    ):
+        if cache is None:
+            cache = new_cache("imdb")
+        if reverse_index is None:
+            reverse_index = ImdbReverseIndex()
+        self.cache = cache
+        self.async_cache = AsyncCache(cache)
+        self.reverse_index = reverse_index
+        self.key_filter = CachedKeyFilter()
+        self.update_listeners: List[Callable[[str, Optional[str]], None]] = []
+        # Like `update_listeners`, but called in the cache executor right after
+        # the write, for listeners doing cache I/O themselves.
+        self.store_listeners: List[Callable[[str, Optional[str]], None]] = []
 
     def __exit__(self, exc_type, exc_value, traceback):
         self.cache.close()
+        self.reverse_index.close()
 
     def get_cache(self) -> Cache:
         return self.cache
 
+    def get_info(self) -> Dict[str, Any]:
+        return {}
+
+    def get_default_timeout_seconds(self) -> float:
+        return 60
+
     @abstractmethod
     async def fetch_imdb_id(self, douban_id: str, douban_item: Any) -> str:
         pass
 
     async def get_imdb_id(self, douban_id: str, douban_item: Any) -> str:
-        imdb_id = self.cache.get(douban_id, default="not_cached")
+        with tracing.span("ImdbApi.get_imdb_id", douban_id=douban_id):
+            return await self._get_imdb_id(douban_id, douban_item)
+
+    async def _get_imdb_id(self, douban_id: str, douban_item: Any) -> str:
+        with tracing.span("cache.get", cache="imdb"):
+            imdb_id = await self.async_cache.get(douban_id, default="not_cached")
         if imdb_id != "not_cached":
             return imdb_id
-        imdb_id = await self.fetch_imdb_id(douban_id, douban_item)
-        if not imdb_id:
-            expire = app_config.imdb_cache_ttl_id_not_found_seconds
-        else:
-            expire = None
-        self.cache.set(douban_id, imdb_id, expire=expire)
+        with tracing.span(f"{type(self).__name__}.fetch_imdb_id"):
+            try:
+                imdb_id = await self.fetch_imdb_id(douban_id, douban_item)
+            except UnconfirmedNotFoundError as e:
+                logging.info(f"Douban ID {douban_id}: {e}")
+                imdb_id = None
+                expire = app_config.imdb_cache_ttl_id_unconfirmed_not_found_seconds
+            else:
+                if not imdb_id:
+                    expire = app_config.imdb_cache_ttl_id_not_found_seconds
+                else:
+                    expire = None
+        with tracing.span("cache.set", cache="imdb"):
+            await run_in_cache_executor(self._store, douban_id, imdb_id, expire)
+        for listener in self.update_listeners:
+            listener(douban_id, imdb_id)
         return imdb_id
 
+    def _store(self, douban_id: str, imdb_id: Optional[str], expire: Optional[float]):
+        self.cache.set(douban_id, imdb_id, expire=expire)
+        self.key_filter.add(douban_id, time.time() + expire if expire else None)
+        if imdb_id:
+            self.reverse_index.add(douban_id, imdb_id)
+        for listener in self.store_listeners:
+            listener(douban_id, imdb_id)
+
+    async def get_cached_imdb_ids(self, douban_ids: Iterable[str]) -> Dict[str, str]:
+        """
+        Reads the cached IMDb IDs of many Douban IDs in one transaction. IDs that
+        are not cached are left out of the result.
+        """
+        douban_ids = list(douban_ids)
+        if not douban_ids:
+            return {}
+        with tracing.span("cache.get_many", cache="imdb"):
+            return await self.async_cache.get_many(douban_ids)
+
+    async def get_uncached_douban_ids(self, douban_ids: Iterable[str]) -> List[str]:
+        """
+        Returns the Douban IDs without a cached IMDb ID. Once the key filter is
+        built, this is answered from memory without reading the cache. Keys
+        written by other processes since the build are returned too, and read
+        from the cache when `get_imdb_id` is called for them.
+        """
+        douban_ids = list(douban_ids)
+        if self.key_filter.ready:
+            return [_ for _ in douban_ids if not self.key_filter.is_cached(_)]
+        cached = await self.get_cached_imdb_ids(douban_ids)
+        return [_ for _ in douban_ids if _ not in cached]
+
+
+class ImdbIdScanner:
+    """
+    Scans a Douban subject page chunk by chunk for the IMDb ID.
+
+    The IMDb line lives in the info block near the top of the page, so the scan
+    is done once the ID is found or the info block is closed. Text is only
+    searched line by line (the pattern never spans lines), which keeps matches
+    that are split across chunk boundaries intact.
+    """
+
+    info_start_mark = 'id="info"'
+    info_end_mark = "</div>"
+
+    def __init__(self, pattern: re.Pattern):
+        self.pattern = pattern
+        self.pending = ""
+        self.in_info = False
+        self.done = False
+        self.imdb_id: Optional[str] = None
+
+    def feed(self, chunk: str) -> bool:
+        """Feeds a chunk of text. Returns True once scanning is done."""
+        if self.done:
+            return True
+        self.pending += chunk
+        end = self.pending.rfind("\n")
+        if end >= 0:
+            lines = self.pending[: end + 1]
+            self.pending = self.pending[end + 1 :]
+            self._scan(lines)
+        return self.done
+
+    def close(self) -> Optional[str]:
+        """Scans the remaining text and returns the IMDb ID if found."""
+        if not self.done:
+            self._scan(self.pending)
+            self.pending = ""
+            self.done = True
+        return self.imdb_id
+
+    def _scan(self, text: str):
+        match = self.pattern.search(text)
+        if match:
+            self.imdb_id = match.group(1)
+            self.done = True
+            return
+        if not self.in_info:
+            start = text.find(self.info_start_mark)
+            if start < 0:
+                return
+            self.in_info = True
+            text = text[start:]
+        if self.info_end_mark in text:
+            self.done = True
+
 
 class DoubanHtmlImdbApi(ImdbApi):
-    def __init__(self):
-        super().__init__()
+    def __init__(
+        self,
+        cache: Optional[Cache] = None,
+        reverse_index: Optional[ImdbReverseIndex] = None,
+    ):
+        super().__init__(cache, reverse_index)
         self.client = new_http_client()
         self.imdb_id_pattern = re.compile(r"IMDb:.*?(\btt\d+\b)")
+        self.lookups = 0
+        self.bytes_read = 0
+        self.last_bytes_read = 0
 
     def _get_http_client_args(self) -> Dict[str, Any]:
         return {}
@@ -51,36 +197,78 @@ class DoubanHtmlImdbApi(ImdbApi):
         self.client.close()
         super().__exit__(exc_type, exc_value, traceback)
 
+    def get_default_timeout_seconds(self) -> float:
+        # Includes the random delay before each request.
+        return app_config.imdb_request_delay_max_seconds + 60
+
+    def get_info(self) -> Dict[str, Any]:
+        return {
+            "lookups": self.lookups,
+            "bytes_read": self.bytes_read,
+            "bytes_read_per_lookup": (
+                self.bytes_read / self.lookups if self.lookups else 0
+            ),
+            "last_bytes_read": self.last_bytes_read,
+        }
+
     async def fetch_imdb_id(self, douban_id: str, douban_item: Any) -> str:
         title = douban_item["title"]
+        url = f"https://movie.douban.com/subject/{douban_id}/"
 
-        await asyncio.sleep(
-            random.uniform(0.0, app_config.imdb_request_delay_max_seconds)
-        )
+        # Don't wait for the delay if the request would be rejected anyway.
+        host = httpx.URL(url).host
+        throttler.check(host)
+        # Each route keeps the configured pace.
+        delay = random.uniform(
+            0.0, app_config.imdb_request_delay_max_seconds
+        ) / throttler.available_routes(host)
+        check_deadline(delay)
+        with tracing.span("pacing_sleep", seconds=delay):
+            await asyncio.sleep(delay)
 
         logging.info(f"Fetching IMDb ID for {title} (douban ID: {douban_id})...")
-        response = await get_response(
-            self.client, f"https://movie.douban.com/subject/{douban_id}/"
-        )
-        match = self.imdb_id_pattern.search(response.text)
-        if not match:
-            logging.warning(f"IMDb ID not found for {title} (douban ID: {douban_id}).")
+        scanner = ImdbIdScanner(self.imdb_id_pattern)
+        async with stream_response(self.client, url) as response:
+            async for chunk in response.aiter_text():
+                if scanner.feed(chunk):
+                    break
+            bytes_read = response.num_bytes_downloaded
+        imdb_id = scanner.close()
+
+        self.lookups += 1
+        self.bytes_read += bytes_read
+        self.last_bytes_read = bytes_read
+
+        if not imdb_id:
+            logging.warning(
+                f"IMDb ID not found for {title} (douban ID: {douban_id}, "
+                + f"{bytes_read} bytes read)."
+            )
             return None
-        imdb_id = match.group(1)
-        logging.info(f"IMDb ID for {title} (douban ID: {douban_id}) is {imdb_id}.")
+        logging.info(
+            f"IMDb ID for {title} (douban ID: {douban_id}) is {imdb_id} "
+            + f"({bytes_read} bytes read)."
+        )
 
         return imdb_id
 
 
 class DoubanIDatabaseImdbApi(ImdbApi):
-    def __init__(self):
-        super().__init__()
+    def __init__(
+        self,
+        cache: Optional[Cache] = None,
+        reverse_index: Optional[ImdbReverseIndex] = None,
+    ):
+        super().__init__(cache, reverse_index)
         self.client = new_http_client()
         self.client.base_url = app_config.douban_idatabase_url
         self.client.timeout = httpx.Timeout(app_config.douban_idatabase_timeout_seconds)
         if app_config.douban_idatabase_api_key:
             self.client.headers["X-API-Key"] = app_config.douban_idatabase_api_key
 
+    def get_default_timeout_seconds(self) -> float:
+        return app_config.douban_idatabase_timeout_seconds * 2
+
     def __exit__(self, exc_type, exc_value, traceback):
         self.client.close()
         super().__exit__(exc_type, exc_value, traceback)
@@ -131,8 +319,208 @@ class DoubanIDatabaseImdbApi(ImdbApi):
         return imdb_id
 
 
-def get_imdb_api() -> ImdbApi:
+class ImdbResolverUnavailableError(Exception):
+    pass
+
+
+class UnconfirmedNotFoundError(Exception):
+    """
+    Some resolvers found no IMDb ID, but others failed or were skipped, so the
+    miss is only cached for a short while.
+    """
+
+
+class ImdbResolver:
+    """
+    Wraps an `ImdbApi` as one source of an `ImdbResolverChain`, with its own
+    timeout, circuit breaker and stats.
+    """
+
+    def __init__(self, name: str, api: ImdbApi, timeout_seconds: float):
+        self.name = name
+        self.api = api
+        self.timeout_seconds = timeout_seconds
+        self.breaker = CircuitBreaker(
+            app_config.imdb_resolver_failure_threshold,
+            app_config.imdb_resolver_recovery_seconds,
+        )
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=1000)
+
+    async def fetch_imdb_id(self, douban_id: str, douban_item: Any) -> str:
+        start = time.monotonic()
+        try:
+            with tracing.span("ImdbResolver.fetch_imdb_id", resolver=self.name):
+                imdb_id = await asyncio.wait_for(
+                    self.api.fetch_imdb_id(douban_id, douban_item),
+                    self.timeout_seconds,
+                )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.breaker.record_failure()
+            logging.warning(
+                f"IMDb resolver {self.name} timed out for douban ID {douban_id}."
+            )
+            raise
+        except (asyncio.CancelledError, DeadlineExceededError):
+            # Not the resolver's fault.
+            self.breaker.release()
+            raise
+        except Exception:
+            self.errors += 1
+            self.breaker.record_failure()
+            raise
+        self.latencies.append(time.monotonic() - start)
+        self.breaker.record_success()
+        if imdb_id:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return imdb_id
+
+    def get_info(self) -> Dict[str, Any]:
+        calls = self.hits + self.misses + self.errors + self.timeouts
+        latencies = list(self.latencies)
+        return {
+            "calls": calls,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "hit_rate": self.hits / calls if calls else 0,
+            "latency_seconds": {
+                "avg": sum(latencies) / len(latencies) if latencies else 0,
+                **get_percentiles(latencies),
+            },
+            "circuit_breaker": self.breaker.get_info(),
+            **self.api.get_info(),
+        }
+
+
+class ImdbResolverChain(ImdbApi):
+    """
+    Tries the configured resolvers in order until one of them finds the IMDb
+    ID. A resolver that misses, fails or is short-circuited falls through to
+    the next one. With a hedge delay, the next resolver is also started when
+    the current one is slower than the delay.
+    """
+
+    resolver_types = {
+        "douban_idatabase": DoubanIDatabaseImdbApi,
+        "douban_html": DoubanHtmlImdbApi,
+    }
+
+    def __init__(self, resolver_names: List[str]):
+        super().__init__()
+        self.resolvers: List[ImdbResolver] = []
+        for name in resolver_names:
+            if name not in self.resolver_types:
+                raise ValueError(f"Unknown IMDb resolver: {name}")
+            api = self.resolver_types[name](
+                cache=self.cache, reverse_index=self.reverse_index
+            )
+            timeout_seconds = app_config.imdb_resolver_timeout_seconds.get(
+                name, api.get_default_timeout_seconds()
+            )
+            self.resolvers.append(ImdbResolver(name, api, timeout_seconds))
+        self.hedge_delay_seconds = app_config.imdb_resolver_hedge_delay_seconds
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for resolver in self.resolvers:
+            resolver.api.__exit__(exc_type, exc_value, traceback)
+        super().__exit__(exc_type, exc_value, traceback)
+
+    def get_info(self) -> Dict[str, Any]:
+        return {
+            "resolvers": {
+                resolver.name: resolver.get_info() for resolver in self.resolvers
+            }
+        }
+
+    async def fetch_imdb_id(self, douban_id: str, douban_item: Any) -> str:
+        remaining = iter(self.resolvers)
+        pending = set()
+        errors = []
+        missed = False
+        # Whether a resolver was skipped by its circuit breaker.
+        skipped = False
+        started = 0
+
+        def start_next() -> bool:
+            nonlocal skipped, started
+            for resolver in remaining:
+                if resolver.breaker.allow():
+                    started += 1
+                    pending.add(
+                        asyncio.create_task(
+                            resolver.fetch_imdb_id(douban_id, douban_item)
+                        )
+                    )
+                    return True
+                resolver.rejected += 1
+                skipped = True
+            return False
+
+        try:
+            start_next()
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_delay_seconds,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    # Hedge: the current resolvers are slow, try the next one too.
+                    start_next()
+                    continue
+                for task in done:
+                    pending.discard(task)
+                    try:
+                        imdb_id = task.result()
+                    except Exception as e:
+                        errors.append(e)
+                        imdb_id = None
+                    else:
+                        missed = missed or not imdb_id
+                    if imdb_id:
+                        return imdb_id
+                    start_next()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        # Only a miss of every resolver is cached as "not found" for long. A
+        # later resolver may know the ID when an earlier one failed or was
+        # skipped, e.g. the HTML resolver while Douban is rate limiting.
+        if missed and not errors and not skipped:
+            return None
+        if missed:
+            raise UnconfirmedNotFoundError(
+                "Not found by some IMDb resolvers, the others failed or were "
+                + f"skipped. Last error: {errors[-1] if errors else None}"
+            )
+        if errors:
+            raise errors[-1]
+        if not started:
+            raise ImdbResolverUnavailableError(
+                f"No IMDb resolver is available for douban ID {douban_id}."
+            )
+        return None
+
+
+def get_imdb_resolver_names() -> List[str]:
+    if app_config.imdb_resolvers:
+        return app_config.imdb_resolvers
     if app_config.douban_idatabase_url:
-        return DoubanIDatabaseImdbApi()
+        return ["douban_idatabase"]
     else:
-        return DoubanHtmlImdbApi()
+        return ["douban_html"]
+
+
+def get_imdb_api() -> ImdbApi:
+    return ImdbResolverChain(get_imdb_resolver_names())
@@ -0,0 +1,163 @@
+import logging
+from typing import Iterable, List, Optional, Set, Tuple
+
+from diskcache import Cache
+
+from .bulk_cache import delete_many, read_many, write_many
+from .utils import get_douban_id, new_cache
+
+
+class ImdbReverseIndex:
+    """Maps IMDb IDs back to the Douban IDs resolved to them."""
+
+    def __init__(self, cache: Optional[Cache] = None):
+        self.cache = cache if cache is not None else new_cache("imdb_reverse")
+
+    def close(self):
+        self.cache.close()
+
+    def add(self, douban_id: str, imdb_id: str, old_imdb_id: Optional[str] = None):
+        with self.cache.transact():
+            if old_imdb_id and old_imdb_id != imdb_id:
+                self._discard(old_imdb_id, douban_id)
+            if imdb_id:
+                douban_ids = self.cache.get(imdb_id, default=[])
+                if douban_id not in douban_ids:
+                    self.cache.set(imdb_id, sorted([*douban_ids, douban_id]))
+
+    def add_many(self, entries: Iterable[Tuple[str, Optional[str], Optional[str]]]):
+        """
+        Like `add` for many `(douban_id, imdb_id, old_imdb_id)` entries, with one
+        read and one write for all affected IMDb IDs.
+        """
+        entries = list(entries)
+        with self.cache.transact():
+            imdb_ids = {_ for entry in entries for _ in entry[1:] if _}
+            douban_ids = {
+                imdb_id: value
+                for imdb_id, (value, _) in read_many(self.cache, imdb_ids).items()
+            }
+            changed = set()
+            for douban_id, imdb_id, old_imdb_id in entries:
+                if old_imdb_id and old_imdb_id != imdb_id:
+                    old_douban_ids = douban_ids.get(old_imdb_id, [])
+                    if douban_id in old_douban_ids:
+                        douban_ids[old_imdb_id] = [
+                            _ for _ in old_douban_ids if _ != douban_id
+                        ]
+                        changed.add(old_imdb_id)
+                if imdb_id:
+                    new_douban_ids = douban_ids.get(imdb_id, [])
+                    if douban_id not in new_douban_ids:
+                        douban_ids[imdb_id] = sorted([*new_douban_ids, douban_id])
+                        changed.add(imdb_id)
+            write_many(
+                self.cache,
+                [(_, douban_ids[_], None) for _ in changed if douban_ids[_]],
+            )
+            delete_many(self.cache, [_ for _ in changed if not douban_ids[_]])
+
+    def get_douban_ids(self, imdb_id: str) -> List[str]:
+        return self.cache.get(imdb_id, default=[])
+
+    def is_empty(self) -> bool:
+        return len(self.cache) == 0
+
+    def rebuild(self, imdb_cache: Cache):
+        """Fills the index from an existing IMDb cache."""
+        logging.info("Rebuilding IMDb reverse index...")
+        self.cache.clear()
+        count = 0
+        with self.cache.transact():
+            for douban_id in imdb_cache:
+                imdb_id = imdb_cache.get(douban_id)
+                if imdb_id:
+                    self.add(douban_id, imdb_id)
+                    count += 1
+        logging.info(f"Rebuilt IMDb reverse index with {count} items.")
+
+    def prune(self, imdb_cache: Cache) -> int:
+        """
+        Drops the Douban IDs whose IMDb ID is no longer cached, e.g. after the
+        IMDb cache was culled. Returns the number of Douban IDs dropped.
+        """
+        count = 0
+        for imdb_id in list(self.cache):
+            with self.cache.transact():
+                douban_ids = self.cache.get(imdb_id, default=[])
+                kept = [_ for _ in douban_ids if imdb_cache.get(_) == imdb_id]
+                if len(kept) == len(douban_ids):
+                    continue
+                count += len(douban_ids) - len(kept)
+                if kept:
+                    self.cache.set(imdb_id, kept)
+                else:
+                    self.cache.delete(imdb_id)
+        return count
+
+    def _discard(self, imdb_id: str, douban_id: str):
+        douban_ids = [_ for _ in self.cache.get(imdb_id, default=[]) if _ != douban_id]
+        if douban_ids:
+            self.cache.set(imdb_id, douban_ids)
+        else:
+            self.cache.delete(imdb_id)
+
+
+class ListMembershipIndex:
+    """
+    Maps Douban subject IDs to the cached lists that contain them. List keys
+    look like `collection:<id>` or `doulist:<id>`.
+
+    The index also keeps each list's last known members, so that updating a
+    list only touches the subjects that were added or removed.
+    """
+
+    def __init__(self, cache: Optional[Cache] = None):
+        self.cache = cache if cache is not None else new_cache("list_membership")
+
+    def close(self):
+        self.cache.close()
+
+    def update(self, list_key: str, items: Iterable) -> Tuple[Set[str], Set[str]]:
+        """Records the items of a list. Returns the added and removed IDs."""
+        douban_ids = {get_douban_id(item) for item in items}
+        with self.cache.transact():
+            old_douban_ids = set(self.cache.get(f"list:{list_key}", default=[]))
+            added = douban_ids - old_douban_ids
+            removed = old_douban_ids - douban_ids
+            for douban_id in added:
+                list_keys = self.cache.get(f"subject:{douban_id}", default=[])
+                if list_key not in list_keys:
+                    self.cache.set(
+                        f"subject:{douban_id}", sorted([*list_keys, list_key])
+                    )
+            for douban_id in removed:
+                list_keys = [
+                    _
+                    for _ in self.cache.get(f"subject:{douban_id}", default=[])
+                    if _ != list_key
+                ]
+                if list_keys:
+                    self.cache.set(f"subject:{douban_id}", list_keys)
+                else:
+                    self.cache.delete(f"subject:{douban_id}")
+            self.cache.set(f"list:{list_key}", sorted(douban_ids))
+        return added, removed
+
+    def get_lists(self, douban_id: str) -> List[str]:
+        return self.cache.get(f"subject:{douban_id}", default=[])
+
+    def get_members(self, list_key: str) -> List[str]:
+        return self.cache.get(f"list:{list_key}", default=[])
+
+    def get_list_keys(self) -> List[str]:
+        return [_[len("list:") :] for _ in self.cache if _.startswith("list:")]
+
+    def remove(self, list_key: str):
+        """Forgets a list and its members."""
+        with self.cache.transact():
+            self.update(list_key, [])
+            self.cache.delete(f"list:{list_key}")
+
+    def is_empty(self) -> bool:
+        return len(self.cache) == 0
@@ -0,0 +1,136 @@
+import bisect
+import re
+from typing import Any, Dict, Iterator, List, Optional
+
+YEAR_PATTERN = re.compile(r"\b(?:18|19|20)\d{2}\b")
+
+
+def get_year(item: Any) -> Optional[int]:
+    year = str(item.get("year") or "")
+    if year.isdigit():
+        return int(year)
+    for key in ("card_subtitle", "subtitle", "abstract"):
+        match = YEAR_PATTERN.search(str(item.get(key) or ""))
+        if match:
+            return int(match.group(0))
+    return None
+
+
+def get_genres(item: Any) -> List[str]:
+    if item.get("genres"):
+        return list(item["genres"])
+    # e.g. "1994 / 美国 / 剧情 犯罪 / 弗兰克·德拉邦特 / 蒂姆·罗宾斯"
+    parts = [_.strip() for _ in str(item.get("card_subtitle") or "").split("/")]
+    if len(parts) >= 3:
+        return parts[2].split()
+    return []
+
+
+def get_rating(item: Any) -> Optional[float]:
+    rating = item.get("rating")
+    if rating and rating.get("value") is not None:
+        return rating["value"]
+    return None
+
+
+class ListIndex:
+    """
+    A compact, precomputed view of the movies in a list, built when the list is
+    cached. Queries answer from sorted positions and never load the full list.
+
+    Each entry is a minimal item (title, URL, rating) in list order. Positions
+    are also sorted by rating (descending) and by year, and grouped by genre, so
+    a filter only walks the entries it can match.
+    """
+
+    def __init__(self, items: List[Any]):
+        movies = [item for item in items if item["type"] == "movie"]
+        self.entries = [
+            {
+                "title": item["title"],
+                "url": item["url"],
+                "type": item["type"],
+                "rating": item.get("rating"),
+            }
+            for item in movies
+        ]
+        self.ratings = [get_rating(item) for item in movies]
+        self.years = [get_year(item) for item in movies]
+        self.genres = [set(get_genres(item)) for item in movies]
+
+        rated = [i for i, rating in enumerate(self.ratings) if rating is not None]
+        self.by_rating = sorted(rated, key=lambda i: (-self.ratings[i], i))
+        self.negated_ratings = [-self.ratings[i] for i in self.by_rating]
+        dated = [i for i, year in enumerate(self.years) if year is not None]
+        self.by_year = sorted(dated, key=lambda i: (self.years[i], i))
+        self.sorted_years = [self.years[i] for i in self.by_year]
+        self.by_genre: Dict[str, List[int]] = {}
+        for i, genres in enumerate(self.genres):
+            for genre in genres:
+                self.by_genre.setdefault(genre, []).append(i)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def query(
+        self,
+        min_rating: Optional[float] = None,
+        year_from: Optional[int] = None,
+        year_to: Optional[int] = None,
+        genre: Optional[str] = None,
+        top: Optional[int] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Any]:
+        """
+        Returns the matching entries. With `top`, the best rated `top` matches
+        are returned in rating order; otherwise matches keep the list order.
+        `offset` and `limit` page through the matches.
+        """
+        positions = self._iter_matches(min_rating, year_from, year_to, genre, top)
+        if top is not None:
+            # Paging happens within the top `top` matches.
+            remaining = max(0, top - offset)
+            limit = remaining if limit is None else min(limit, remaining)
+        result = []
+        for i, position in enumerate(positions):
+            if i < offset:
+                continue
+            if limit is not None and len(result) >= limit:
+                break
+            result.append(self.entries[position])
+        return result
+
+    def _iter_matches(
+        self, min_rating, year_from, year_to, genre, top
+    ) -> Iterator[int]:
+        if top is not None or min_rating:
+            # Walk down from the best rated entry and stop at `min_rating`.
+            end = len(self.by_rating)
+            if min_rating:
+                end = bisect.bisect_right(self.negated_ratings, -min_rating)
+            candidates = self.by_rating[:end]
+            if top is None:
+                candidates = sorted(candidates)
+        elif genre is not None:
+            candidates = self.by_genre.get(genre, [])
+        elif year_from is not None or year_to is not None:
+            start = 0
+            end = len(self.by_year)
+            if year_from is not None:
+                start = bisect.bisect_left(self.sorted_years, year_from)
+            if year_to is not None:
+                end = bisect.bisect_right(self.sorted_years, year_to)
+            candidates = sorted(self.by_year[start:end])
+        else:
+            candidates = range(len(self.entries))
+
+        for i in candidates:
+            year = self.years[i]
+            if year_from is not None and (year is None or year < year_from):
+                continue
+            if year_to is not None and (year is None or year > year_to):
+                continue
+            if genre is not None and genre not in self.genres[i]:
+                continue
+            yield i
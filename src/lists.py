@@ -1,71 +1,239 @@
 import asyncio
 import logging
-import os
 import random
-from typing import Any, AsyncIterator, List
-from .utils import get_json, new_http_client, read_pages
+import time
+from typing import Any, AsyncIterator, Callable, List, Optional, Set, Tuple
+from .utils import (
+    get_json,
+    get_movies,
+    iter_pages,
+    new_cache,
+    new_http_client,
+    read_pages,
+)
 from diskcache import Cache
+from .async_cache import AsyncCache, run_in_cache_executor
+from .changes import ListChangeLog
 from .config import app_config
+from .deadline import check_deadline
+from .indexes import ListMembershipIndex
+from .list_index import ListIndex
+from .throttler import throttler
+from . import tracing
 
 
 class BaseApi:
-    def __init__(self, sub_path: str, cache_name: str, items_key: str):
+    def __init__(
+        self,
+        sub_path: str,
+        cache_name: str,
+        items_key: str,
+        membership_index: Optional[ListMembershipIndex] = None,
+        change_log: Optional[ListChangeLog] = None,
+    ):
+        """
+        `membership_index` and `change_log` are shared by all list types, so
+        that lookups by Douban ID find lists of every type.
+        """
         self.client = new_http_client()
         self.client.base_url = f"https://m.douban.com/rexxar/api/v2/{sub_path}"
         self.client.headers["Referer"] = f"https://m.douban.com/{sub_path}"
-        self.cache = Cache(os.path.join(app_config.cache_base_dir, cache_name))
+        self.cache = new_cache(cache_name)
+        self.index_cache = new_cache(f"{cache_name}_index")
+        self.async_cache = AsyncCache(self.cache)
+        self.async_index_cache = AsyncCache(self.index_cache)
+        self.cache_name = cache_name
         self.items_key = items_key
+        if membership_index is None:
+            membership_index = ListMembershipIndex()
+        if change_log is None:
+            change_log = ListChangeLog(membership_index)
+        self.membership_index = membership_index
+        self.change_log = change_log
+        self.update_listeners: List[Callable[[str, Set[str], Set[str]], None]] = [
+            self.change_log.on_list_updated
+        ]
+        # Like `update_listeners`, but called in the cache executor right after
+        # the write, for listeners doing cache I/O themselves.
+        self.store_listeners: List[Callable[[str, Set[str], Set[str]], None]] = []
 
     def __exit__(self, exc_type, exc_value, traceback):
         self.client.close()
         self.cache.close()
+        self.index_cache.close()
+        self.membership_index.close()
+        self.change_log.close()
 
     def get_cache(self) -> Cache:
         return self.cache
 
+    def get_list_key(self, id: str) -> str:
+        return f"{self.cache_name}:{id}"
+
+    def rebuild_membership_index(self):
+        """Records the movies of all cached lists in the membership index."""
+        for id in self.cache:
+            items = self.cache.get(id)
+            if items is not None:
+                self.membership_index.update(self.get_list_key(id), get_movies(items))
+
+    def prune_membership_index(self) -> int:
+        """
+        Forgets the lists whose last fetched version has expired, and can't be
+        served any more. Returns the number of lists forgotten.
+        """
+        prefix = f"{self.cache_name}:"
+        count = 0
+        for list_key in self.membership_index.get_list_keys():
+            if not list_key.startswith(prefix):
+                continue
+            id = list_key[len(prefix) :]
+            if id not in self.index_cache and f"stale:{id}" not in self.index_cache:
+                self.membership_index.remove(list_key)
+                count += 1
+        return count
+
     async def get_info(self, id: str) -> Any:
         return await get_json(self.client, f"/{id}")
 
     async def _read_one_page(self, id: str, start: int, count: int) -> Any:
-        await asyncio.sleep(
-            random.uniform(0, app_config.douban_api_request_delay_max_seconds)
-        )
+        # Don't wait for the delay if the request would be rejected anyway.
+        throttler.check(self.client.base_url.host)
+        # Each route keeps the configured pace.
+        delay = random.uniform(
+            0, app_config.douban_api_request_delay_max_seconds
+        ) / throttler.available_routes(self.client.base_url.host)
+        check_deadline(delay)
+        with tracing.span("pacing_sleep", seconds=delay):
+            await asyncio.sleep(delay)
         return await get_json(
             self.client,
             f"/{id}/items?start={start}&count={count}",
         )
 
     async def get_items(self, id: str) -> List[Any]:
-        items = self.cache.get(id)
+        with tracing.span("BaseApi.get_items", list=self.get_list_key(id)) as span:
+            items = await self._get_items(id)
+            if span is not None:
+                span.set_attribute("items", len(items))
+            return items
+
+    async def _get_items(self, id: str) -> List[Any]:
+        with tracing.span("cache.get", cache=self.cache_name):
+            items = await self.async_cache.get(id)
         if items is not None:
             return items
+        return await self.refresh_items(id)
 
+    async def refresh_items(self, id: str) -> List[Any]:
+        """Fetches the items of a list and caches them, even if already cached."""
+        items = []
+        async for page in self._fetch_pages(id):
+            items += page
+        return items
+
+    async def iter_pages(self, id: str) -> AsyncIterator[List[Any]]:
+        """
+        Yields the items of a list a page at a time as they arrive, so that they
+        can be processed while the next page is fetched. The list is cached once
+        complete. A cached list is yielded as a single page.
+        """
+        with tracing.span("cache.get", cache=self.cache_name):
+            items = await self.async_cache.get(id)
+        if items is not None:
+            yield items
+            return
+        async for page in self._fetch_pages(id):
+            yield page
+
+    async def _fetch_pages(self, id: str) -> AsyncIterator[List[Any]]:
         logging.info(f"Fetching items for {id} ...")
-        items = [
-            _
-            async for _ in read_pages(
-                read_one_page=lambda start, count: self._read_one_page(
-                    id, start, count
-                ),
-                get_total=lambda page_data: page_data["total"],
-                get_items=lambda page_data: page_data[self.items_key],
-                items_per_page=50,
-            )
-        ]
+        items = []
+        async for page in iter_pages(
+            read_one_page=lambda start, count: self._read_one_page(id, start, count),
+            get_total=lambda page_data: page_data["total"],
+            get_items=lambda page_data: page_data[self.items_key],
+            items_per_page=50,
+        ):
+            items += page
+            yield page
         logging.info(f"Fetched {len(items)} items for {id}.")
 
+        list_key = self.get_list_key(id)
+        with tracing.span("cache.set", cache=self.cache_name):
+            added, removed = await run_in_cache_executor(self._store, id, items)
+        for listener in self.update_listeners:
+            listener(list_key, added, removed)
+
+    async def get_index(self, id: str) -> ListIndex:
+        with tracing.span("cache.get", cache=f"{self.cache_name}_index"):
+            index = await self.async_index_cache.get(id)
+        if index is not None:
+            return index
+        # The list was cached without an index, or has expired.
+        items = await self.get_items(id)
+        return await run_in_cache_executor(self._ensure_index, id, items)
+
+    def _store(self, id: str, items: List[Any]) -> Tuple[Set[str], Set[str]]:
         self.cache.set(id, items, expire=app_config.list_cache_ttl_seconds)
-        return items
+        self._set_index(id, ListIndex(items), app_config.list_cache_ttl_seconds)
+        list_key = self.get_list_key(id)
+        # Only movies are served, so only they are tracked and reported changed.
+        added, removed = self.membership_index.update(list_key, get_movies(items))
+        self.change_log.record(list_key, added, removed)
+        for listener in self.store_listeners:
+            listener(list_key, added, removed)
+        return added, removed
+
+    def _ensure_index(self, id: str, items: List[Any]) -> ListIndex:
+        index = self.index_cache.get(id)
+        if index is None:
+            index = ListIndex(items)
+            _, expire_time = self.cache.get(id, expire_time=True)
+            if expire_time is not None:
+                expire = expire_time - time.time()
+            else:
+                # The list expired since it was read. An index without a TTL
+                # would outlive it, and keep the list in the membership index.
+                expire = app_config.list_cache_ttl_seconds
+            self._set_index(id, index, expire)
+        return index
+
+    def _set_index(self, id: str, index: ListIndex, expire: float | None):
+        self.index_cache.set(id, index, expire=expire)
+        # Kept longer than the list itself, to serve while Douban is unavailable.
+        self.index_cache.set(
+            f"stale:{id}", index, expire=app_config.list_stale_ttl_seconds
+        )
+
+    async def get_stale_index(self, id: str) -> ListIndex | None:
+        """Returns the index of the last fetched version of a list, if any."""
+        indexes = await self.async_index_cache.get_many([id, f"stale:{id}"])
+        return indexes[id] if id in indexes else indexes.get(f"stale:{id}")
 
 
 class CollectionApi(BaseApi):
-    def __init__(self):
-        super().__init__("subject_collection", "collection", "subject_collection_items")
+    def __init__(
+        self,
+        membership_index: Optional[ListMembershipIndex] = None,
+        change_log: Optional[ListChangeLog] = None,
+    ):
+        super().__init__(
+            "subject_collection",
+            "collection",
+            "subject_collection_items",
+            membership_index,
+            change_log,
+        )
 
 
 class DoulistApi(BaseApi):
-    def __init__(self):
-        super().__init__("doulist", "doulist", "items")
+    def __init__(
+        self,
+        membership_index: Optional[ListMembershipIndex] = None,
+        change_log: Optional[ListChangeLog] = None,
+    ):
+        super().__init__("doulist", "doulist", "items", membership_index, change_log)
 
 
 # Reference:
@@ -84,9 +252,14 @@ class ListsApi:
         self.client.close()
 
     async def _read_one_page(self, start: int, count: int) -> Any:
-        await asyncio.sleep(
-            random.uniform(0, app_config.douban_api_request_delay_max_seconds)
-        )
+        throttler.check(self.client.base_url.host)
+        # Each route keeps the configured pace.
+        delay = random.uniform(
+            0, app_config.douban_api_request_delay_max_seconds
+        ) / throttler.available_routes(self.client.base_url.host)
+        check_deadline(delay)
+        with tracing.span("pacing_sleep", seconds=delay):
+            await asyncio.sleep(delay)
         return await get_json(
             self.client,
             f"/skynet/new_playlists?apikey={self.api_key}&subject_type=movie&start={start}&count={count}",
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from .utils import get_percentiles
+
+
+class LoopMonitor:
+    """
+    Measures how late the event loop runs a callback scheduled every
+    `interval_seconds` (the lag), which is how long other requests had to wait.
+
+    A watchdog thread notices when the loop hasn't come back for longer than
+    `block_threshold_seconds` and captures the stack of whatever is blocking
+    it, e.g. a synchronous cache read or a regex over a large page.
+    """
+
+    def __init__(
+        self,
+        interval_seconds: float,
+        block_threshold_seconds: float,
+        max_blocks: int = 20,
+    ):
+        self.interval_seconds = interval_seconds
+        self.block_threshold_seconds = block_threshold_seconds
+        self.lags = deque(maxlen=1000)
+        self.max_lag = 0
+        self.blocks = deque(maxlen=max_blocks)
+        self.block_count = 0
+        self.last_beat = time.monotonic()
+        self.loop_thread_id: Optional[int] = None
+        self.stopped = threading.Event()
+
+    async def run(self):
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        watchdog = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        watchdog.start()
+        try:
+            while True:
+                beat = time.monotonic()
+                self.last_beat = beat
+                await asyncio.sleep(self.interval_seconds)
+                lag = max(0, time.monotonic() - beat - self.interval_seconds)
+                self.lags.append(lag)
+                self.max_lag = max(self.max_lag, lag)
+                if self.blocks and self.blocks[-1]["beat"] == beat:
+                    # Now we know how long the loop was blocked.
+                    self.blocks[-1]["lag_seconds"] = lag
+        finally:
+            self.stopped.set()
+
+    def stop(self):
+        self.stopped.set()
+
+    def get_info(self) -> Dict[str, Any]:
+        lags = list(self.lags)
+        last_block = None
+        if self.blocks:
+            block = self.blocks[-1]
+            last_block = {
+                "time": block["time"],
+                "lag_seconds": block["lag_seconds"],
+                "location": block["stack"][-1] if block["stack"] else None,
+            }
+        return {
+            "lag_seconds": {
+                "avg": sum(lags) / len(lags) if lags else 0,
+                "max": self.max_lag,
+                **get_percentiles(lags),
+            },
+            "blocks": self.block_count,
+            "last_block": last_block,
+        }
+
+    def get_blocks(self) -> List[Dict[str, Any]]:
+        """Returns the last blocks with their stacks, newest first."""
+        return [
+            {key: value for key, value in block.items() if key != "beat"}
+            for block in reversed(self.blocks)
+        ]
+
+    def _watch(self):
+        reported_beat = None
+        check_interval = min(self.interval_seconds, self.block_threshold_seconds) / 2
+        while not self.stopped.wait(check_interval):
+            beat = self.last_beat
+            late = time.monotonic() - beat - self.interval_seconds
+            if late < self.block_threshold_seconds or beat == reported_beat:
+                continue
+            reported_beat = beat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            stack = [
+                f"{_.filename}:{_.lineno} in {_.name}"
+                for _ in traceback.extract_stack(frame)
+            ]
+            self.block_count += 1
+            self.blocks.append(
+                {
+                    "beat": beat,
+                    "time": time.time(),
+                    # Updated once the loop is back.
+                    "lag_seconds": late,
+                    "stack": stack,
+                }
+            )
+            logging.warning(
+                f"Event loop blocked for more than {late:.2f} seconds at:\n"
+                + "\n".join(stack[-5:])
+            )
@@ -1,16 +1,42 @@
 import asyncio
+import io
+import json
 import logging
 import time
 import traceback
-from typing import Any, List
-from fastapi import FastAPI, HTTPException
+from contextlib import ExitStack
+from typing import Annotated, Any, AsyncIterator, Dict, List, Set, Tuple
+from fastapi import FastAPI, HTTPException, Query
 import fastapi
-from .bootstrap import bootstrap
-from .sync import sync
+from .aggregate import AGGREGATE_OPS, AggregateCache, combine_lists, get_etag
+from .async_cache import run_in_cache_executor
+from .background import BackgroundResolver
+from .bootstrap import ListCatalog, bootstrap
+from .cache_backends import is_shared
+from .deadline import DeadlineExceededError, deadline_scope, run_with_deadline
+from .sync import check_imdb_items, merge_imdb_items
+from .sync import sync as sync_imdb_cache
 
+from .changes import ListChangeLog
+from .indexes import ListMembershipIndex
 from .lists import BaseApi, CollectionApi, DoulistApi
-from .imdb import get_imdb_api
-from .throttler import throttler
+from .imdb import ImdbResolverUnavailableError, get_imdb_api
+from .list_index import ListIndex
+from .loop_monitor import LoopMonitor
+from .maintenance import CacheMaintenance, migrate_caches
+from .profiling import (
+    ProfilerBusyError,
+    profile_cpu_collapsed,
+    profile_cpu_pstats,
+    profile_memory,
+)
+from .refresh import ListRefresher
+from .resolve import parse_list_spec
+from .retry import retrier
+from .scheduler import Scheduler
+from .snapshot import SnapshotError, export_snapshot, import_snapshot
+from .throttler import RateLimitedError, throttler
+from .tracing import trace, tracer
 from .utils import get_douban_id
 from .config import app_config
 
@@ -20,13 +46,134 @@ logging.basicConfig(
 )
 
 app = FastAPI()
-collection_api = CollectionApi()
-doulist_api = DoulistApi()
+# Upstream failures that are answered from cached data instead.
+DEGRADED_ERRORS = (RateLimitedError, ImdbResolverUnavailableError)
+# Shared by the list APIs, so that lists of every type are found by Douban ID.
+membership_index = ListMembershipIndex()
+change_log = ListChangeLog(membership_index)
+collection_api = CollectionApi(membership_index, change_log)
+doulist_api = DoulistApi(membership_index, change_log)
 imdb_api = get_imdb_api()
+list_apis = {"collection": collection_api, "doulist": doulist_api}
+aggregate_cache = AggregateCache()
+list_catalog = ListCatalog()
+loop_monitor = LoopMonitor(
+    app_config.loop_monitor_interval_seconds,
+    app_config.loop_block_threshold_seconds,
+)
+background_resolver = BackgroundResolver(
+    imdb_api,
+    app_config.background_resolver_concurrency,
+    app_config.background_resolver_max_pending,
+)
+scheduler = Scheduler()
+list_refresher = ListRefresher(scheduler, list_apis)
+cache_maintenance = CacheMaintenance(
+    {
+        "collection": collection_api.get_cache(),
+        "collection_index": collection_api.index_cache,
+        "doulist": doulist_api.get_cache(),
+        "doulist_index": doulist_api.index_cache,
+        "imdb": imdb_api.get_cache(),
+        "imdb_reverse": imdb_api.reverse_index.cache,
+        "list_membership": membership_index.cache,
+        "list_changes": change_log.cache,
+        "aggregate": aggregate_cache.cache,
+        "list_catalog": list_catalog.cache,
+    }
+)
+
+
+# Store listeners, called in the cache executor.
+def on_list_updated(list_key: str, added, removed):
+    aggregate_cache.invalidate_list(list_key)
+
+
+def on_imdb_id_updated(douban_id: str, imdb_id: str):
+    for list_key in membership_index.get_lists(douban_id):
+        aggregate_cache.invalidate_list(list_key)
+
+
+def on_caches_maintained(result):
+    # Evicted keys stay in the key filter, and it may have outgrown its size.
+    key_filter = imdb_api.key_filter
+    if key_filter.ready and (
+        result["imdb"]["culled"]
+        or key_filter.permanent_keys.count > key_filter.permanent_keys.capacity
+    ):
+        key_filter.build(imdb_api.get_cache())
+    # Only found IMDb IDs are in the reverse index, and those don't expire.
+    if result["imdb"]["culled"]:
+        imdb_api.reverse_index.prune(imdb_api.get_cache())
+    for list_api in list_apis.values():
+        list_api.prune_membership_index()
+
+
+for list_api in list_apis.values():
+    list_api.store_listeners.append(on_list_updated)
+    list_api.update_listeners.append(list_refresher.on_fetched)
+imdb_api.store_listeners.append(on_imdb_id_updated)
+cache_maintenance.run_listeners.append(on_caches_maintained)
 
+
+def rebuild_indexes():
+    """Backfills the indexes from caches written before they existed."""
+    if not is_shared(imdb_api.get_cache()):
+        # Keys written by other instances would be missing from the filter.
+        imdb_api.key_filter.build(imdb_api.get_cache())
+    # Stop at the first key rather than `len`, which scans a Redis cache.
+    if (
+        imdb_api.reverse_index.is_empty()
+        and next(iter(imdb_api.get_cache()), None) is not None
+    ):
+        imdb_api.reverse_index.rebuild(imdb_api.get_cache())
+    if membership_index.is_empty():
+        collection_api.rebuild_membership_index()
+        doulist_api.rebuild_membership_index()
+
+
+scheduler.add_once("rebuild_indexes", lambda: asyncio.to_thread(rebuild_indexes))
+scheduler.add_once("migrate_caches", migrate_caches)
 if app_config.enable_bootstrap:
-    asyncio.create_task(bootstrap(collection_api, doulist_api, imdb_api))
-asyncio.create_task(sync(imdb_api))
+    scheduler.add_recurring(
+        "bootstrap",
+        lambda: bootstrap(collection_api, doulist_api, imdb_api, list_catalog),
+        app_config.bootstrap_interval_seconds,
+    )
+if app_config.sync_imdb_cache_to:
+    scheduler.add_recurring(
+        "sync_imdb_cache",
+        lambda: sync_imdb_cache(imdb_api),
+        app_config.sync_imdb_cache_interval_seconds,
+    )
+else:
+    logging.info(
+        "Syncing IMDb cache is disabled because remote URLs are not configured."
+    )
+scheduler.add_recurring(
+    "cache_maintenance",
+    cache_maintenance.run,
+    app_config.cache_maintenance_interval_seconds,
+)
+
+
+def schedule_cache_compaction():
+    delay = cache_maintenance.get_next_compaction_delay()
+    if delay is not None:
+        scheduler.add_once("cache_compaction", compact_caches, delay)
+
+
+async def compact_caches():
+    try:
+        await cache_maintenance.compact()
+    finally:
+        schedule_cache_compaction()
+
+
+schedule_cache_compaction()
+asyncio.create_task(scheduler.run())
+asyncio.create_task(background_resolver.run())
+asyncio.create_task(loop_monitor.run())
 
 
 @app.exception_handler(500)
@@ -35,83 +182,574 @@ async def internal_exception_handler(request: fastapi.Request, exc: Exception):
     return fastapi.responses.PlainTextResponse(status_code=500, content=content)
 
 
+@app.exception_handler(RateLimitedError)
+async def rate_limited_exception_handler(
+    request: fastapi.Request, exc: RateLimitedError
+):
+    return fastapi.responses.PlainTextResponse(
+        status_code=503,
+        content=str(exc),
+        headers={"Retry-After": str(int(exc.wait_time) + 1)},
+    )
+
+
+def get_cache_sizes() -> Dict[str, int]:
+    # Counting a Redis cache scans all its keys.
+    return {
+        "collection": len(collection_api.get_cache()),
+        "doulist": len(doulist_api.get_cache()),
+        "imdb": len(imdb_api.get_cache()),
+    }
+
+
 @app.get("/")
 @app.get("/stats")
 async def stats() -> Any:
     return {
-        "cache_size": {
-            "collection": len(collection_api.get_cache()),
-            "doulist": len(doulist_api.get_cache()),
-            "imdb": len(imdb_api.get_cache()),
-        },
+        "cache_size": await run_in_cache_executor(get_cache_sizes),
         "throttler_info": throttler.get_info(),
+        "retries": retrier.get_info(),
+        "imdb_api": imdb_api.get_info(),
+        "imdb_key_filter": imdb_api.key_filter.get_info(),
+        "bootstrap_catalog": await run_in_cache_executor(list_catalog.get_info),
+        "cache_maintenance": cache_maintenance.get_info(),
+        "scheduler": scheduler.get_info(),
+        "list_refresher": list_refresher.get_info(),
+        "background_resolver": background_resolver.get_info(),
+        "event_loop": loop_monitor.get_info(),
     }
 
 
-@app.post("/sync")
-async def sync(apikey: str, items: List[Any]) -> Any:
+def check_apikey(apikey: str):
     if not apikey or not app_config.apikey or apikey != app_config.apikey:
         raise HTTPException(status_code=403, detail="Invalid API key.")
-    cache = imdb_api.get_cache()
-    now = time.time()
-    count = 0
-    new_count = 0
-    for item in items:
-        key = item["key"]
-        value = item["value"]
-        expire_time = item["expire_time"]
-        if expire_time and expire_time <= now:
-            continue
-        old_value, old_expire_time = cache.get(
-            key, default="not_found", expire_time=True
+
+
+@app.post("/sync")
+async def sync(apikey: str, request: fastapi.Request) -> Any:
+    check_apikey(apikey)
+    # A sync can carry hundreds of thousands of items, so parsing and merging
+    # happen off the event loop.
+    try:
+        items = await asyncio.to_thread(json.loads, await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+    try:
+        await asyncio.to_thread(check_imdb_items, items)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    stats = await run_in_cache_executor(
+        merge_imdb_items,
+        imdb_api.get_cache(),
+        items,
+        imdb_api.reverse_index,
+        imdb_api.key_filter,
+    )
+    if stats["written"]:
+        await run_in_cache_executor(aggregate_cache.invalidate_all)
+    logging.info(
+        f"Synced {stats['written']} of {stats['received']} IMDb items from remote "
+        + f"in {stats['duration_seconds']:.2f} seconds. New items: {stats['new']}."
+    )
+    return stats
+
+
+@app.get("/snapshot")
+async def get_snapshot(apikey: str) -> fastapi.Response:
+    check_apikey(apikey)
+    f = io.BytesIO()
+    await asyncio.to_thread(export_snapshot, imdb_api.get_cache(), f)
+    return fastapi.Response(
+        content=f.getvalue(),
+        media_type="application/gzip",
+        headers={"Content-Disposition": 'attachment; filename="imdb.jsonl.gz"'},
+    )
+
+
+@app.post("/snapshot")
+async def post_snapshot(apikey: str, request: fastapi.Request) -> Any:
+    check_apikey(apikey)
+    f = io.BytesIO(await request.body())
+    try:
+        result = await asyncio.to_thread(
+            import_snapshot,
+            imdb_api.get_cache(),
+            f,
+            imdb_api.reverse_index,
+            imdb_api.key_filter,
         )
-        if (
-            old_value == "not_found"
-            or not expire_time
-            or (old_expire_time and expire_time > old_expire_time)
-        ):
-            expire = expire_time - now if expire_time else None
-            cache.set(key, value, expire=expire)
-            count += 1
-            if old_value == "not_found":
-                new_count += 1
-    logging.info(f"Synced {count} IMDb items from remote. New items: {new_count}.")
-
-
-async def list(list_api: BaseApi, id: str, min_rating: float) -> List[Any]:
-    items = await list_api.get_items(id)
-    # Keep only movies
-    items = [item for item in items if item["type"] == "movie"]
-    # Keep only items with a minimum score
-    if min_rating:
-        items = [
-            item
-            for item in items
-            if "rating" in item
-            and "value" in item["rating"]
-            and item["rating"]["value"] >= min_rating
-        ]
-    items = [await convert_item(item) for item in items]
-    # Keep only items with IMDb ID
-    items = [item for item in items if item["imdb_id"]]
-    return items
+    except (SnapshotError, OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid snapshot: {e}")
+    if result["count"]:
+        await run_in_cache_executor(aggregate_cache.invalidate_all)
+    return result
 
 
-@app.get("/collection/{id}")
-async def collection(id: str, min_rating: float = None) -> List[Any]:
-    return await list(collection_api, id, min_rating)
+@app.get("/debug/traces")
+async def get_traces(apikey: str, limit: Annotated[int, Query(ge=1)] = 20) -> Any:
+    check_apikey(apikey)
+    return tracer.get_traces(limit)
 
 
-@app.get("/doulist/{id}")
-async def doulist(id: str, min_rating: float = None) -> List[Any]:
-    return await list(doulist_api, id, min_rating)
+@app.get("/debug/traces/{trace_id}")
+async def get_trace(apikey: str, trace_id: str) -> Any:
+    check_apikey(apikey)
+    result = tracer.get_trace(trace_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Trace not found.")
+    return result
+
+
+@app.get("/debug/loop/blocks")
+async def get_loop_blocks(apikey: str) -> Any:
+    check_apikey(apikey)
+    return loop_monitor.get_blocks()
+
 
+@app.get("/debug/profile/cpu")
+async def get_cpu_profile(
+    apikey: str,
+    seconds: Annotated[float, Query(gt=0, le=300)] = 10,
+    format: str = "collapsed",
+) -> fastapi.Response:
+    check_apikey(apikey)
+    if format not in ("collapsed", "pstats"):
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}.")
+    try:
+        if format == "collapsed":
+            return fastapi.responses.PlainTextResponse(
+                await profile_cpu_collapsed(seconds)
+            )
+        return fastapi.Response(
+            content=await profile_cpu_pstats(seconds),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": 'attachment; filename="cpu.prof"'},
+        )
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/debug/profile/memory")
+async def get_memory_profile(
+    apikey: str,
+    seconds: Annotated[float, Query(gt=0, le=300)] = 10,
+    limit: Annotated[int, Query(ge=1)] = 50,
+) -> fastapi.Response:
+    check_apikey(apikey)
+    try:
+        return fastapi.responses.PlainTextResponse(await profile_memory(seconds, limit))
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
-async def convert_item(item: Any) -> Any:
-    douban_id = get_douban_id(item)
-    imdb_id = await imdb_api.get_imdb_id(douban_id, item)
+
+def get_resolve_result(douban_id: str, imdb_id: str | None) -> Any:
     return {
         "douban_id": douban_id,
-        "title": item["title"],
+        "imdb_id": imdb_id or None,
+        "status": "found" if imdb_id else "not_found",
+    }
+
+
+@app.post("/resolve")
+async def resolve(
+    apikey: str,
+    request: fastapi.Request,
+    stream: bool = False,
+    wait: Annotated[float, Query(gt=0)] = None,
+) -> Any:
+    """
+    Resolves many Douban IDs to IMDb IDs from the cache at once. The others are
+    queued for the background resolver and marked as `pending`, or `dropped`
+    if its queue is full. With `stream`, results are sent as NDJSON, and those
+    of queued IDs follow as they are resolved, for up to `wait` seconds.
+    """
+    check_apikey(apikey)
+    try:
+        entries = await asyncio.to_thread(json.loads, await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+    if not isinstance(entries, list):
+        raise HTTPException(status_code=400, detail="Expected a list of Douban IDs.")
+    if len(entries) > app_config.resolve_max_ids:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {app_config.resolve_max_ids} Douban IDs are accepted.",
+        )
+    # Douban IDs, or items with a `douban_id` and an optional `title`.
+    items = {}
+    for entry in entries:
+        if isinstance(entry, dict) and isinstance(entry.get("douban_id"), str):
+            douban_id, title = entry["douban_id"], entry.get("title") or ""
+        elif isinstance(entry, str):
+            douban_id, title = entry, ""
+        else:
+            raise HTTPException(status_code=400, detail=f"Invalid entry: {entry}")
+        # Queued IDs end up in Douban URLs and as keys of the IMDb cache.
+        if not (douban_id.isascii() and douban_id.isdigit()):
+            raise HTTPException(
+                status_code=400, detail=f"Invalid Douban ID: {douban_id}"
+            )
+        items[douban_id] = {"title": title}
+
+    cached_imdb_ids = await imdb_api.get_cached_imdb_ids(items)
+    results = {}
+    waiting = set()
+    for douban_id, item in items.items():
+        if douban_id in cached_imdb_ids:
+            results[douban_id] = get_resolve_result(
+                douban_id, cached_imdb_ids[douban_id]
+            )
+            continue
+        background_resolver.submit(douban_id, item)
+        pending = background_resolver.is_pending(douban_id)
+        results[douban_id] = {
+            "douban_id": douban_id,
+            "imdb_id": None,
+            "status": "pending" if pending else "dropped",
+        }
+        if pending:
+            waiting.add(douban_id)
+    if not stream:
+        return [results[_] for _ in items]
+    max_wait = app_config.resolve_wait_max_seconds
+    return fastapi.responses.StreamingResponse(
+        stream_resolve_results(results, waiting, min(wait or max_wait, max_wait)),
+        media_type="application/x-ndjson",
+    )
+
+
+async def stream_resolve_results(
+    results: Dict[str, Any], waiting: Set[str], wait: float
+) -> AsyncIterator[str]:
+    resolved = asyncio.Queue()
+
+    def on_imdb_id_resolved(douban_id: str, imdb_id: str):
+        if douban_id in waiting:
+            resolved.put_nowait((douban_id, imdb_id))
+
+    imdb_api.update_listeners.append(on_imdb_id_resolved)
+    try:
+        # Some may have been resolved before the listener was added.
+        for douban_id, imdb_id in (await imdb_api.get_cached_imdb_ids(waiting)).items():
+            results[douban_id] = get_resolve_result(douban_id, imdb_id)
+            waiting.discard(douban_id)
+        for douban_id in results:
+            if douban_id not in waiting:
+                yield json.dumps(results[douban_id]) + "\n"
+
+        end_time = time.monotonic() + wait
+        while waiting:
+            try:
+                douban_id, imdb_id = await asyncio.wait_for(
+                    resolved.get(), end_time - time.monotonic()
+                )
+            except asyncio.TimeoutError:
+                break
+            if douban_id in waiting:
+                waiting.discard(douban_id)
+                yield json.dumps(get_resolve_result(douban_id, imdb_id)) + "\n"
+        for douban_id in waiting:
+            yield json.dumps(results[douban_id]) + "\n"
+    finally:
+        imdb_api.update_listeners.remove(on_imdb_id_resolved)
+
+
+@app.get("/lookup/imdb/{imdb_id}")
+async def lookup_imdb(imdb_id: str) -> Any:
+    return {
         "imdb_id": imdb_id,
+        "douban_ids": await run_in_cache_executor(
+            imdb_api.reverse_index.get_douban_ids, imdb_id
+        ),
     }
+
+
+@app.get("/lookup/douban/{douban_id}")
+async def lookup_douban(douban_id: str) -> Any:
+    lists = []
+    for list_key in await run_in_cache_executor(membership_index.get_lists, douban_id):
+        list_type, _, list_id = list_key.partition(":")
+        lists.append({"type": list_type, "id": list_id})
+    return {
+        "douban_id": douban_id,
+        "imdb_id": await imdb_api.async_cache.get(douban_id),
+        "lists": lists,
+    }
+
+
+async def get_index(list_api: BaseApi, id: str) -> Tuple[ListIndex, bool]:
+    """
+    Returns the index of a list, and whether it's a stale copy served because
+    Douban is unavailable or the list couldn't be fetched within the deadline.
+    In the latter case, the fetch goes on in the background.
+    """
+    list_refresher.on_requested(list_api.get_list_key(id))
+    try:
+        fetch = background_resolver.fetch_index(list_api, id)
+        return await run_with_deadline(asyncio.shield(fetch)), False
+    except (*DEGRADED_ERRORS, DeadlineExceededError) as e:
+        index = await list_api.get_stale_index(id)
+        if index is not None:
+            logging.warning(f"Serving stale {list_api.get_list_key(id)}: {e}")
+            return index, True
+        if isinstance(e, DeadlineExceededError):
+            raise HTTPException(
+                status_code=504,
+                detail="The list is still being fetched. Try again later.",
+            )
+        raise
+
+
+def set_degraded(response: fastapi.Response, degraded: bool):
+    if degraded:
+        response.headers["X-Doudarr-Degraded"] = "true"
+
+
+async def query_list(
+    list_api: BaseApi,
+    id: str,
+    min_rating: float = None,
+    year_from: int = None,
+    year_to: int = None,
+    genre: str = None,
+    top: int = None,
+    offset: int = 0,
+    limit: int = None,
+) -> Tuple[List[Any], bool]:
+    with trace("main.list", list=list_api.get_list_key(id)):
+        index, degraded = await get_index(list_api, id)
+        items = index.query(
+            min_rating=min_rating,
+            year_from=year_from,
+            year_to=year_to,
+            genre=genre,
+            top=top,
+            offset=offset,
+            limit=limit,
+        )
+        items, items_degraded = await convert_items(items, cache_only=degraded)
+        # Keep only items with IMDb ID
+        items = [item for item in items if item["imdb_id"]]
+        return items, degraded or items_degraded
+
+
+@app.get("/collection/{id}")
+async def collection(
+    id: str,
+    request: fastapi.Request,
+    response: fastapi.Response,
+    min_rating: float = None,
+    year_from: int = None,
+    year_to: int = None,
+    genre: str = None,
+    top: Annotated[int, Query(ge=0)] = None,
+    offset: Annotated[int, Query(ge=0)] = 0,
+    limit: Annotated[int, Query(ge=0)] = None,
+    deadline: Annotated[float, Query(gt=0)] = None,
+) -> List[Any]:
+    async with deadline_scope(
+        deadline or app_config.list_deadline_seconds, request.is_disconnected
+    ):
+        items, degraded = await query_list(
+            collection_api,
+            id,
+            min_rating,
+            year_from,
+            year_to,
+            genre,
+            top,
+            offset,
+            limit,
+        )
+    set_degraded(response, degraded)
+    return items
+
+
+@app.get("/doulist/{id}")
+async def doulist(
+    id: str,
+    request: fastapi.Request,
+    response: fastapi.Response,
+    min_rating: float = None,
+    year_from: int = None,
+    year_to: int = None,
+    genre: str = None,
+    top: Annotated[int, Query(ge=0)] = None,
+    offset: Annotated[int, Query(ge=0)] = 0,
+    limit: Annotated[int, Query(ge=0)] = None,
+    deadline: Annotated[float, Query(gt=0)] = None,
+) -> List[Any]:
+    async with deadline_scope(
+        deadline or app_config.list_deadline_seconds, request.is_disconnected
+    ):
+        items, degraded = await query_list(
+            doulist_api, id, min_rating, year_from, year_to, genre, top, offset, limit
+        )
+    set_degraded(response, degraded)
+    return items
+
+
+async def changes(
+    list_api: BaseApi, id: str, since: int, wait: float | None
+) -> Tuple[Any, bool]:
+    """
+    Returns the movies added to and removed from a list after version `since`,
+    waiting up to `wait` seconds for a change if there is none yet.
+    """
+    list_key = list_api.get_list_key(id)
+    with ExitStack() as stack:
+        # Watched before reading, so that a change in between isn't missed.
+        updated = stack.enter_context(change_log.watch(list_key)) if wait else None
+        # Fetches the list if needed, and keeps it refreshed while it's watched.
+        index, degraded = await get_index(list_api, id)
+        result = await run_in_cache_executor(change_log.get_changes, list_key, since)
+        # A reset answers right away, it has all the members.
+        if wait and result["version"] == since and not result["reset"]:
+            try:
+                await asyncio.wait_for(
+                    updated.wait(), min(wait, app_config.list_changes_wait_max_seconds)
+                )
+                index, degraded = await get_index(list_api, id)
+                result = await run_in_cache_executor(
+                    change_log.get_changes, list_key, since
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    # Only movies are listed, see `query_list`.
+    added = set(result["added"])
+    movies = [_ for _ in index.query() if get_douban_id(_) in added]
+    items, items_degraded = await convert_items(movies, cache_only=degraded)
+    cached_imdb_ids = await imdb_api.get_cached_imdb_ids(result["removed"])
+    return {
+        "version": result["version"],
+        "reset": result["reset"],
+        "added": items,
+        "removed": [
+            {"douban_id": _, "imdb_id": cached_imdb_ids.get(_)}
+            for _ in result["removed"]
+        ],
+    }, degraded or items_degraded
+
+
+@app.get("/collection/{id}/changes")
+async def collection_changes(
+    id: str,
+    response: fastapi.Response,
+    since: Annotated[int, Query(ge=0)] = 0,
+    wait: Annotated[float, Query(gt=0)] = None,
+) -> Any:
+    result, degraded = await changes(collection_api, id, since, wait)
+    set_degraded(response, degraded)
+    return result
+
+
+@app.get("/doulist/{id}/changes")
+async def doulist_changes(
+    id: str,
+    response: fastapi.Response,
+    since: Annotated[int, Query(ge=0)] = 0,
+    wait: Annotated[float, Query(gt=0)] = None,
+) -> Any:
+    result, degraded = await changes(doulist_api, id, since, wait)
+    set_degraded(response, degraded)
+    return result
+
+
+@app.get("/aggregate")
+async def aggregate(
+    request: fastapi.Request,
+    lists: Annotated[List[str], Query()],
+    op: str = "union",
+    min_rating: float = None,
+    deadline: Annotated[float, Query(gt=0)] = None,
+) -> fastapi.Response:
+    if op not in AGGREGATE_OPS:
+        raise HTTPException(status_code=400, detail=f"Unknown operation: {op}.")
+    try:
+        specs = [parse_list_spec(spec) for spec in lists]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    list_keys = [f"{list_type}:{id}" for list_type, id in specs]
+
+    key = aggregate_cache.get_key(list_keys, op, min_rating)
+    cached = await run_in_cache_executor(aggregate_cache.get, key)
+    degraded = False
+    if cached is not None:
+        items, etag = cached
+    else:
+        async with deadline_scope(
+            deadline or app_config.list_deadline_seconds, request.is_disconnected
+        ), trace("main.aggregate", lists=list_keys, op=op):
+            item_lists = []
+            for list_type, id in specs:
+                index, index_degraded = await get_index(list_apis[list_type], id)
+                item_lists.append(index.query(min_rating=min_rating))
+                degraded = degraded or index_degraded
+            converted, items_degraded = await convert_items(
+                combine_lists(item_lists, op), cache_only=degraded
+            )
+        degraded = degraded or items_degraded
+        items = []
+        imdb_ids = set()
+        for item in converted:
+            # Keep only items with IMDb ID, once per IMDb ID
+            if item["imdb_id"] and item["imdb_id"] not in imdb_ids:
+                imdb_ids.add(item["imdb_id"])
+                items.append(item)
+        if degraded:
+            # Don't cache partial results.
+            etag = get_etag(items)
+        else:
+            etag = await run_in_cache_executor(
+                aggregate_cache.set, key, list_keys, items
+            )
+
+    headers = {"ETag": etag}
+    if degraded:
+        headers["X-Doudarr-Degraded"] = "true"
+    if_none_match = request.headers.get("If-None-Match", "")
+    if etag in [_.strip() for _ in if_none_match.split(",")]:
+        return fastapi.Response(status_code=304, headers=headers)
+    return fastapi.responses.JSONResponse(items, headers=headers)
+
+
+async def convert_items(
+    items: List[Any], cache_only: bool = False
+) -> Tuple[List[Any], bool]:
+    """
+    Converts Douban items, reading all cached IMDb IDs at once. Returns the
+    converted items, and whether some of them are left without an IMDb ID:
+    - If the upstream is unavailable, the remaining uncached items are skipped.
+    - If the deadline runs out, they are handed off to the background resolver.
+    With `cache_only`, for lists served from a stale copy, uncached items are
+    skipped from the start.
+    """
+    douban_ids = [get_douban_id(item) for item in items]
+    cached_imdb_ids = await imdb_api.get_cached_imdb_ids(douban_ids)
+    unavailable = cache_only
+    timed_out = False
+    result = []
+    for douban_id, item in zip(douban_ids, items):
+        imdb_id = None
+        if douban_id in cached_imdb_ids:
+            imdb_id = cached_imdb_ids[douban_id]
+        elif timed_out:
+            background_resolver.submit(douban_id, item)
+        elif not unavailable:
+            try:
+                imdb_id = await run_with_deadline(imdb_api.get_imdb_id(douban_id, item))
+            except DeadlineExceededError:
+                timed_out = True
+                background_resolver.submit(douban_id, item)
+            except DEGRADED_ERRORS as e:
+                logging.warning(f"Serving cached IMDb IDs only: {e}")
+                unavailable = True
+        result.append(
+            {
+                "douban_id": douban_id,
+                "title": item["title"],
+                "imdb_id": imdb_id,
+            }
+        )
+    return result, unavailable or timed_out
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from diskcache import Cache
+
+from .async_cache import run_in_cache_executor
+from .cache_layout import migrating_caches
+from .config import app_config
+
+# Pause between migration batches, which lets other writers in.
+MIGRATION_PAUSE_SECONDS = 0.01
+
+
+async def migrate_caches():
+    """
+    Moves the entries of the caches opened in another layout to their current
+    one in the background, a batch per transaction.
+    """
+    for cache in list(migrating_caches):
+        start = time.monotonic()
+        moved = 0
+        try:
+            while count := await run_in_cache_executor(cache.migrate_batch):
+                moved += count
+                await asyncio.sleep(MIGRATION_PAUSE_SECONDS)
+        except Exception:
+            logging.exception("Failed to migrate cache.")
+            continue
+        migrating_caches.remove(cache)
+        logging.info(
+            f"Migrated {moved} cache entries in "
+            + f"{time.monotonic() - start:.2f} seconds."
+        )
+
+
+def get_compaction_delay(now: datetime, hours: List[int]) -> Optional[float]:
+    """
+    Returns the seconds from `now` to the start of the next compaction window,
+    one of the local `hours`, or None if there are none.
+    """
+    if not hours:
+        return None
+    start = now.replace(minute=0, second=0, microsecond=0)
+    for i in range(1, 25):
+        window = start + timedelta(hours=i)
+        if window.hour in hours:
+            return (window - now).total_seconds()
+    return None
+
+
+class CacheMaintenance:
+    """
+    Regularly sweeps expired entries out of the caches and culls them down to
+    their size limits. Compaction of the underlying SQLite databases runs on
+    its own, at the start of the configured off-peak hours, see
+    `get_compaction_delay`.
+
+    The sweeps run in a worker thread so that they don't block the event loop.
+    """
+
+    def __init__(self, caches: Dict[str, Cache]):
+        self.caches = caches
+        self.runs = 0
+        self.last_run_time = None
+        self.last_duration_seconds = None
+        self.last_result: Dict[str, Any] = {}
+        self.totals = {"expired": 0, "culled": 0, "bytes_reclaimed": 0}
+        # Called in the worker thread with the result of each run.
+        self.run_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+    async def run(self):
+        await asyncio.to_thread(self.run_once, False)
+
+    async def compact(self):
+        """Sweeps and culls like `run`, then compacts the caches."""
+        await asyncio.to_thread(self.run_once, True)
+
+    def get_next_compaction_delay(self) -> Optional[float]:
+        return get_compaction_delay(datetime.now(), app_config.cache_compaction_hours)
+
+    def run_once(self, compact: bool) -> Dict[str, Any]:
+        logging.info("Maintaining caches...")
+        start = time.monotonic()
+        result = {
+            name: self._maintain(cache, compact) for name, cache in self.caches.items()
+        }
+        duration = time.monotonic() - start
+
+        self.runs += 1
+        self.last_run_time = time.time()
+        self.last_duration_seconds = duration
+        self.last_result = result
+        for stats in result.values():
+            for key in self.totals:
+                self.totals[key] += stats[key]
+        logging.info(
+            f"Maintained caches in {duration:.2f} seconds. "
+            + ", ".join(
+                f"{name}: {stats['expired']} expired, {stats['culled']} culled, "
+                + f"{stats['bytes_reclaimed']} bytes reclaimed"
+                for name, stats in result.items()
+            )
+            + "."
+        )
+        for listener in self.run_listeners:
+            listener(result)
+        return result
+
+    def _maintain(self, cache: Cache, compact: bool) -> Dict[str, Any]:
+        volume_before = cache.volume()
+        expired = cache.expire(retry=True)
+        culled = cache.cull(retry=True)
+        if compact:
+            # `check(fix=True)` is diskcache's public way to VACUUM the database.
+            cache.check(fix=True, retry=True)
+        volume_after = cache.volume()
+        return {
+            "expired": expired,
+            "culled": culled,
+            "compacted": compact,
+            "bytes_reclaimed": max(0, volume_before - volume_after),
+            "volume": volume_after,
+        }
+
+    def get_info(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "last_run_time": self.last_run_time,
+            "last_duration_seconds": self.last_duration_seconds,
+            "last_result": self.last_result,
+            "totals": self.totals,
+        }
@@ -0,0 +1,158 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from diskcache import Cache
+
+from .bulk_cache import read_keys
+
+# Chance that a key that was never cached is taken for a cached one.
+FALSE_POSITIVE_RATE = 0.001
+# The Bloom filter is sized for twice the keys at build time, and at least this.
+MIN_CAPACITY = 100000
+
+
+class BloomFilter:
+    """
+    A fixed-size Bloom filter of string keys. It never misses a key that was
+    added, and takes a key that wasn't for one that was at about
+    `false_positive_rate`, as long as no more than `capacity` keys are added.
+    """
+
+    def __init__(self, capacity: int, false_positive_rate: float):
+        self.capacity = capacity
+        self.bit_count = max(
+            8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        )
+        self.hash_count = max(1, round(self.bit_count / capacity * math.log(2)))
+        self.bits = bytearray((self.bit_count + 7) // 8)
+        self.count = 0
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+    def _positions(self, key: str) -> Iterable[int]:
+        # Double hashing: k positions out of two 64-bit hashes.
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.bit_count for i in range(self.hash_count))
+
+
+class CachedKeyFilter:
+    """
+    Knows in memory which keys of a cache are cached, without probing SQLite.
+
+    Keys that never expire (resolved IMDb IDs, nearly all of them) go into a
+    Bloom filter, keys that do (not-found results) into a dict with their
+    expire time, so they drop out once expired.
+
+    Until `build` has scanned the cache, nothing is known. After that,
+    `is_cached` is True for cached keys, and rarely for keys that are not (a
+    false positive), so warm-up jobs can skip them.
+
+    Only writes made through `add` are seen: keys written by other processes
+    (the CLI, other instances) are missing until the next build, and keys that
+    are evicted stay in the Bloom filter. So the filter only decides what to
+    fetch first, never whether to read the cache.
+    """
+
+    def __init__(self, false_positive_rate: float = FALSE_POSITIVE_RATE):
+        self.false_positive_rate = false_positive_rate
+        self.permanent_keys = BloomFilter(MIN_CAPACITY, false_positive_rate)
+        self.expiring_keys: Dict[str, float] = {}
+        self.ready = False
+        self.last_build_time: Optional[float] = None
+        self.last_build_duration_seconds: Optional[float] = None
+        self.lock = threading.Lock()
+        # Writes made while a build is scanning the cache, replayed on the result.
+        self.pending: Optional[List[Any]] = None
+
+    def build(self, cache: Cache):
+        """Builds the filter from all keys of the cache. Blocking."""
+        start = time.monotonic()
+        with self.lock:
+            self.pending = []
+        try:
+            keys = read_keys(cache)
+        except BaseException:
+            with self.lock:
+                self.pending = None
+            raise
+        now = time.time()
+        permanent_count = len([_ for _, expire_time in keys if expire_time is None])
+        permanent_keys = BloomFilter(
+            max(permanent_count * 2, MIN_CAPACITY), self.false_positive_rate
+        )
+        expiring_keys = {}
+        for key, expire_time in keys:
+            if expire_time is None:
+                permanent_keys.add(key)
+            elif expire_time > now:
+                expiring_keys[key] = expire_time
+        with self.lock:
+            for key, expire_time in self.pending:
+                self._add(permanent_keys, expiring_keys, key, expire_time)
+            self.pending = None
+            self.permanent_keys = permanent_keys
+            self.expiring_keys = expiring_keys
+            self.ready = True
+        self.last_build_time = time.time()
+        self.last_build_duration_seconds = time.monotonic() - start
+        logging.info(
+            f"Built key filter with {len(keys)} keys "
+            + f"in {self.last_build_duration_seconds:.2f} seconds."
+        )
+
+    def add(self, key: str, expire_time: Optional[float]):
+        """Records a write. `expire_time` is an absolute timestamp, or None."""
+        with self.lock:
+            self._add(self.permanent_keys, self.expiring_keys, key, expire_time)
+            if self.pending is not None:
+                self.pending.append((key, expire_time))
+
+    def is_cached(self, key: str) -> bool:
+        if not self.ready:
+            return False
+        return self._contains(key)
+
+    def get_info(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "permanent_keys": self.permanent_keys.count,
+            "expiring_keys": len(self.expiring_keys),
+            "capacity": self.permanent_keys.capacity,
+            "size_bytes": len(self.permanent_keys.bits),
+            "last_build_time": self.last_build_time,
+            "last_build_duration_seconds": self.last_build_duration_seconds,
+        }
+
+    def _contains(self, key: str) -> bool:
+        expire_time = self.expiring_keys.get(key)
+        if expire_time is not None and expire_time > time.time():
+            return True
+        return key in self.permanent_keys
+
+    @staticmethod
+    def _add(
+        permanent_keys: BloomFilter,
+        expiring_keys: Dict[str, float],
+        key: str,
+        expire_time: Optional[float],
+    ):
+        if expire_time is None:
+            expiring_keys.pop(key, None)
+            permanent_keys.add(key)
+        else:
+            expiring_keys[key] = expire_time
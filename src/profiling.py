@@ -0,0 +1,109 @@
+import asyncio
+import cProfile
+import io
+import marshal
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import asynccontextmanager
+
+# How often the sampling profiler looks at the stack of the event loop.
+SAMPLE_INTERVAL_SECONDS = 0.005
+
+_lock = asyncio.Lock()
+
+
+class ProfilerBusyError(Exception):
+    pass
+
+
+@asynccontextmanager
+async def _exclusive():
+    # cProfile and tracemalloc are process-wide, so run one profile at a time.
+    if _lock.locked():
+        raise ProfilerBusyError("Another profile is running.")
+    async with _lock:
+        yield
+
+
+def _format_frame(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def sample_stacks(
+    thread_id: int, seconds: float, interval: float = SAMPLE_INTERVAL_SECONDS
+) -> Counter:
+    """
+    Samples the stack of a thread for `seconds`. Returns how many times each
+    stack was seen, as `;`-separated frames from the outermost one.
+    """
+    stacks = Counter()
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        frame = sys._current_frames().get(thread_id)
+        frames = []
+        while frame is not None:
+            frames.append(_format_frame(frame))
+            frame = frame.f_back
+        if frames:
+            stacks[";".join(reversed(frames))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+async def profile_cpu_collapsed(seconds: float) -> str:
+    """
+    Samples the event loop thread for `seconds` from another thread. Returns
+    the samples as collapsed stacks, one `<stack> <count>` line per stack, as
+    used by flame graph tools. Time spent waiting for I/O shows up as `select`.
+    """
+    async with _exclusive():
+        stacks = await asyncio.to_thread(sample_stacks, threading.get_ident(), seconds)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+async def profile_cpu_pstats(seconds: float) -> bytes:
+    """
+    Profiles everything that runs on the event loop thread for `seconds` with
+    cProfile. Returns the result in the pstats file format.
+    """
+    async with _exclusive():
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats)
+
+
+async def profile_memory(seconds: float, limit: int) -> str:
+    """
+    Takes tracemalloc snapshots `seconds` apart and returns the `limit` source
+    lines whose allocations grew the most in between, one per line.
+    """
+    async with _exclusive():
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            await asyncio.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+        finally:
+            if started:
+                tracemalloc.stop()
+    # Leave out the allocations of tracemalloc itself.
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(filters).compare_to(
+        before.filter_traces(filters), "lineno"
+    )
+    f = io.StringIO()
+    for stat in stats[:limit]:
+        f.write(f"{stat}\n")
+    return f.getvalue()
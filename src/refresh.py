@@ -0,0 +1,64 @@
+import logging
+import time
+from typing import Any, Dict, Set
+
+from .config import app_config
+from .lists import BaseApi
+from .retry import BACKGROUND, current_priority
+from .scheduler import Scheduler
+
+
+class ListRefresher:
+    """
+    Refetches cached lists `list_refresh_ahead_seconds` before they expire, so
+    that requests for popular lists don't wait for the refetch. Only lists
+    requested since they were last fetched are refetched; the others expire
+    as usual, so lists nobody asks for any more don't keep Douban busy.
+    """
+
+    def __init__(self, scheduler: Scheduler, list_apis: Dict[str, BaseApi]):
+        self.scheduler = scheduler
+        self.list_apis = list_apis
+        # List key -> time it was last requested / fetched.
+        self.requested: Dict[str, float] = {}
+        self.fetched: Dict[str, float] = {}
+        self.refreshed = 0
+        self.skipped = 0
+
+    def on_requested(self, list_key: str):
+        # Only lists with a pending refresh, so that requests for lists that
+        # never get fetched (e.g. invalid IDs) don't pile up.
+        if list_key in self.fetched:
+            self.requested[list_key] = time.time()
+
+    def on_fetched(self, list_key: str, added: Set[str], removed: Set[str]):
+        ahead_seconds = app_config.list_refresh_ahead_seconds
+        if ahead_seconds <= 0:
+            return
+        self.fetched[list_key] = time.time()
+        self.scheduler.add_once(
+            f"refresh:{list_key}",
+            lambda: self.refresh(list_key),
+            max(0, app_config.list_cache_ttl_seconds - ahead_seconds),
+            visible=False,
+        )
+
+    async def refresh(self, list_key: str):
+        requested = self.requested.pop(list_key, None)
+        fetched = self.fetched.pop(list_key, None)
+        if requested is None or fetched is None or requested < fetched:
+            self.skipped += 1
+            return
+        type, id = list_key.split(":", 1)
+        current_priority.set(BACKGROUND)
+        logging.info(f"Refreshing {list_key} ahead of its expiry...")
+        # Reschedules the next refresh, through `on_fetched`.
+        await self.list_apis[type].refresh_items(id)
+        self.refreshed += 1
+
+    def get_info(self) -> Dict[str, Any]:
+        return {
+            "tracked_lists": len(self.fetched),
+            "refreshed": self.refreshed,
+            "skipped": self.skipped,
+        }
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, List, Set, Tuple
+from urllib.parse import urlparse
+
+from .imdb import ImdbApi
+from .lists import BaseApi
+from .retry import BACKGROUND, current_priority
+from .utils import get_douban_id
+
+
+def parse_list_spec(spec: str) -> Tuple[str, str]:
+    """
+    Parses a list given as `collection:<id>`, `doulist:<id>` or a Douban list
+    URL into a `(type, id)` tuple.
+    """
+    spec = spec.strip()
+    if "://" in spec:
+        parts = [_ for _ in urlparse(spec).path.split("/") if _][-2:]
+        if len(parts) == 2 and parts[0] in ("subject_collection", "doulist"):
+            list_type = "collection" if parts[0] == "subject_collection" else "doulist"
+            return list_type, parts[1]
+    else:
+        list_type, _, list_id = spec.partition(":")
+        if list_type in ("collection", "doulist") and list_id:
+            return list_type, list_id
+    raise ValueError(f"Invalid list: {spec}")
+
+
+class BulkResolver:
+    """
+    Fetches many lists and resolves their items to IMDb IDs, without the web
+    server. Everything is written to the same caches the server uses.
+
+    At most `concurrency` list fetches and IMDb lookups are in flight at once;
+    the throttler applies as usual since the same HTTP clients are used. Lists
+    whose items are all resolved are recorded in a state file, so an
+    interrupted run picks up where it stopped.
+    """
+
+    def __init__(
+        self,
+        list_apis: Dict[str, BaseApi],
+        imdb_api: ImdbApi,
+        concurrency: int,
+        state_path: str,
+        progress_interval_seconds: float = 10,
+    ):
+        self.list_apis = list_apis
+        self.imdb_api = imdb_api
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.state_path = state_path
+        self.progress_interval_seconds = progress_interval_seconds
+        self.done_lists: Set[str] = set()
+        # Douban ID -> its lookup, shared by the lists it's in. Resolves to
+        # whether the IMDb ID got cached.
+        self.lookups: Dict[str, asyncio.Task] = {}
+        self.total = 0
+        self.resolved = 0
+        self.failed = 0
+        self.failed_lists = 0
+        self.start_time = None
+
+    async def run(self, lists: Iterable[Tuple[str, str]]) -> Dict[str, Any]:
+        current_priority.set(BACKGROUND)
+        self._load_state()
+        todo = []
+        for list_type, list_id in lists:
+            if f"{list_type}:{list_id}" not in self.done_lists:
+                todo.append((list_type, list_id))
+        skipped = len(self.done_lists)
+        logging.info(
+            f"Resolving {len(todo)} lists. Already done in previous runs: {skipped}."
+        )
+
+        self.start_time = time.monotonic()
+        reporter = asyncio.create_task(self._report_progress())
+        try:
+            await asyncio.gather(
+                *(self._resolve_list(list_type, list_id) for list_type, list_id in todo)
+            )
+        finally:
+            reporter.cancel()
+        self._log_progress()
+        return self.get_progress()
+
+    def get_progress(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.start_time if self.start_time else 0
+        finished = self.resolved + self.failed
+        throughput = finished / elapsed if elapsed else 0
+        remaining = self.total - finished
+        return {
+            "lists_done": len(self.done_lists),
+            "lists_failed": self.failed_lists,
+            "items_total": self.total,
+            "items_resolved": self.resolved,
+            "items_failed": self.failed,
+            "elapsed_seconds": elapsed,
+            "items_per_second": throughput,
+            "eta_seconds": remaining / throughput if throughput else None,
+        }
+
+    async def _resolve_list(self, list_type: str, list_id: str):
+        try:
+            async with self.semaphore:
+                items = await self.list_apis[list_type].get_items(list_id)
+        except Exception:
+            logging.exception(f"Failed to fetch {list_type} {list_id}.")
+            self.failed_lists += 1
+            return
+
+        # Keep only movies. Movies already picked up by another list are looked
+        # up once, and count for this list only if that lookup succeeds.
+        lookups = []
+        for item in items:
+            if item["type"] != "movie":
+                continue
+            douban_id = get_douban_id(item)
+            if douban_id not in self.lookups:
+                self.total += 1
+                self.lookups[douban_id] = asyncio.create_task(
+                    self._resolve_item(douban_id, item)
+                )
+            lookups.append(self.lookups[douban_id])
+
+        results = await asyncio.gather(*lookups)
+        if all(results):
+            self.done_lists.add(f"{list_type}:{list_id}")
+            self._save_state()
+        else:
+            self.failed_lists += 1
+
+    async def _resolve_item(self, douban_id: str, item: Any) -> bool:
+        try:
+            async with self.semaphore:
+                await self.imdb_api.get_imdb_id(douban_id, item)
+        except Exception as e:
+            logging.warning(f"Failed to resolve douban ID {douban_id}: {e}")
+            self.failed += 1
+            return False
+        self.resolved += 1
+        return True
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(self.progress_interval_seconds)
+            self._log_progress()
+
+    def _log_progress(self):
+        progress = self.get_progress()
+        eta = progress["eta_seconds"]
+        logging.info(
+            f"Progress: {progress['items_resolved'] + progress['items_failed']}"
+            + f"/{progress['items_total']} items "
+            + f"({progress['items_failed']} failed), "
+            + f"{progress['lists_done']} lists done, "
+            + f"{progress['items_per_second']:.2f} items/s, "
+            + f"ETA {f'{eta:.0f}s' if eta is not None else 'unknown'}."
+        )
+
+    def _load_state(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.done_lists = set(json.load(f)["done_lists"])
+
+    def _save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"done_lists": sorted(self.done_lists)}, f)
+        os.replace(tmp_path, self.state_path)
+
+
+def read_list_specs(specs: List[str], path: str | None) -> List[Tuple[str, str]]:
+    if path:
+        with open(path) as f:
+            specs = specs + [
+                line for line in f if line.strip() and not line.startswith("#")
+            ]
+    # Keep the order but drop duplicates.
+    return list(dict.fromkeys(parse_list_spec(spec) for spec in specs))
@@ -0,0 +1,140 @@
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+import httpx
+
+from .config import app_config
+from .deadline import check_deadline
+from .throttler import RateLimitedError, throttler
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+# Only these are retried, since repeating them has no side effect.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+# Upstream errors that are likely gone on the next attempt.
+RETRIED_STATUS_CODES = {500, 502, 503, 504}
+
+# Requests on behalf of a client are `INTERACTIVE`; bootstrap, refreshes and
+# the background resolver set `BACKGROUND` for their tasks.
+current_priority: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "current_priority", default=INTERACTIVE
+)
+
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRIED_STATUS_CODES
+    return isinstance(
+        error,
+        (
+            httpx.TimeoutException,
+            httpx.NetworkError,
+            httpx.RemoteProtocolError,
+            httpx.ProxyError,
+        ),
+    )
+
+
+class RetryBudget:
+    """A token bucket of retries, refilled at `per_minute` retries a minute."""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.tokens = per_minute
+        self.update_time = time.monotonic()
+
+    def try_spend(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(
+            self.per_minute,
+            self.tokens + (now - self.update_time) * self.per_minute / 60,
+        )
+        self.update_time = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Retrier:
+    """
+    Retries idempotent upstream requests that failed with a timeout, a
+    connection error or a 5xx response, with exponential backoff and full
+    jitter. Rate limits are left to the throttler: they are never retried, and
+    no retry is made while all routes to the host are rate limited.
+
+    Attempts per request and the retry budget of each host are set per
+    priority, so that background work can be patient without client requests
+    waiting long, and a failing host doesn't get a storm of retries.
+    """
+
+    def __init__(self):
+        self.budgets: Dict[Tuple[str, str], RetryBudget] = {}
+        self.stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"retries": 0, "recovered": 0, "gave_up": 0, "out_of_budget": 0}
+        )
+
+    async def run(
+        self, method: str, url: httpx.URL, fn: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Calls `fn`, which sends a `method` request to `url`, retrying it."""
+        host = url.host
+        priority = current_priority.get()
+        max_attempts = app_config.retry_max_attempts.get(priority, 1)
+        if method not in IDEMPOTENT_METHODS:
+            max_attempts = 1
+        attempt = 1
+        while True:
+            try:
+                result = await fn()
+                if attempt > 1:
+                    self.stats[host]["recovered"] += 1
+                return result
+            except RateLimitedError:
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    raise
+                if attempt >= max_attempts:
+                    if max_attempts > 1:
+                        self.stats[host]["gave_up"] += 1
+                    raise
+                if not self._get_budget(host, priority).try_spend():
+                    self.stats[host]["out_of_budget"] += 1
+                    raise
+                delay = random.uniform(0, self._get_backoff(attempt))
+                check_deadline(delay)
+                logging.warning(
+                    f"Retrying {method} {url} in {delay:.1f} seconds after: "
+                    + f"{str(e) or type(e).__name__}"
+                )
+                self.stats[host]["retries"] += 1
+                await asyncio.sleep(delay)
+                throttler.check(host)
+                attempt += 1
+
+    def get_info(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+    def _get_backoff(self, attempt: int) -> float:
+        return min(
+            app_config.retry_backoff_max_seconds,
+            app_config.retry_backoff_base_seconds * 2 ** (attempt - 1),
+        )
+
+    def _get_budget(self, host: str, priority: str) -> RetryBudget:
+        budget = self.budgets.get((host, priority))
+        if budget is None:
+            budgets = app_config.retry_budget_per_minute
+            per_minute = budgets.get(f"{host}/{priority}", budgets.get(priority, 0))
+            budget = RetryBudget(per_minute)
+            self.budgets[(host, priority)] = budget
+        return budget
+
+
+retrier = Retrier()
@@ -0,0 +1,160 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Recurring jobs run every interval, give or take this ratio of it, so that
+# jobs with the same interval (and instances started together) drift apart.
+JITTER_RATIO = 0.1
+
+
+class Job:
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable[Any]],
+        interval_seconds: Optional[float],
+        visible: bool,
+    ):
+        self.name = name
+        self.fn = fn
+        self.interval_seconds = interval_seconds
+        # Hidden jobs, e.g. one per list, are only counted on /stats.
+        self.visible = visible
+        self.next_run_time: Optional[float] = None
+        self.last_run_time: Optional[float] = None
+        self.last_duration_seconds: Optional[float] = None
+        self.last_outcome: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+
+    def get_info(self) -> Dict[str, Any]:
+        return {
+            "interval_seconds": self.interval_seconds,
+            "next_run_time": self.next_run_time,
+            "running": self.running,
+            "last_run_time": self.last_run_time,
+            "last_duration_seconds": self.last_duration_seconds,
+            "last_outcome": self.last_outcome,
+            "last_error": self.last_error,
+            "runs": self.runs,
+            "failures": self.failures,
+        }
+
+
+class Scheduler:
+    """
+    Runs background jobs off one priority queue of run times. Recurring jobs
+    are rescheduled when they finish, `interval_seconds` (with jitter) later,
+    so a slow run never overlaps the next one. One-off jobs run once; adding
+    one with the name of a pending one reschedules it. Hidden one-off jobs
+    are forgotten once they ran.
+
+    Each run is a task of its own, so a long job (e.g. bootstrap) doesn't hold
+    up the others.
+    """
+
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self.queue: List[Tuple[float, int, Job]] = []
+        self.counter = itertools.count()
+        self.changed = asyncio.Event()
+        self.tasks = set()
+        self.hidden_runs = {"ok": 0, "failed": 0}
+
+    def add_recurring(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable[Any]],
+        interval_seconds: float,
+        delay_seconds: float = 0,
+    ):
+        self.jobs[name] = Job(name, fn, interval_seconds, visible=True)
+        self._schedule(self.jobs[name], time.time() + delay_seconds)
+
+    def add_once(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable[Any]],
+        delay_seconds: float = 0,
+        visible: bool = True,
+    ):
+        job = self.jobs.get(name)
+        if job is None or job.interval_seconds is not None:
+            job = Job(name, fn, None, visible)
+            self.jobs[name] = job
+        job.fn = fn
+        self._schedule(job, time.time() + delay_seconds)
+
+    async def run(self):
+        while True:
+            now = time.time()
+            while self.queue and self.queue[0][0] <= now:
+                run_time, _, job = heapq.heappop(self.queue)
+                # Skip entries left behind by rescheduling.
+                if job.next_run_time == run_time and not job.running:
+                    self._start(job)
+            timeout = self.queue[0][0] - now if self.queue else None
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def get_info(self) -> Dict[str, Any]:
+        hidden = [_ for _ in self.jobs.values() if not _.visible]
+        return {
+            "jobs": {
+                name: job.get_info() for name, job in self.jobs.items() if job.visible
+            },
+            "hidden_jobs": {
+                "pending": len(hidden),
+                "running": len([_ for _ in hidden if _.running]),
+                **self.hidden_runs,
+            },
+        }
+
+    def _schedule(self, job: Job, run_time: float):
+        job.next_run_time = run_time
+        heapq.heappush(self.queue, (run_time, next(self.counter), job))
+        self.changed.set()
+
+    def _start(self, job: Job):
+        job.next_run_time = None
+        job.running = True
+        task = asyncio.create_task(self._run_job(job))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _run_job(self, job: Job):
+        start = time.monotonic()
+        job.last_run_time = time.time()
+        try:
+            await job.fn()
+            job.last_outcome = "ok"
+            job.last_error = None
+        except Exception as e:
+            logging.exception(f"Job {job.name} failed.")
+            job.last_outcome = "failed"
+            job.last_error = str(e) or type(e).__name__
+            job.failures += 1
+        finally:
+            job.running = False
+            job.runs += 1
+            job.last_duration_seconds = time.monotonic() - start
+        if not job.visible:
+            self.hidden_runs[job.last_outcome] += 1
+        if job.next_run_time is not None:
+            # Rescheduled while running; the queued entry was skipped.
+            self._schedule(job, job.next_run_time)
+        elif job.interval_seconds is not None:
+            jitter = random.uniform(-JITTER_RATIO, JITTER_RATIO)
+            self._schedule(job, time.time() + job.interval_seconds * (1 + jitter))
+        elif not job.visible and self.jobs.get(job.name) is job:
+            # Visible ones stay listed with their outcome.
+            del self.jobs[job.name]
@@ -0,0 +1,116 @@
+import gzip
+import json
+import logging
+import time
+from itertools import islice
+from typing import Any, BinaryIO, Dict, Iterator, Optional
+
+from diskcache import Cache
+
+from .indexes import ImdbReverseIndex
+from .membership import CachedKeyFilter
+from .sync import check_imdb_items, merge_imdb_items
+
+SNAPSHOT_FORMAT = "doudarr-imdb-snapshot"
+SNAPSHOT_VERSION = 1
+BATCH_SIZE = 10000
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def export_snapshot(cache: Cache, file: BinaryIO) -> int:
+    """
+    Writes the IMDb cache to `file` as a gzip-compressed JSON lines snapshot.
+
+    The first line is a header with the format and version. Each following line
+    is a `[key, value, expire_time]` entry, sorted by key. Expire times are
+    absolute timestamps, so they stay meaningful on the importing instance.
+    Returns the number of exported entries.
+    """
+    start = time.monotonic()
+    keys = sorted(cache)
+    count = 0
+    with gzip.GzipFile(fileobj=file, mode="wb") as f:
+        header = {
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "created_at": time.time(),
+        }
+        f.write(_dump_line(header))
+        it = iter(keys)
+        while batch := list(islice(it, BATCH_SIZE)):
+            lines = []
+            with cache.transact():
+                for key in batch:
+                    value, expire_time = cache.get(
+                        key, default="not_found", expire_time=True
+                    )
+                    if value == "not_found":
+                        continue
+                    lines.append(_dump_line([key, value, expire_time]))
+            f.write(b"".join(lines))
+            count += len(lines)
+    logging.info(
+        f"Exported {count} IMDb items in {time.monotonic() - start:.2f} seconds."
+    )
+    return count
+
+
+def import_snapshot(
+    cache: Cache,
+    file: BinaryIO,
+    reverse_index: Optional[ImdbReverseIndex] = None,
+    key_filter: Optional[CachedKeyFilter] = None,
+) -> Dict[str, Any]:
+    """
+    Loads a snapshot written by `export_snapshot` into the IMDb cache. Entries
+    are merged like `/sync` does, so a snapshot never overrides newer local
+    data.
+
+    The whole file is checked before the first entry is merged, so an invalid
+    snapshot raises `SnapshotError` without importing anything. `file` must
+    be seekable, as it's read twice.
+    """
+    with gzip.GzipFile(fileobj=file, mode="rb") as f:
+        header = json.loads(f.readline() or "null")
+        if not isinstance(header, dict) or header.get("format") != SNAPSHOT_FORMAT:
+            raise SnapshotError("Not a Doudarr IMDb snapshot.")
+        if header.get("version") != SNAPSHOT_VERSION:
+            raise SnapshotError(
+                f"Unsupported snapshot version: {header.get('version')}."
+            )
+        for _ in _iter_items(f):
+            pass
+        f.seek(0)
+        f.readline()
+        stats = merge_imdb_items(cache, _iter_items(f), reverse_index, key_filter)
+    logging.info(
+        f"Imported {stats['written']} of {stats['received']} IMDb items "
+        + f"in {stats['duration_seconds']:.2f} seconds. New items: {stats['new']}."
+    )
+    return {
+        "total": stats["received"],
+        "count": stats["written"],
+        "new_count": stats["new"],
+        "duration_seconds": stats["duration_seconds"],
+    }
+
+
+def _dump_line(data: Any) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+
+
+def _iter_items(f: BinaryIO) -> Iterator[Dict[str, Any]]:
+    # Line numbers count the header.
+    for number, line in enumerate(f, 2):
+        try:
+            entry = json.loads(line)
+            if not isinstance(entry, list) or len(entry) != 3:
+                raise ValueError(f"Invalid entry: {entry}")
+            item = {"key": entry[0], "value": entry[1], "expire_time": entry[2]}
+            check_imdb_items([item])
+        except ValueError as e:
+            raise SnapshotError(f"Line {number}: {e}")
+        yield item
@@ -1,38 +1,158 @@
-import asyncio
 import logging
+import time
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional
 
+from diskcache import Cache
+
+from .async_cache import run_in_cache_executor
+from .bulk_cache import read_many, write_many
+from .cache_layout import split_by_shard
 from .config import app_config
 from .imdb import ImdbApi
+from .indexes import ImdbReverseIndex
+from .membership import CachedKeyFilter
 from .utils import new_http_client
 
+# Items merged per transaction.
+MERGE_BATCH_SIZE = 10000
+
 
 async def sync(imdb_api: ImdbApi):
-    to_urls = app_config.sync_imdb_cache_to
-    if to_urls:
-        while True:
-            logging.info("Syncing IMDb cache...")
-            async with new_http_client() as client:
-                try:
-                    items = []
-                    cache = imdb_api.get_cache()
-                    for key in cache:
-                        value, expire_time = cache.get(key, expire_time=True)
-                        if value:
-                            items.append(
-                                {"key": key, "value": value, "expire_time": expire_time}
-                            )
-                    for url in to_urls:
-                        try:
-                            logging.info(f"Syncing {len(items)} IMDb items to {url}...")
-                            response = await client.post(url, json=items)
-                            response.raise_for_status()
-                        except Exception:
-                            logging.exception(f"Failed to sync IMDb cache to {url}.")
-                    logging.info("Synced IMDb cache.")
-                except Exception:
-                    logging.exception("Failed to sync IMDb cache.")
-            await asyncio.sleep(app_config.sync_imdb_cache_interval_seconds)
-    else:
-        logging.info(
-            "Syncing IMDb cache is disabled because remote URLs are not configured."
+    """Pushes the IMDb cache to the other instances in `sync_imdb_cache_to`."""
+    logging.info("Syncing IMDb cache...")
+    items = await run_in_cache_executor(get_imdb_items, imdb_api.get_cache())
+    async with new_http_client() as client:
+        for url in app_config.sync_imdb_cache_to:
+            try:
+                logging.info(f"Syncing {len(items)} IMDb items to {url}...")
+                response = await client.post(url, json=items)
+                response.raise_for_status()
+            except Exception:
+                logging.exception(f"Failed to sync IMDb cache to {url}.")
+    logging.info("Synced IMDb cache.")
+
+
+def get_imdb_items(cache: Cache) -> List[Any]:
+    """Returns the IMDb cache items to sync, leaving out not-found results."""
+    items = []
+    for key in cache:
+        value, expire_time = cache.get(key, expire_time=True)
+        if value:
+            items.append({"key": key, "value": value, "expire_time": expire_time})
+    return items
+
+
+def check_imdb_items(items: Any):
+    """Raises `ValueError` unless `items` is a list of items like `sync` sends."""
+    if not isinstance(items, list):
+        raise ValueError("Expected a list of items.")
+    for item in items:
+        if not (
+            isinstance(item, dict)
+            and isinstance(item.get("key"), str)
+            and "value" in item
+            and "expire_time" in item
+            and isinstance(item["value"], (str, type(None)))
+            and isinstance(item["expire_time"], (int, float, type(None)))
+        ):
+            raise ValueError(f"Invalid item: {item}")
+
+
+def merge_imdb_items(
+    cache: Cache,
+    items: Iterable[Any],
+    reverse_index: Optional[ImdbReverseIndex] = None,
+    key_filter: Optional[CachedKeyFilter] = None,
+) -> Dict[str, Any]:
+    """
+    Merges synced IMDb cache items into the local cache. An item wins if the key
+    is not cached yet, if it never expires, or if it expires later than the
+    cached entry; identical entries are skipped. Items are merged in batches,
+    each read and written in one transaction, and written keys are added to
+    `key_filter`. Shards of a sharded cache are merged one transaction each.
+    Returns merge statistics.
+    """
+    start = time.monotonic()
+    stats = {
+        "received": 0,
+        "written": 0,
+        "new": 0,
+        "unchanged": 0,
+        "expired": 0,
+        "outdated": 0,
+    }
+    it = iter(items)
+    while batch := list(islice(it, MERGE_BATCH_SIZE)):
+        _merge_batch(cache, batch, reverse_index, key_filter, stats)
+    duration = time.monotonic() - start
+    return {
+        **stats,
+        "duration_seconds": duration,
+        "items_per_second": stats["received"] / duration if duration else 0,
+    }
+
+
+def _merge_batch(
+    cache: Cache,
+    batch: List[Any],
+    reverse_index: Optional[ImdbReverseIndex],
+    key_filter: Optional[CachedKeyFilter],
+    stats: Dict[str, int],
+):
+    now = time.time()
+    stats["received"] += len(batch)
+    live = []
+    for item in batch:
+        if item["expire_time"] and item["expire_time"] <= now:
+            stats["expired"] += 1
+        else:
+            live.append(item)
+
+    # Each shard is merged in its own transaction, so that a sharded cache
+    # stays writable for others while a large sync is merged.
+    shard_items = {}
+    shard_of = {
+        key: shard
+        for shard, keys in split_by_shard(cache, {item["key"] for item in live})
+        for key in keys
+    }
+    for item in live:
+        shard_items.setdefault(shard_of[item["key"]], []).append(item)
+    cached = {}
+    writes = {}
+    for shard, items in shard_items.items():
+        with shard.transact():
+            cached.update(read_many(shard, [item["key"] for item in items]))
+            shard_writes = {}
+            for item in items:
+                key = item["key"]
+                value = item["value"]
+                expire_time = item["expire_time"]
+                old_value, old_expire_time = shard_writes.get(key) or cached.get(
+                    key, ("not_found", None)
+                )
+                if old_value == value and old_expire_time == expire_time:
+                    stats["unchanged"] += 1
+                elif (
+                    old_value == "not_found"
+                    or not expire_time
+                    or (old_expire_time and expire_time > old_expire_time)
+                ):
+                    shard_writes[key] = (value, expire_time)
+                else:
+                    stats["outdated"] += 1
+            write_many(shard, [(key, *shard_writes[key]) for key in shard_writes])
+            if key_filter:
+                for key, (_, expire_time) in shard_writes.items():
+                    key_filter.add(key, expire_time)
+        writes.update(shard_writes)
+    stats["written"] += len(writes)
+    stats["new"] += len([key for key in writes if key not in cached])
+
+    if reverse_index:
+        reverse_index.add_many(
+            (key, value, cached[key][0] if key in cached else None)
+            for key, (value, _) in writes.items()
+            if key not in cached or cached[key][0] != value
         )
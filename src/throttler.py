@@ -1,34 +1,142 @@
 from collections import defaultdict
 import time
+from typing import Dict, List, Optional
 import httpx
 
+from .circuit_breaker import CircuitBreaker
 from .config import app_config
+from .egress import (
+    DEFAULT_ROUTE,
+    ROUTE_EXTENSION,
+    get_egress_route_names,
+    is_routed_host,
+)
+
+
+# How long a half-open probe may be in flight before another one is allowed.
+PROBE_TIMEOUT_SECONDS = 60
+
+
+class RateLimitedError(Exception):
+    def __init__(self, message: str, host: str, wait_time: float):
+        super().__init__(message)
+        self.host = host
+        self.wait_time = wait_time
 
 
 class Throttler:
-    def __init__(self):
-        self.next_call_time = defaultdict(float)
+    """
+    Tracks rate limits per host with a circuit breaker each.
+
+    While a host is rate limited (open), requests to it fail fast with
+    `RateLimitedError`. Once the wait time has passed the host is half-open: a
+    single probe request goes through, and the host is closed again as soon as
+    a response comes back without a rate limit.
+
+    With more than one egress route (see `egress`), the state of Douban hosts
+    is tracked per host and route, and each request goes through the next route
+    of the host that is not rate limited, so a rate limited route is skipped
+    while the others carry on. The state of the default route is keyed by the
+    host only, and other hosts only use the default route.
+    """
+
+    def __init__(self, routes: Optional[List[str]] = None):
+        self.routes = routes or [DEFAULT_ROUTE]
+        # Opened by rate limits, for as long as each one asks to wait.
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        # Round-robin position per host.
+        self.route_counter: Dict[str, int] = defaultdict(int)
+
+    def check(self, host: str):
+        """
+        Fails fast if all routes to `host` are rate limited, without reserving a
+        probe.
+        """
+        wait_time = self._get_wait_time(host)
+        if wait_time > 0:
+            raise RateLimitedError(
+                f"Rate limited. Need to wait at least {wait_time}"
+                + f" seconds before the next call to {host}.",
+                host,
+                wait_time,
+            )
+
+    def is_rate_limited(self, host: str) -> bool:
+        return self._get_wait_time(host) > 0
+
+    def available_routes(self, host: str) -> int:
+        """The number of routes to `host` that are not rate limited, at least 1."""
+        return max(
+            1,
+            len(
+                [
+                    _
+                    for _ in self._get_routes(host)
+                    if self._get_state(host, _) != "open"
+                ]
+            ),
+        )
+
+    def _get_routes(self, host: str) -> List[str]:
+        return self.routes if is_routed_host(host) else [DEFAULT_ROUTE]
+
+    def _get_key(self, host: str, route: str) -> str:
+        return host if route == DEFAULT_ROUTE else f"{host}@{route}"
+
+    def _get_state(self, host: str, route: str) -> str:
+        breaker = self.breakers.get(self._get_key(host, route))
+        return breaker.get_state() if breaker else "closed"
+
+    def _get_wait_time(self, host: str) -> float:
+        return min(
+            (
+                breaker.get_wait_time()
+                if (breaker := self.breakers.get(self._get_key(host, _)))
+                else 0
+            )
+            for _ in self._get_routes(host)
+        )
+
+    def _get_route(self, request: httpx.Request) -> str:
+        if len(self._get_routes(request.url.host)) == 1:
+            return DEFAULT_ROUTE
+        return request.extensions.get(ROUTE_EXTENSION, DEFAULT_ROUTE)
 
     async def _on_request(self, request: httpx.Request):
-        next_call_time = self.next_call_time[request.url.host]
+        host = request.url.host
+        self.check(host)
         now = time.time()
-        if now < next_call_time:
-            raise Exception(
-                f"Rate limited. Need to wait at least {next_call_time - now}"
-                + f" seconds before the next call to {request.url.host}."
-            )
+        routes = self._get_routes(host)
+        start = self.route_counter[host]
+        probe_wait_time = None
+        for i in range(len(routes)):
+            route = routes[(start + i) % len(routes)]
+            breaker = self.breakers.get(self._get_key(host, route))
+            if breaker and not breaker.allow():
+                if breaker.get_state() == "half_open":
+                    # Waiting for the probe of this route.
+                    wait_time = PROBE_TIMEOUT_SECONDS - (now - breaker.probe_time)
+                    probe_wait_time = min(probe_wait_time or wait_time, wait_time)
+                continue
+            self.route_counter[host] = start + i + 1
+            if len(routes) > 1:
+                request.extensions[ROUTE_EXTENSION] = route
+            return
+        raise RateLimitedError(
+            f"Waiting for a probe request to {host} to finish.",
+            host,
+            probe_wait_time,
+        )
 
     async def _on_response(self, response: httpx.Response):
+        host = response.url.host
+        key = self._get_key(host, self._get_route(response.request))
         # Douban rate limit detection (302 redirect to sec.douban.com)
         if response.status_code == 302 and "sec.douban.com" in response.headers.get(
             "location", ""
         ):
-            wait_time = app_config.douban_rate_limit_delay_seconds
-            self.next_call_time[response.url.host] = time.time() + wait_time
-            raise Exception(
-                f"Rate limited by {response.url.host}. Need to wait at least "
-                + f"{wait_time} seconds before the next call."
-            )
+            self._open(key, app_config.douban_rate_limit_delay_seconds)
+            raise self._get_rate_limited_error(host)
 
         # HTTP 429 rate limit detection (standard rate limiting)
         if response.status_code == 429:
@@ -45,11 +153,28 @@ class Throttler:
                     # Default fallback
                     wait_time = 60
 
-            self.next_call_time[response.url.host] = time.time() + wait_time
-            raise Exception(
-                f"Rate limited by {response.url.host}. Need to wait at least "
-                + f"{wait_time} seconds before the next call."
-            )
+            self._open(key, wait_time)
+            raise self._get_rate_limited_error(host)
+
+        # Any other response closes a half-open host.
+        breaker = self.breakers.get(key)
+        if breaker and breaker.get_state() == "half_open":
+            breaker.record_success()
+
+    def _get_rate_limited_error(self, host: str) -> RateLimitedError:
+        # Other routes to the host may still be available right away.
+        wait_time = max(0, self._get_wait_time(host))
+        return RateLimitedError(
+            f"Rate limited by {host}. Need to wait at least "
+            + f"{wait_time} seconds before the next call.",
+            host,
+            wait_time,
+        )
+
+    def _open(self, key: str, wait_time: float):
+        if key not in self.breakers:
+            self.breakers[key] = CircuitBreaker(1, wait_time, PROBE_TIMEOUT_SECONDS)
+        self.breakers[key].trip(wait_time)
 
     def get_event_hooks(self):
         return {
@@ -58,14 +183,16 @@ class Throttler:
         }
 
     def get_info(self):
-        now = time.time()
-        return {
-            key: {
-                "is_rate_limited": now < value,
-                "wait_time": max(0, value - now),
-            }
-            for key, value in self.next_call_time.items()
-        }
+        info = {}
+        for key, breaker in self.breakers.items():
+            state = breaker.get_state()
+            if state != "closed":
+                info[key] = {
+                    "is_rate_limited": state == "open",
+                    "wait_time": breaker.get_wait_time(),
+                    "state": state,
+                }
+        return info
 
 
-throttler = Throttler()
+throttler = Throttler(get_egress_route_names())
@@ -0,0 +1,228 @@
+import contextvars
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+from .config import app_config
+
+# Spans beyond this are dropped, so a huge list can't blow up a trace.
+MAX_SPANS_PER_TRACE = 1000
+
+
+class Span:
+    def __init__(
+        self,
+        trace_id: str,
+        parent: Optional["Span"],
+        name: str,
+        attributes: Dict[str, Any],
+    ):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attributes = attributes
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self, trace_start: float) -> Dict[str, Any]:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_offset_seconds": self.start - trace_start,
+            "duration_seconds": self.end - self.start,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Tracer:
+    """
+    Records spans of requests. A trace starts with a root span, see `trace`,
+    and is exported when that span ends: kept in a ring buffer of the last
+    `buffer_size` traces, and appended to a JSON lines file if `file_path` is
+    set. Spans outside of a trace, e.g. of background jobs, are not recorded, so
+    they don't push request traces out of the buffer. Spans that end after
+    their trace is exported, e.g. from tasks that outlive the request, are
+    dropped.
+    """
+
+    def __init__(self, buffer_size: int, file_path: Optional[str] = None):
+        self.enabled = buffer_size > 0 or bool(file_path)
+        self.traces = deque(maxlen=max(buffer_size, 0))
+        self.file_path = file_path
+        self.active: Dict[str, List[Span]] = {}
+        self.dropped_spans: Dict[str, int] = {}
+
+    def start_span(
+        self, name: str, attributes: Dict[str, Any], root: bool = False
+    ) -> Optional[Span]:
+        """
+        Starts a child of the current span. Without one, starts a new trace if
+        `root` is set, and records nothing otherwise.
+        """
+        if not self.enabled:
+            return None
+        parent = current_span.get()
+        if parent is None:
+            if not root:
+                return None
+            span = Span(uuid.uuid4().hex, None, name, attributes)
+            self.active[span.trace_id] = []
+            self.dropped_spans[span.trace_id] = 0
+            return span
+        if parent.trace_id not in self.active:
+            # The trace has been exported already.
+            return None
+        return Span(parent.trace_id, parent, name, attributes)
+
+    def end_span(self, span: Span):
+        span.end = time.perf_counter()
+        spans = self.active.get(span.trace_id)
+        if spans is None:
+            return
+        if span.parent_id is not None:
+            if len(spans) < MAX_SPANS_PER_TRACE:
+                spans.append(span)
+            else:
+                self.dropped_spans[span.trace_id] += 1
+            return
+        del self.active[span.trace_id]
+        trace = self._build_trace(span, spans, self.dropped_spans.pop(span.trace_id))
+        self.traces.append(trace)
+        if self.file_path:
+            try:
+                with open(self.file_path, "a") as f:
+                    f.write(json.dumps(trace, ensure_ascii=False) + "\n")
+            except OSError as e:
+                logging.warning(f"Failed to write trace to {self.file_path}: {e}")
+
+    def get_traces(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Returns the summaries of the last traces, newest first."""
+        traces = list(reversed(self.traces))[:limit]
+        return [
+            {
+                key: trace[key]
+                for key in ("trace_id", "name", "start_time", "duration_seconds")
+            }
+            for trace in traces
+        ]
+
+    def get_trace(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        for trace in self.traces:
+            if trace["trace_id"] == trace_id:
+                return trace
+        return None
+
+    def _build_trace(
+        self, root: Span, spans: List[Span], dropped_spans: int
+    ) -> Dict[str, Any]:
+        spans = [root, *sorted(spans, key=lambda span: span.start)]
+        return {
+            "trace_id": root.trace_id,
+            "name": root.name,
+            "start_time": root.start_time,
+            "duration_seconds": root.end - root.start,
+            "spans": [span.to_dict(root.start) for span in spans],
+            "dropped_spans": dropped_spans,
+            "critical_path": [
+                {"name": span.name, "duration_seconds": span.end - span.start}
+                for span in get_critical_path(root, spans)
+            ],
+        }
+
+
+def get_critical_path(root: Span, spans: List[Span]) -> List[Span]:
+    """
+    Returns the chain of spans the root waited on: starting from the root, the
+    child that ended last, recursively.
+    """
+    children: Dict[str, List[Span]] = {}
+    for span in spans:
+        if span.parent_id is not None:
+            children.setdefault(span.parent_id, []).append(span)
+    path = [root]
+    while path[-1].span_id in children:
+        path.append(max(children[path[-1].span_id], key=lambda span: span.end))
+    return path
+
+
+tracer = Tracer(app_config.trace_buffer_size, app_config.trace_file)
+
+
+@contextmanager
+def trace(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Like `span`, but starts a new trace if there is no current span. Only used
+    by request handlers.
+    """
+    with _record(tracer.start_span(name, attributes, root=True)) as new_span:
+        yield new_span
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Records the enclosed code as a span, as a child of the current span. Yields
+    None if the span isn't recorded.
+    """
+    with _record(tracer.start_span(name, attributes)) as new_span:
+        yield new_span
+
+
+@contextmanager
+def _record(new_span: Optional[Span]) -> Iterator[Optional[Span]]:
+    if new_span is None:
+        yield None
+        return
+    token = current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.error = repr(e)
+        raise
+    finally:
+        try:
+            current_span.reset(token)
+        except ValueError:
+            # A coroutine closed by the garbage collector runs outside of its
+            # context, which is gone anyway.
+            pass
+        tracer.end_span(new_span)
+
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """
+    Records each request sent through `transport` within a trace, up to its
+    response headers, including requests that fail.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with span("http", method=request.method, url=str(request.url)) as http_span:
+            response = await self.transport.handle_async_request(request)
+            if http_span is not None:
+                http_span.set_attribute("status_code", response.status_code)
+            return response
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -1,19 +1,58 @@
-from typing import Any, AsyncIterator
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, List
 from urllib.parse import urlparse
 import httpx
 import logging
+from diskcache import Cache
+from .cache_backends import MemoryCache, RedisCache
+from .cache_layout import open_cache
 from .config import app_config
+from .egress import EgressTransport, get_egress_routes
+from .retry import retrier
 from .throttler import throttler
+from . import tracing
 
 
 async def get_response(client: httpx.AsyncClient, url: str):
-    response = await client.get(url)
+    async def get():
+        response = await client.get(url)
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            logging.error(f"Failed to fetch {url}: {e}")
+            raise e
+        return response
+
+    return await retrier.run("GET", client.build_request("GET", url).url, get)
+
+
+@asynccontextmanager
+async def stream_response(
+    client: httpx.AsyncClient, url: str
+) -> AsyncIterator[httpx.Response]:
+    """
+    Like `get_response`, but the body is not read upfront. Leaving the context
+    before the body is fully read closes the connection.
+    """
+    request = client.build_request("GET", url)
+
+    async def send():
+        response = await client.send(request, stream=True)
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            await response.aclose()
+            logging.error(f"Failed to fetch {url}: {e}")
+            raise e
+        return response
+
+    # Only opening the response is retried, not reading the body.
+    response = await retrier.run("GET", request.url, send)
     try:
-        response.raise_for_status()
-    except httpx.HTTPStatusError as e:
-        logging.error(f"Failed to fetch {url}: {e}")
-        raise e
-    return response
+        yield response
+    finally:
+        await response.aclose()
 
 
 async def get_json(client: httpx.AsyncClient, url: str):
@@ -21,31 +60,13 @@ async def get_json(client: httpx.AsyncClient, url: str):
     return response.json()
 
 
-def _get_extra_http_client_args():
-    args = {}
-    if app_config.proxy_address:
-        args = {
-            **args,
-            "proxies": {
-                "http://": app_config.proxy_address,
-                "https://": app_config.proxy_address,
-            },
-        }
-    if app_config.cookie_douban_com_dbcl2:
-        cookies = httpx.Cookies()
-        cookies.set("dbcl2", app_config.cookie_douban_com_dbcl2, domain=".douban.com")
-        args = {
-            **args,
-            "cookies": cookies,
-        }
-    return args
-
-
 def new_http_client() -> httpx.AsyncClient:
     client = httpx.AsyncClient(
         timeout=60,
         event_hooks=throttler.get_event_hooks(),
-        **_get_extra_http_client_args(),
+        # Requests rejected by the throttler are not traced, and responses are
+        # traced even if the throttler rejects them.
+        transport=tracing.TracingTransport(EgressTransport(get_egress_routes())),
     )
     client.headers["User-Agent"] = (
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
@@ -54,25 +75,80 @@ def new_http_client() -> httpx.AsyncClient:
     return client
 
 
+def new_cache(name: str) -> Cache:
+    backend = app_config.cache_backend.get(name, "diskcache")
+    if backend != "diskcache":
+        for setting in ("cache_size_limit_bytes", "cache_eviction_policy"):
+            if name in getattr(app_config, setting):
+                raise ValueError(
+                    f"DOUDARR_{setting.upper()} doesn't apply to the {backend} "
+                    + f"backend of cache {name}."
+                )
+    if backend == "memory":
+        return MemoryCache()
+    if backend == "redis":
+        if not app_config.redis_url:
+            raise ValueError(f"DOUDARR_REDIS_URL is required by cache {name}.")
+        return RedisCache(app_config.redis_url, f"doudarr:{name}:")
+    if backend != "diskcache":
+        raise ValueError(f"Unknown cache backend: {backend}")
+    settings = {}
+    if name in app_config.cache_size_limit_bytes:
+        settings["size_limit"] = app_config.cache_size_limit_bytes[name]
+    if name in app_config.cache_eviction_policy:
+        settings["eviction_policy"] = app_config.cache_eviction_policy[name]
+    return open_cache(
+        os.path.join(app_config.cache_base_dir, name),
+        app_config.cache_shards.get(name, 1),
+        **settings,
+    )
+
+
+def get_percentiles(
+    values: Iterable[float], percentiles: Iterable[int] = (50, 95, 99)
+) -> Dict[str, float]:
+    values = sorted(values)
+    if not values:
+        return {}
+    return {
+        f"p{p}": values[min(len(values) - 1, len(values) * p // 100)]
+        for p in percentiles
+    }
+
+
 def get_douban_id(item):
     parsed_url = urlparse(item["url"])
     douban_id = [_ for _ in parsed_url.path.split("/") if _][-1]
     return douban_id
 
 
+def get_movies(items: Iterable[Any]) -> List[Any]:
+    """Keeps the movies of a list, the only items served (see `ListIndex`)."""
+    return [item for item in items if item["type"] == "movie"]
+
+
 async def read_pages(
     read_one_page, get_total, get_items, items_per_page
 ) -> AsyncIterator[Any]:
+    async for page in iter_pages(read_one_page, get_total, get_items, items_per_page):
+        for item in page:
+            yield item
+
+
+async def iter_pages(
+    read_one_page, get_total, get_items, items_per_page
+) -> AsyncIterator[List[Any]]:
+    """Like `read_pages`, but yields the items a page at a time."""
     total = None
     start = 0
     count = items_per_page
     while total is None or start < total:
-        page_data = await read_one_page(start, count)
+        with tracing.span("read_pages.page", start=start, count=count):
+            page_data = await read_one_page(start, count)
         if total is None:
             total = get_total(page_data)
         new_items = get_items(page_data)
-        for item in new_items:
-            yield item
+        yield new_items
         start += len(new_items)
         if not new_items:
             break
@@ -0,0 +1,109 @@
+import pytest
+
+# Import from src package
+from src.aggregate import AggregateCache, combine_lists
+
+
+def make_item(douban_id):
+    return {"url": f"https://movie.douban.com/subject/{douban_id}/"}
+
+
+def ids(items):
+    return [item["url"].split("/")[-2] for item in items]
+
+
+class TestCombineLists:
+    """Test suite for combine_lists"""
+
+    @pytest.fixture
+    def item_lists(self):
+        return [
+            [make_item("1"), make_item("2"), make_item("2"), make_item("3")],
+            [make_item("3"), make_item("4")],
+            [make_item("3"), make_item("1")],
+        ]
+
+    def test_union(self, item_lists):
+        assert ids(combine_lists(item_lists, "union")) == ["1", "2", "3", "4"]
+
+    def test_intersection(self, item_lists):
+        assert ids(combine_lists(item_lists, "intersection")) == ["3"]
+
+    def test_difference(self, item_lists):
+        assert ids(combine_lists(item_lists, "difference")) == ["2"]
+
+    def test_unknown_op(self, item_lists):
+        with pytest.raises(ValueError):
+            combine_lists(item_lists, "xor")
+
+
+class TestAggregateCache:
+    """Test suite for AggregateCache class"""
+
+    @pytest.fixture
+    def aggregate_cache(self, temp_cache_dir, monkeypatch):
+        from src import config
+
+        monkeypatch.setattr(config.app_config, "cache_base_dir", temp_cache_dir)
+
+        aggregate_cache = AggregateCache()
+        yield aggregate_cache
+        aggregate_cache.close()
+
+    def test_key_ignores_order_except_for_difference(self, aggregate_cache):
+        """Test that only difference depends on the order of the lists"""
+        a = ["collection:a", "doulist:b"]
+        b = ["doulist:b", "collection:a"]
+
+        assert aggregate_cache.get_key(a, "union", None) == aggregate_cache.get_key(
+            b, "union", None
+        )
+        assert aggregate_cache.get_key(
+            a, "difference", None
+        ) != aggregate_cache.get_key(b, "difference", None)
+
+    def test_set_and_get(self, aggregate_cache):
+        """Test that results are cached with a content-based ETag"""
+        items = [{"douban_id": "1", "imdb_id": "tt0000001"}]
+        key = aggregate_cache.get_key(["collection:a"], "union", None)
+
+        etag = aggregate_cache.set(key, ["collection:a"], items)
+
+        assert aggregate_cache.get(key) == (items, etag)
+        assert etag == aggregate_cache.set(key, ["collection:a"], items)
+        assert etag != aggregate_cache.set(key, ["collection:a"], [])
+
+    def test_invalidate_list(self, aggregate_cache):
+        """Test that results are dropped when one of their lists changes"""
+        key_a = aggregate_cache.get_key(["collection:a"], "union", None)
+        key_ab = aggregate_cache.get_key(["collection:a", "doulist:b"], "union", None)
+        key_b = aggregate_cache.get_key(["doulist:b"], "union", None)
+        aggregate_cache.set(key_a, ["collection:a"], [])
+        aggregate_cache.set(key_ab, ["collection:a", "doulist:b"], [])
+        aggregate_cache.set(key_b, ["doulist:b"], [])
+
+        aggregate_cache.invalidate_list("collection:a")
+
+        assert aggregate_cache.get(key_a) is None
+        assert aggregate_cache.get(key_ab) is None
+        assert aggregate_cache.get(key_b) is not None
+
+    def test_invalidate_all(self, aggregate_cache):
+        """Test that all results are dropped by bulk IMDb ID changes"""
+        key = aggregate_cache.get_key(["collection:a"], "union", None)
+        aggregate_cache.set(key, ["collection:a"], [])
+
+        aggregate_cache.invalidate_all()
+
+        assert aggregate_cache.get(key) is None
+
+    def test_list_keys_expire(self, aggregate_cache):
+        """Test that the results of a list are tracked no longer than cached"""
+        key = aggregate_cache.get_key(["collection:a"], "union", None)
+        aggregate_cache.set(key, ["collection:a"], [])
+
+        _, expire_time = aggregate_cache.cache.get(
+            "list:collection:a", expire_time=True
+        )
+
+        assert expire_time is not None
@@ -0,0 +1,60 @@
+import threading
+import time
+import pytest
+from diskcache import Cache
+
+# Import from src package
+from src.async_cache import AsyncCache, run_in_cache_executor
+
+
+@pytest.fixture
+def cache(temp_cache_dir):
+    """Provides an AsyncCache over a temporary diskcache"""
+    cache = Cache(temp_cache_dir)
+    yield AsyncCache(cache)
+    cache.close()
+
+
+class TestAsyncCache:
+    """Test suite for AsyncCache class"""
+
+    @pytest.mark.asyncio
+    async def test_runs_off_event_loop(self):
+        """Test that cache calls run on the cache thread pool"""
+        thread = await run_in_cache_executor(threading.current_thread)
+        assert thread is not threading.current_thread()
+        assert thread.name.startswith("cache")
+
+    @pytest.mark.asyncio
+    async def test_get_set_delete(self, cache):
+        """Test single key operations"""
+        assert await cache.get("a") is None
+        assert await cache.get("a", default="missing") == "missing"
+
+        await cache.set("a", 1, expire=100)
+        assert await cache.get("a") == 1
+        value, expire_time = await cache.get("a", expire_time=True)
+        assert value == 1
+        assert expire_time == pytest.approx(time.time() + 100, abs=5)
+
+        await cache.delete("a")
+        assert await cache.get("a") is None
+
+    @pytest.mark.asyncio
+    async def test_get_many(self, cache):
+        """Test that missing keys are left out, but cached None values are not"""
+        cache.cache.set("a", "tt1")
+        cache.cache.set("b", None)
+
+        assert await cache.get_many(["a", "b", "c"]) == {"a": "tt1", "b": None}
+        result = await cache.get_many(["a", "c"], expire_time=True)
+        assert result == {"a": ("tt1", None)}
+
+    @pytest.mark.asyncio
+    async def test_set_many(self, cache):
+        """Test that many items are written with the same expiry"""
+        await cache.set_many([("a", 1), ("b", 2)], expire=100)
+
+        assert cache.cache.get("a") == 1
+        _, expire_time = cache.cache.get("b", expire_time=True)
+        assert expire_time == pytest.approx(time.time() + 100, abs=5)
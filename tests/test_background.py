@@ -0,0 +1,129 @@
+import asyncio
+import pytest
+
+# Import from src package
+from src.background import BackgroundResolver
+from src.deadline import current_deadline, deadline_scope
+from src.throttler import RateLimitedError
+
+
+class FakeImdbApi:
+    def __init__(self, failing=(), rate_limited=0):
+        self.failing = set(failing)
+        self.rate_limited = rate_limited
+        self.resolved = []
+
+    async def get_imdb_id(self, douban_id, douban_item):
+        await asyncio.sleep(0)
+        if self.rate_limited:
+            self.rate_limited -= 1
+            raise RateLimitedError("Rate limited", "movie.douban.com", 0.01)
+        if douban_id in self.failing:
+            raise Exception("Failed")
+        self.resolved.append(douban_id)
+        return f"tt{douban_id}"
+
+
+class FakeListApi:
+    def __init__(self):
+        self.fetches = 0
+        self.deadlines = []
+
+    def get_list_key(self, id):
+        return f"collection:{id}"
+
+    async def get_index(self, id):
+        self.fetches += 1
+        self.deadlines.append(current_deadline.get())
+        await asyncio.sleep(0.05)
+        return f"index {id}"
+
+
+async def wait_idle(resolver):
+    for _ in range(100):
+        if not resolver.pending and not resolver.in_flight:
+            return
+        await asyncio.sleep(0.01)
+
+
+class TestBackgroundResolver:
+    """Test suite for BackgroundResolver class"""
+
+    @pytest.mark.asyncio
+    async def test_resolves_submitted_items(self):
+        """Test that submitted items are resolved once each"""
+        imdb_api = FakeImdbApi(failing=["3"])
+        resolver = BackgroundResolver(imdb_api, concurrency=2, max_pending=10)
+        runner = asyncio.create_task(resolver.run())
+        try:
+            assert resolver.submit("1", {})
+            assert not resolver.submit("1", {})
+            assert resolver.submit("2", {})
+            assert resolver.submit("3", {})
+            await wait_idle(resolver)
+        finally:
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+
+        assert sorted(imdb_api.resolved) == ["1", "2"]
+        info = resolver.get_info()
+        assert info["submitted"] == 3
+        assert info["resolved"] == 2
+        assert info["failed"] == 1
+        assert info["pending"] == 0
+
+    @pytest.mark.asyncio
+    async def test_drops_items_over_limit(self):
+        """Test that items beyond max_pending are dropped"""
+        resolver = BackgroundResolver(FakeImdbApi(), concurrency=1, max_pending=2)
+
+        assert resolver.submit("1", {})
+        assert resolver.submit("2", {})
+        assert not resolver.submit("3", {})
+        assert resolver.get_info()["dropped"] == 1
+        assert resolver.is_pending("1")
+        assert not resolver.is_pending("3")
+
+    @pytest.mark.asyncio
+    async def test_retries_rate_limited_items(self):
+        """Test that rate limited items are queued again"""
+        imdb_api = FakeImdbApi(rate_limited=1)
+        resolver = BackgroundResolver(imdb_api, concurrency=1, max_pending=10)
+        runner = asyncio.create_task(resolver.run())
+        try:
+            resolver.submit("1", {})
+            await asyncio.sleep(0.05)
+            await wait_idle(resolver)
+        finally:
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+
+        assert imdb_api.resolved == ["1"]
+        assert resolver.get_info()["failed"] == 0
+
+    @pytest.mark.asyncio
+    async def test_fetch_index_is_shared(self):
+        """Test that concurrent fetches of a list share one task"""
+        list_api = FakeListApi()
+        resolver = BackgroundResolver(FakeImdbApi(), concurrency=1, max_pending=10)
+
+        first = resolver.fetch_index(list_api, "a")
+        second = resolver.fetch_index(list_api, "a")
+        assert first is second
+        assert resolver.get_info()["list_fetches"] == 1
+        assert await first == "index a"
+        await asyncio.sleep(0)
+
+        assert list_api.fetches == 1
+        assert resolver.get_info()["list_fetches"] == 0
+
+    @pytest.mark.asyncio
+    async def test_fetch_index_has_no_deadline(self):
+        """Test that a list fetch isn't bound by the deadline of its request"""
+        list_api = FakeListApi()
+        resolver = BackgroundResolver(FakeImdbApi(), concurrency=1, max_pending=10)
+
+        async with deadline_scope(0.01):
+            task = resolver.fetch_index(list_api, "a")
+        assert await task == "index a"
+        assert list_api.deadlines == [None]
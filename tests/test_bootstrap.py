@@ -0,0 +1,206 @@
+import asyncio
+import time
+import httpx
+import pytest
+from diskcache import Cache
+
+# Import from src package
+from src.bootstrap import KNOWN_LISTS_TO_STOP, ListCatalog, bootstrap, parse_list_url
+
+
+class FakeListsApi:
+    def __init__(self, ids):
+        self.ids = ids
+        self.read = 0
+
+    async def iter_lists(self):
+        for id in self.ids:
+            self.read += 1
+            yield {"sharing_url": f"https://www.douban.com/doulist/{id}/"}
+
+
+class FakeListApi:
+    def __init__(self, items):
+        self.items = items
+
+    async def iter_pages(self, id):
+        items = self.items[id]
+        if isinstance(items, Exception):
+            raise items
+        for i in range(0, len(items), 2):
+            yield items[i : i + 2]
+
+
+class FakeImdbApi:
+    def __init__(self):
+        self.resolved = []
+
+    async def get_uncached_douban_ids(self, douban_ids):
+        return list(douban_ids)
+
+    async def get_imdb_id(self, douban_id, item):
+        self.resolved.append(douban_id)
+        return f"tt{douban_id}"
+
+
+@pytest.fixture
+def cache(temp_cache_dir):
+    cache = Cache(temp_cache_dir)
+    yield cache
+    cache.close()
+
+
+class TestParseListUrl:
+    """Test suite for parse_list_url"""
+
+    @pytest.mark.parametrize(
+        "url,expected",
+        [
+            ("https://www.douban.com/doulist/123/", ("doulist", "123")),
+            (
+                "https://m.douban.com/subject_collection/movie_top/",
+                ("collection", "movie_top"),
+            ),
+            (
+                "https://www.douban.com/doubanapp/dispatch?uri=/doulist/456/",
+                ("doulist", "456"),
+            ),
+            ("https://www.douban.com/note/789/", None),
+        ],
+    )
+    def test_parse(self, url, expected):
+        """Test parsing list sharing URLs"""
+        assert parse_list_url(url) == expected
+
+
+class TestListCatalog:
+    """Test suite for ListCatalog"""
+
+    @pytest.mark.asyncio
+    async def test_discover_incrementally(self, cache):
+        """Test that discovery stops at lists that are known already"""
+        lists_api = FakeListsApi([str(i) for i in range(100)])
+        catalog = ListCatalog(cache, lists_api)
+
+        assert await catalog.discover() == 100
+        assert len(catalog.get_lists()) == 100
+
+        lists_api.ids = [str(i) for i in range(100, 110)] + lists_api.ids
+        lists_api.read = 0
+
+        assert await catalog.discover() == 10
+        assert lists_api.read == 10 + KNOWN_LISTS_TO_STOP
+        assert len(catalog.get_lists()) == 110
+        assert catalog.get_info()["last_discovery"]["new"] == 10
+
+    @pytest.mark.asyncio
+    async def test_discover_limit(self, cache, monkeypatch):
+        """Test that a pass reads at most ten times the lists to bootstrap"""
+        from src import config
+
+        monkeypatch.setattr(config.app_config, "bootstrap_lists_max", 2)
+        catalog = ListCatalog(cache, FakeListsApi([str(i) for i in range(100)]))
+
+        assert await catalog.discover() == 20
+
+    @pytest.mark.asyncio
+    async def test_lists_expire(self, cache, monkeypatch):
+        """Test that lists not seen again drop out after the TTL"""
+        from src import config
+
+        monkeypatch.setattr(config.app_config, "bootstrap_catalog_ttl_seconds", 0.05)
+        catalog = ListCatalog(cache, FakeListsApi(["1"]))
+        await catalog.discover()
+
+        time.sleep(0.1)
+
+        assert await catalog.sample(10) == []
+
+    @pytest.mark.asyncio
+    async def test_sample_and_remove(self, cache):
+        """Test picking and removing lists"""
+        catalog = ListCatalog(cache, FakeListsApi(["1", "2", "3"]))
+        await catalog.discover()
+
+        assert sorted(await catalog.sample(10)) == [
+            ("doulist", "1"),
+            ("doulist", "2"),
+            ("doulist", "3"),
+        ]
+        assert len(await catalog.sample(2)) == 2
+
+        await catalog.remove("doulist", "2")
+
+        assert sorted(catalog.get_lists()) == [("doulist", "1"), ("doulist", "3")]
+
+
+class TestBootstrap:
+    """Test suite for bootstrap"""
+
+    @pytest.mark.asyncio
+    async def test_prunes_lists(self, cache, monkeypatch):
+        """Test that lists that are gone or have no movies are pruned"""
+        from src import config
+
+        monkeypatch.setattr(config.app_config, "bootstrap_list_interval_seconds", 0)
+        request = httpx.Request("GET", "https://m.douban.com/")
+        not_found = httpx.HTTPStatusError(
+            "Not Found", request=request, response=httpx.Response(404, request=request)
+        )
+        doulist_api = FakeListApi(
+            {
+                "1": [{"type": "movie", "url": "https://movie.douban.com/subject/11/"}],
+                "2": [{"type": "tv", "url": "https://movie.douban.com/subject/22/"}],
+                "3": not_found,
+                "4": RuntimeError("temporary"),
+            }
+        )
+        imdb_api = FakeImdbApi()
+        catalog = ListCatalog(cache, FakeListsApi(["1", "2", "3", "4"]))
+
+        await bootstrap(None, doulist_api, imdb_api, catalog)
+
+        assert imdb_api.resolved == ["11"]
+        assert sorted(catalog.get_lists()) == [("doulist", "1"), ("doulist", "4")]
+
+    @pytest.mark.asyncio
+    async def test_resolves_while_fetching(self, cache, monkeypatch):
+        """Test that pages are resolved while the next ones are fetched"""
+        from src import bootstrap as bootstrap_module
+        from src import config
+
+        monkeypatch.setattr(config.app_config, "bootstrap_list_interval_seconds", 0)
+        monkeypatch.setattr(bootstrap_module, "BOOTSTRAP_QUEUE_PAGES", 1)
+        events = []
+
+        class SlowListApi:
+            async def iter_pages(self, id):
+                for page in range(5):
+                    events.append(("fetched", page))
+                    yield [
+                        {
+                            "type": "movie",
+                            "url": f"https://movie.douban.com/subject/{page}/",
+                        }
+                    ]
+                    await asyncio.sleep(0.01)
+
+        class SlowImdbApi(FakeImdbApi):
+            async def get_imdb_id(self, douban_id, item):
+                events.append(("resolved", int(douban_id)))
+                await asyncio.sleep(0.03)
+                return await super().get_imdb_id(douban_id, item)
+
+        imdb_api = SlowImdbApi()
+        catalog = ListCatalog(cache, FakeListsApi(["1"]))
+
+        await bootstrap(None, SlowListApi(), imdb_api, catalog)
+
+        assert imdb_api.resolved == ["0", "1", "2", "3", "4"]
+        # Resolving started before fetching was done...
+        assert events.index(("resolved", 0)) < events.index(("fetched", 4))
+        # ...and fetching never ran more than the queue size ahead.
+        for i, event in enumerate(events):
+            if event[0] == "fetched":
+                resolved = len([_ for _ in events[:i] if _[0] == "resolved"])
+                assert event[1] <= resolved + 2
@@ -0,0 +1,109 @@
+import time
+import pytest
+from diskcache import Cache, FanoutCache
+
+# Import from src package
+from src.bulk_cache import delete_many, read_keys, read_many, write_many
+
+
+@pytest.fixture
+def cache(temp_cache_dir):
+    cache = Cache(temp_cache_dir)
+    yield cache
+    cache.close()
+
+
+class TestBulkCache:
+    """Test suite for bulk cache reads and writes"""
+
+    def test_read_many(self, cache):
+        """Test that cached, unexpired keys are read with their expire time"""
+        cache.set("a", "tt1")
+        cache.set("b", None, expire=100)
+        cache.set("c", "tt3", expire=0.01)
+        time.sleep(0.02)
+
+        result = read_many(cache, ["a", "b", "c", "d"])
+
+        assert result["a"] == ("tt1", None)
+        assert result["b"][0] is None
+        assert result["b"][1] == pytest.approx(time.time() + 100, abs=5)
+        assert "c" not in result
+        assert "d" not in result
+
+    def test_read_many_large(self, cache, monkeypatch):
+        """Test that keys are read in batches"""
+        monkeypatch.setattr("src.bulk_cache.BATCH_SIZE", 3)
+        for i in range(10):
+            cache.set(str(i), f"tt{i}")
+
+        result = read_many(cache, [str(i) for i in range(12)])
+
+        assert result == {str(i): (f"tt{i}", None) for i in range(10)}
+
+    def test_write_many(self, cache):
+        """Test that written entries read back like Cache.set entries"""
+        cache.set("a", "old")
+        expire_time = time.time() + 100
+
+        count = write_many(
+            cache,
+            [("a", "tt1", None), ("b", None, expire_time), ("c", ["x"], None)],
+        )
+
+        assert count == 3
+        assert cache.get("a") == "tt1"
+        assert cache.get("b", default="missing") is None
+        assert cache.get("b", expire_time=True)[1] == pytest.approx(expire_time)
+        assert cache.get("c") == ["x"]
+        assert len(cache) == 3
+        assert cache.check() == []
+
+    def test_write_many_duplicate_keys(self, cache):
+        """Test that the last entry of a key wins"""
+        write_many(cache, [("a", "tt1", None), ("a", "tt2", None)])
+
+        assert cache.get("a") == "tt2"
+        assert len(cache) == 1
+
+    def test_write_many_replaces_file_values(self, cache):
+        """Test that values stored in files are cleaned up when replaced"""
+        cache.set("a", "x" * 100000)
+
+        write_many(cache, [("a", "tt1", None)])
+
+        assert cache.get("a") == "tt1"
+        assert cache.check() == []
+
+    def test_delete_many(self, cache):
+        """Test that keys are deleted"""
+        cache.set("a", 1)
+        cache.set("b", 2)
+
+        delete_many(cache, ["a", "c"])
+
+        assert "a" not in cache
+        assert cache.get("b") == 2
+
+    def test_read_keys(self, cache):
+        """Test that keys are read with their expire time"""
+        cache.set("a", "tt1")
+        cache.set("b", None, expire=100)
+
+        keys = dict(read_keys(cache))
+
+        assert keys["a"] is None
+        assert keys["b"] == pytest.approx(time.time() + 100, abs=5)
+
+    def test_unknown_diskcache_version(self, temp_cache_dir, monkeypatch):
+        """Test that an unknown diskcache version falls back to the public API"""
+        monkeypatch.setattr("src.cache_layout.KNOWN_DISKCACHE_VERSIONS", ())
+        cache = FanoutCache(temp_cache_dir, shards=4)
+        try:
+            count = write_many(cache, [(str(i), f"tt{i}", None) for i in range(10)])
+
+            assert count == 10
+            assert read_many(cache, ["1", "11"]) == {"1": ("tt1", None)}
+            assert sorted(read_keys(cache)) == [(str(i), None) for i in range(10)]
+        finally:
+            cache.close()
@@ -0,0 +1,282 @@
+import fnmatch
+import socket
+import socketserver
+import threading
+import time
+import pytest
+
+# Import from src package
+from src.async_cache import AsyncCache
+from src.bulk_cache import read_keys, read_many, write_many
+from src.cache_backends import (
+    MemoryCache,
+    RedisCache,
+    RedisError,
+    is_shared,
+)
+from src.utils import new_cache
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Serves the Redis commands used by RedisCache from a dict"""
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            self.wfile.write(self.server.execute(args))
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeRedisHandler)
+        self.data = {}
+        self.commands = []
+
+    def get(self, key):
+        value, expire_at = self.data.get(key, (None, None))
+        if expire_at is not None and expire_at <= time.time():
+            self.data.pop(key, None)
+            return None
+        return value
+
+    def execute(self, args):
+        command = args[0].decode().upper()
+        self.commands.append(command)
+        if command in ("AUTH", "SELECT"):
+            return b"+OK\r\n"
+        if command == "SET":
+            expire_at = None
+            if len(args) > 3 and args[3].upper() == b"PX":
+                expire_at = time.time() + int(args[4]) / 1000
+            self.data[args[1]] = (args[2], expire_at)
+            return b"+OK\r\n"
+        if command == "MGET":
+            return encode([self.get(key) for key in args[1:]])
+        if command == "DEL":
+            deleted = [key for key in args[1:] if self.get(key) is not None]
+            for key in deleted:
+                del self.data[key]
+            return b":%d\r\n" % len(deleted)
+        if command == "PTTL":
+            if self.get(args[1]) is None:
+                return b":-2\r\n"
+            expire_at = self.data[args[1]][1]
+            if expire_at is None:
+                return b":-1\r\n"
+            return b":%d\r\n" % int((expire_at - time.time()) * 1000)
+        if command == "SCAN":
+            pattern = args[3].decode().replace("\\", "")
+            keys = [
+                key
+                for key in list(self.data)
+                if self.get(key) is not None
+                and fnmatch.fnmatchcase(key.decode(), pattern)
+            ]
+            return encode([b"0", keys])
+        return b"-ERR unknown command\r\n"
+
+
+def encode(value):
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode(_) for _ in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+@pytest.fixture
+def redis_server():
+    server = FakeRedisServer()
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+    )
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def redis_url(redis_server):
+    host, port = redis_server.server_address
+    return f"redis://:secret@{host}:{port}/1"
+
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request):
+    if request.param == "memory":
+        cache = MemoryCache()
+    else:
+        cache = RedisCache(request.getfixturevalue("redis_url"), "doudarr:imdb:")
+    yield cache
+    cache.close()
+
+
+class TestCacheBackend:
+    """Test suite for the memory and Redis cache backends"""
+
+    def test_get_set(self, backend):
+        """Test reading and writing single keys"""
+        backend.set("1", "tt1")
+        backend.set("2", None, expire=100)
+
+        assert backend.get("1") == "tt1"
+        assert backend.get("2", default="missing") is None
+        assert backend.get("3", default="missing") == "missing"
+        assert backend.get("1", expire_time=True) == ("tt1", None)
+        _, expire_time = backend.get("2", expire_time=True)
+        assert expire_time == pytest.approx(time.time() + 100, abs=5)
+        assert backend.get("3", expire_time=True) == (None, None)
+        assert "1" in backend
+        assert "3" not in backend
+
+    def test_ttl(self, backend):
+        """Test that entries expire"""
+        backend.set("1", "tt1", expire=0.05)
+        assert backend.get("1") == "tt1"
+
+        time.sleep(0.1)
+
+        assert backend.get("1") is None
+        assert "1" not in backend
+        assert len(backend) == 0
+
+    def test_bulk(self, backend):
+        """Test reading and writing many keys at once"""
+        expire_time = time.time() + 100
+
+        count = backend.set_many(
+            [("1", "tt1", None), ("2", ["a"], expire_time), ("3", "x", time.time())]
+        )
+
+        assert count == 3
+        assert backend.get_many(["1", "2", "3", "4"]) == {"1": "tt1", "2": ["a"]}
+        result = backend.get_many(["1", "2"], expire_time=True)
+        assert result["1"] == ("tt1", None)
+        assert result["2"][1] == pytest.approx(expire_time, abs=1)
+        assert backend.delete_many(["1", "4"]) == 1
+        assert sorted(backend) == ["2"]
+
+    def test_pop_delete_clear(self, backend):
+        """Test removing keys"""
+        backend.set_many([(str(i), i, None) for i in range(5)])
+
+        assert backend.pop("0") == 0
+        assert backend.pop("0", default="missing") == "missing"
+        assert backend.delete("1")
+        assert not backend.delete("1")
+        assert len(backend) == 3
+        assert backend.clear() == 3
+        assert len(backend) == 0
+
+    def test_bulk_cache(self, backend):
+        """Test that bulk cache helpers use the backend's bulk operations"""
+        write_many(backend, [("1", "tt1", None), ("2", None, time.time() + 100)])
+
+        assert read_many(backend, ["1", "3"]) == {"1": ("tt1", None)}
+        assert sorted(key for key, _ in read_keys(backend)) == ["1", "2"]
+
+    @pytest.mark.asyncio
+    async def test_async_cache(self, backend):
+        """Test that the async facade uses the backend's bulk operations"""
+        async_cache = AsyncCache(backend)
+
+        await async_cache.set_many([("1", "tt1"), ("2", None)], expire=100)
+
+        assert await async_cache.get_many(["1", "2", "3"]) == {"1": "tt1", "2": None}
+        assert await async_cache.get("1") == "tt1"
+
+
+class TestRedisCache:
+    """Test suite for RedisCache"""
+
+    def test_shared_between_instances(self, redis_url):
+        """Test that writes are seen by other instances right away"""
+        cache = RedisCache(redis_url, "doudarr:imdb:")
+        other = RedisCache(redis_url, "doudarr:imdb:")
+        other_cache = RedisCache(redis_url, "doudarr:collection:")
+
+        cache.set("1", "tt1")
+
+        assert other.get("1") == "tt1"
+        assert other_cache.get("1") is None
+        assert list(other_cache) == []
+        assert is_shared(cache)
+        assert not is_shared(MemoryCache())
+
+    def test_pipelines_bulk_operations(self, redis_url, redis_server):
+        """Test that bulk reads are one MGET per batch"""
+        cache = RedisCache(redis_url, "doudarr:imdb:")
+        cache.set_many([(str(i), i, None) for i in range(10)])
+        redis_server.commands.clear()
+
+        assert len(cache.get_many([str(i) for i in range(10)])) == 10
+
+        assert redis_server.commands == ["MGET"]
+
+    def test_error_reply(self, redis_url, monkeypatch):
+        """Test that error replies are raised"""
+        cache = RedisCache(redis_url, "doudarr:imdb:")
+
+        with pytest.raises(RedisError):
+            cache._execute("FLUSHALL")
+        # The connection is still usable
+        cache.set("1", "tt1")
+        assert cache.get("1") == "tt1"
+
+    def test_reconnects(self, redis_url, redis_server):
+        """Test that a broken connection is replaced on the next call"""
+        cache = RedisCache(redis_url, "doudarr:imdb:")
+        cache.set("1", "tt1")
+        cache.local.connection.sock.shutdown(socket.SHUT_RDWR)
+
+        with pytest.raises(OSError):
+            cache.get("1")
+        assert cache.get("1") == "tt1"
+
+
+class TestNewCache:
+    """Test suite for choosing cache backends"""
+
+    def test_backends(self, temp_cache_dir, redis_url, monkeypatch):
+        """Test that the configured backend is used"""
+        from src import config
+
+        monkeypatch.setattr(config.app_config, "cache_base_dir", temp_cache_dir)
+        monkeypatch.setattr(
+            config.app_config,
+            "cache_backend",
+            {"imdb": "redis", "collection": "memory", "doulist": "unknown"},
+        )
+        monkeypatch.setattr(config.app_config, "redis_url", redis_url)
+
+        assert isinstance(new_cache("imdb"), RedisCache)
+        assert isinstance(new_cache("collection"), MemoryCache)
+        with pytest.raises(ValueError):
+            new_cache("doulist")
+        monkeypatch.setattr(config.app_config, "redis_url", None)
+        with pytest.raises(ValueError):
+            new_cache("imdb")
+
+    @pytest.mark.parametrize(
+        "setting,value",
+        [("cache_size_limit_bytes", 1024), ("cache_eviction_policy", "none")],
+    )
+    def test_rejects_diskcache_settings(self, monkeypatch, setting, value):
+        """Test that diskcache-only settings are rejected for other backends"""
+        from src import config
+
+        monkeypatch.setattr(config.app_config, "cache_backend", {"imdb": "memory"})
+        monkeypatch.setattr(config.app_config, setting, {"imdb": value})
+
+        with pytest.raises(ValueError, match=setting.upper()):
+            new_cache("imdb")
@@ -0,0 +1,127 @@
+import os
+import time
+import pytest
+from diskcache import Cache, FanoutCache
+
+# Import from src package
+from src.async_cache import AsyncCache
+from src.bulk_cache import delete_many, read_keys, read_many, write_many
+from src.cache_layout import MigratingCache, migrating_caches, open_cache
+
+
+@pytest.fixture
+def directory(temp_cache_dir):
+    yield os.path.join(temp_cache_dir, "imdb")
+    migrating_caches.clear()
+
+
+def migrate(cache):
+    while cache.migrate_batch(batch_size=3):
+        pass
+
+
+class TestOpenCache:
+    """Test suite for open_cache"""
+
+    def test_layouts(self, directory):
+        """Test that the shard count picks the cache type"""
+        cache = open_cache(directory, 1)
+        assert isinstance(cache, Cache)
+        cache.close()
+
+        cache = open_cache(directory, 4)
+        assert isinstance(cache, FanoutCache)
+        assert os.path.isdir(os.path.join(directory, "shards-4"))
+        cache.close()
+
+    def test_migration(self, directory):
+        """Test that entries of the old layout are migrated while in use"""
+        legacy = open_cache(directory, 1)
+        for i in range(10):
+            legacy.set(str(i), f"tt{i}")
+        legacy.set("expiring", None, expire=100)
+        legacy.close()
+
+        cache = open_cache(directory, 4)
+
+        assert isinstance(cache, MigratingCache)
+        assert migrating_caches == [cache]
+        assert len(cache) == 11
+        assert cache.get("1") == "tt1"
+        cache.set("1", "tt100")
+        cache.delete("2")
+        assert cache.get("1") == "tt100"
+        assert "2" not in cache
+
+        migrate(cache)
+
+        assert cache.legacies == []
+        assert len(cache.current) == 10
+        assert cache.get("1") == "tt100"
+        assert cache.get("9") == "tt9"
+        _, expire_time = cache.get("expiring", expire_time=True)
+        assert expire_time == pytest.approx(time.time() + 100, abs=5)
+        cache.close()
+
+        cache = open_cache(directory, 4)
+        assert isinstance(cache, FanoutCache)
+        assert len(cache) == 10
+        cache.close()
+
+    def test_migration_between_shard_counts(self, directory):
+        """Test that entries move from one shard count to another"""
+        legacy = open_cache(directory, 2)
+        legacy.set("1", "tt1")
+        legacy.close()
+
+        cache = open_cache(directory, 1)
+        assert cache.get("1") == "tt1"
+        migrate(cache)
+        assert cache.current.get("1") == "tt1"
+        cache.close()
+
+
+class TestShardedBulkCache:
+    """Test suite for bulk cache operations on sharded and migrating caches"""
+
+    @pytest.fixture(params=["sharded", "migrating"])
+    def cache(self, directory, request):
+        if request.param == "migrating":
+            legacy = open_cache(directory, 1)
+            legacy.set("legacy", "tt0")
+            legacy.close()
+        cache = open_cache(directory, 4)
+        yield cache
+        cache.close()
+
+    def test_bulk_operations(self, cache):
+        """Test reading, writing and deleting keys across shards"""
+        keys = [str(i) for i in range(20)]
+
+        write_many(cache, [(key, f"tt{key}", None) for key in keys])
+
+        assert {key: value for key, (value, _) in read_many(cache, keys).items()} == {
+            key: f"tt{key}" for key in keys
+        }
+        assert {key for key, _ in read_keys(cache)} >= set(keys)
+
+        delete_many(cache, keys[:10])
+
+        assert set(read_many(cache, keys)) == set(keys[10:])
+
+    def test_write_many_replaces_legacy_entries(self, cache):
+        """Test that bulk writes win over entries not migrated yet"""
+        write_many(cache, [("legacy", "tt1", None)])
+
+        assert cache.get("legacy") == "tt1"
+        assert read_many(cache, ["legacy"])["legacy"][0] == "tt1"
+
+    @pytest.mark.asyncio
+    async def test_get_many(self, cache):
+        """Test that the async facade reads across shards"""
+        for i in range(20):
+            cache.set(str(i), f"tt{i}")
+
+        result = await AsyncCache(cache).get_many([str(i) for i in range(25)])
+
+        assert result == {str(i): f"tt{i}" for i in range(20)}
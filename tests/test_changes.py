@@ -0,0 +1,159 @@
+import asyncio
+import os
+import time
+import pytest
+from diskcache import Cache
+
+# Import from src package
+from src.changes import ListChangeLog
+from src.indexes import ListMembershipIndex
+
+
+def make_item(douban_id):
+    return {"url": f"https://movie.douban.com/subject/{douban_id}/"}
+
+
+class TestListChangeLog:
+    """Test suite for ListChangeLog class"""
+
+    @pytest.fixture
+    def change_log(self, temp_cache_dir):
+        membership_index = ListMembershipIndex(
+            Cache(os.path.join(temp_cache_dir, "members"))
+        )
+        change_log = ListChangeLog(
+            membership_index, Cache(os.path.join(temp_cache_dir, "changes"))
+        )
+        yield change_log
+        change_log.close()
+        membership_index.close()
+
+    def update(self, change_log, douban_ids):
+        added, removed = change_log.membership_index.update(
+            "doulist:1", [make_item(_) for _ in douban_ids]
+        )
+        change_log.record("doulist:1", added, removed)
+
+    def test_versions(self, change_log):
+        """Test that only fetches that change the members bump the version"""
+        assert change_log.get_version("doulist:1") == 0
+        self.update(change_log, ["1", "2"])
+        self.update(change_log, ["1", "2"])
+        assert change_log.get_version("doulist:1") == 1
+        self.update(change_log, ["1", "3"])
+        assert change_log.get_version("doulist:1") == 2
+
+    def test_changes_since(self, change_log):
+        """Test that the changes after a version are merged"""
+        self.update(change_log, ["1", "2"])
+        self.update(change_log, ["1", "2", "3"])
+        self.update(change_log, ["1", "3", "4"])
+        self.update(change_log, ["1", "2", "4"])
+
+        assert change_log.get_changes("doulist:1", 0) == {
+            "version": 4,
+            "reset": True,
+            "added": ["1", "2", "4"],
+            "removed": [],
+        }
+        # 2 was removed and added back, 3 was added and removed again.
+        assert change_log.get_changes("doulist:1", 1) == {
+            "version": 4,
+            "reset": False,
+            "added": ["4"],
+            "removed": [],
+        }
+        assert change_log.get_changes("doulist:1", 2) == {
+            "version": 4,
+            "reset": False,
+            "added": ["4"],
+            "removed": ["3"],
+        }
+        assert change_log.get_changes("doulist:1", 4)["added"] == []
+
+    def test_backfilled_list(self, change_log):
+        """Test that a list without a history gets all members"""
+        change_log.membership_index.update("doulist:1", [make_item("1")])
+
+        assert change_log.get_changes("doulist:1", 0) == {
+            "version": 0,
+            "reset": True,
+            "added": ["1"],
+            "removed": [],
+        }
+
+    def test_fetch_keeps_history(self, change_log, monkeypatch):
+        """Test that fetches without changes keep the history from expiring"""
+        from src import config
+
+        monkeypatch.setattr(config.app_config, "list_stale_ttl_seconds", 0.05)
+        self.update(change_log, ["1"])
+        for _ in range(3):
+            time.sleep(0.03)
+            self.update(change_log, ["1"])
+
+        assert change_log.get_version("doulist:1") == 1
+
+    def test_expired_history(self, change_log, monkeypatch):
+        """Test that a list whose history expired gets all members"""
+        from src import config
+
+        monkeypatch.setattr(config.app_config, "list_stale_ttl_seconds", 0.01)
+        self.update(change_log, ["1"])
+        self.update(change_log, ["1", "2"])
+        time.sleep(0.02)
+
+        for since in [0, 2]:
+            assert change_log.get_changes("doulist:1", since) == {
+                "version": 0,
+                "reset": True,
+                "added": ["1", "2"],
+                "removed": [],
+            }
+
+    def test_reset(self, change_log, monkeypatch):
+        """Test that versions out of the history get all members"""
+        from src import config
+
+        monkeypatch.setattr(config.app_config, "list_change_history_max", 2)
+        for douban_ids in [["1"], ["1", "2"], ["2", "3"], ["3"]]:
+            self.update(change_log, douban_ids)
+
+        assert change_log.get_changes("doulist:1", 2) == {
+            "version": 4,
+            "reset": False,
+            "added": ["3"],
+            "removed": ["1", "2"],
+        }
+        for since in [0, 1, 5]:
+            assert change_log.get_changes("doulist:1", since) == {
+                "version": 4,
+                "reset": True,
+                "added": ["3"],
+                "removed": [],
+            }
+
+    @pytest.mark.asyncio
+    async def test_watch(self, change_log):
+        """Test that waiters are woken up by changes only"""
+        with change_log.watch("doulist:1") as event:
+            with change_log.watch("doulist:1") as other_event:
+                change_log.on_list_updated("doulist:1", set(), set())
+                assert not event.is_set()
+
+                waiter = asyncio.create_task(event.wait())
+                change_log.on_list_updated("doulist:1", {"1"}, set())
+                await asyncio.wait_for(waiter, 1)
+
+                assert other_event.is_set()
+
+        assert change_log.events == {}
+
+    def test_watch_without_change(self, change_log):
+        """Test that events of waiters that time out are forgotten"""
+        with change_log.watch("doulist:1"):
+            with change_log.watch("doulist:1"):
+                pass
+            assert len(change_log.events["doulist:1"]) == 1
+
+        assert change_log.events == {}
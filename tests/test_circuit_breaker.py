@@ -0,0 +1,100 @@
+import time
+
+# Import from src package
+from src.circuit_breaker import CircuitBreaker
+
+
+class TestCircuitBreaker:
+    """Test suite for CircuitBreaker class"""
+
+    def test_opens_after_threshold(self):
+        """Test that the breaker opens after consecutive failures"""
+        breaker = CircuitBreaker(failure_threshold=2, recovery_seconds=60)
+
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+
+        assert breaker.get_state() == "open"
+        assert not breaker.allow()
+
+    def test_success_resets_failures(self):
+        """Test that a success resets the consecutive failure count"""
+        breaker = CircuitBreaker(failure_threshold=2, recovery_seconds=60)
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        assert breaker.get_state() == "closed"
+
+    def test_half_open_allows_single_probe(self):
+        """Test that only one probe goes through when half-open"""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_seconds=60)
+        breaker.record_failure()
+        breaker.opened_at = time.time() - 61
+
+        assert breaker.get_state() == "half_open"
+        assert breaker.allow()
+        assert not breaker.allow()
+
+    def test_successful_probe_closes(self):
+        """Test that a successful probe closes the breaker"""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_seconds=60)
+        breaker.record_failure()
+        breaker.opened_at = time.time() - 61
+
+        assert breaker.allow()
+        breaker.record_success()
+
+        assert breaker.get_state() == "closed"
+
+    def test_failed_probe_reopens(self):
+        """Test that a failed probe opens the breaker again"""
+        breaker = CircuitBreaker(failure_threshold=3, recovery_seconds=60)
+        for _ in range(3):
+            breaker.record_failure()
+        breaker.opened_at = time.time() - 61
+
+        assert breaker.allow()
+        breaker.record_failure()
+
+        assert breaker.get_state() == "open"
+        assert breaker.get_info()["wait_time"] > 59
+
+    def test_release_returns_probe(self):
+        """Test that a released probe can be taken again"""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_seconds=60)
+        breaker.record_failure()
+        breaker.opened_at = time.time() - 61
+
+        assert breaker.allow()
+        breaker.release()
+
+        assert breaker.allow()
+
+    def test_trip(self):
+        """Test that a tripped breaker is open for the given time"""
+        breaker = CircuitBreaker(failure_threshold=3, recovery_seconds=60)
+
+        breaker.trip(120)
+
+        assert breaker.get_state() == "open"
+        assert 119 <= breaker.get_wait_time() <= 120
+        breaker.opened_at = time.time() - 121
+        assert breaker.allow()
+        breaker.record_success()
+        breaker.trip()
+        assert 59 <= breaker.get_wait_time() <= 60
+
+    def test_probe_timeout(self):
+        """Test that a probe in flight for too long is given up"""
+        breaker = CircuitBreaker(
+            failure_threshold=1, recovery_seconds=60, probe_timeout_seconds=30
+        )
+        breaker.trip(0)
+
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.probe_time = time.time() - 31
+        assert breaker.allow()
@@ -0,0 +1,119 @@
+import asyncio
+import pytest
+
+# Import from src package
+from src.deadline import (
+    Deadline,
+    DeadlineExceededError,
+    check_deadline,
+    current_deadline,
+    deadline_scope,
+    run_with_deadline,
+)
+
+
+class TestDeadline:
+    """Test suite for Deadline class"""
+
+    @pytest.mark.asyncio
+    async def test_run_within_deadline(self):
+        """Test that work finishing in time returns its result"""
+        deadline = Deadline(1)
+
+        async def work():
+            await asyncio.sleep(0.01)
+            return "done"
+
+        assert await deadline.run(work()) == "done"
+        assert 0 < deadline.get_remaining() <= 1
+
+    @pytest.mark.asyncio
+    async def test_run_cancels_late_work(self):
+        """Test that work still running at the deadline is cancelled"""
+        deadline = Deadline(0.05)
+        cancelled = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with pytest.raises(DeadlineExceededError):
+            await deadline.run(work())
+        await asyncio.sleep(0)
+        assert cancelled.is_set()
+        assert deadline.is_expired()
+
+    @pytest.mark.asyncio
+    async def test_run_keeps_shielded_work(self):
+        """Test that shielded work goes on after the deadline"""
+        deadline = Deadline(0.05)
+        task = asyncio.create_task(asyncio.sleep(0.1, result="done"))
+
+        with pytest.raises(DeadlineExceededError):
+            await deadline.run(asyncio.shield(task))
+        assert await task == "done"
+
+    @pytest.mark.asyncio
+    async def test_expire_stops_waiting(self):
+        """Test that an expired deadline stops waiting right away"""
+        deadline = Deadline(None)
+        assert deadline.get_remaining() is None
+
+        asyncio.get_running_loop().call_later(0.01, deadline.expire)
+        with pytest.raises(DeadlineExceededError):
+            await deadline.run(asyncio.sleep(10))
+
+        # Work isn't started at all after the deadline.
+        with pytest.raises(DeadlineExceededError):
+            await deadline.run(asyncio.sleep(0))
+
+    @pytest.mark.asyncio
+    async def test_run_propagates_errors(self):
+        """Test that errors of the work are raised as is"""
+        deadline = Deadline(1)
+
+        async def work():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            await deadline.run(work())
+
+
+class TestDeadlineScope:
+    """Test suite for deadline_scope and helpers"""
+
+    @pytest.mark.asyncio
+    async def test_no_deadline(self):
+        """Test that helpers do nothing outside a deadline scope"""
+        assert current_deadline.get() is None
+        check_deadline(100)
+        assert await run_with_deadline(asyncio.sleep(0, result=1)) == 1
+
+    @pytest.mark.asyncio
+    async def test_check_deadline(self):
+        """Test that check_deadline fails if the delay doesn't fit"""
+        async with deadline_scope(1):
+            check_deadline(0.5)
+            with pytest.raises(DeadlineExceededError):
+                check_deadline(2)
+        assert current_deadline.get() is None
+
+    @pytest.mark.asyncio
+    async def test_disconnect_expires_deadline(self, monkeypatch):
+        """Test that the deadline runs out when the client disconnects"""
+        monkeypatch.setattr("src.deadline.DISCONNECT_POLL_SECONDS", 0.01)
+        disconnected = False
+
+        async def is_disconnected():
+            return disconnected
+
+        async with deadline_scope(None, is_disconnected) as deadline:
+            await asyncio.sleep(0.02)
+            assert not deadline.is_expired()
+            disconnected = True
+            with pytest.raises(DeadlineExceededError):
+                await run_with_deadline(asyncio.sleep(10))
+            assert deadline.is_expired()
@@ -1,14 +1,45 @@
+import asyncio
+import re
+import threading
+import time
 import pytest
 import httpx
+from contextlib import asynccontextmanager
 from unittest.mock import Mock, patch
 
 # Import from src package
 from src.imdb import (
     ImdbApi,
+    ImdbIdScanner,
+    ImdbResolverChain,
+    ImdbResolverUnavailableError,
     DoubanHtmlImdbApi,
     DoubanIDatabaseImdbApi,
     get_imdb_api,
 )
+from src.throttler import RateLimitedError
+
+
+def mock_stream_response(chunks):
+    """Creates a replacement for `stream_response` yielding the given chunks"""
+    consumed = []
+
+    @asynccontextmanager
+    async def _stream_response(client, url):
+        response = Mock()
+
+        async def aiter_text():
+            for chunk in chunks:
+                consumed.append(chunk)
+                response.num_bytes_downloaded += len(chunk.encode())
+                yield chunk
+
+        response.num_bytes_downloaded = 0
+        response.aiter_text = aiter_text
+        yield response
+
+    _stream_response.consumed = consumed
+    return _stream_response
 
 
 class TestImdbApiBase:
@@ -42,6 +73,8 @@ class TestImdbApiBase:
         assert result == "tt1234567"
         # Check it's cached
         assert mock_imdb_api.cache.get("1292052") == "tt1234567"
+        # Check it's in the reverse index
+        assert mock_imdb_api.reverse_index.get_douban_ids("tt1234567") == ["1292052"]
 
     @pytest.mark.asyncio
     async def test_get_imdb_id_cached(self, mock_imdb_api, mock_douban_item):
@@ -54,6 +87,46 @@ class TestImdbApiBase:
         # Should return cached value, not fetch new one
         assert result == "tt7654321"
 
+    @pytest.mark.asyncio
+    async def test_store_listeners_run_off_the_loop(
+        self, mock_imdb_api, mock_douban_item
+    ):
+        """Test that store listeners are called in the cache executor"""
+        calls = []
+        mock_imdb_api.store_listeners.append(
+            lambda *args: calls.append((*args, threading.current_thread()))
+        )
+
+        await mock_imdb_api.get_imdb_id("1", mock_douban_item)
+
+        assert calls[0][:2] == ("1", "tt1234567")
+        assert calls[0][2] is not threading.main_thread()
+
+    @pytest.mark.asyncio
+    async def test_get_imdb_id_reads_keys_written_elsewhere(
+        self, mock_imdb_api, mock_douban_item
+    ):
+        """Test that keys written after the key filter was built are not refetched"""
+        mock_imdb_api.key_filter.build(mock_imdb_api.cache)
+        # Like the resolve CLI or another instance would.
+        mock_imdb_api.cache.set("1", "tt7654321")
+
+        assert await mock_imdb_api.get_imdb_id("1", mock_douban_item) == "tt7654321"
+        assert await mock_imdb_api.get_cached_imdb_ids(["1"]) == {"1": "tt7654321"}
+
+    @pytest.mark.asyncio
+    async def test_get_uncached_douban_ids(self, mock_imdb_api):
+        """Test finding uncached IDs with and without the key filter"""
+        mock_imdb_api.cache.set("1", "tt1")
+        mock_imdb_api.cache.set("2", None, expire=100)
+
+        assert await mock_imdb_api.get_uncached_douban_ids(["1", "2", "3"]) == ["3"]
+
+        mock_imdb_api.key_filter.build(mock_imdb_api.cache)
+        mock_imdb_api.cache.close()
+
+        assert await mock_imdb_api.get_uncached_douban_ids(["1", "2", "3"]) == ["3"]
+
     @pytest.mark.asyncio
     async def test_get_imdb_id_not_found_cached_with_ttl(
         self, temp_cache_dir, mock_douban_item, monkeypatch
@@ -111,15 +184,13 @@ class TestDoubanHtmlImdbApi:
         </html>
         """
 
-        with patch("src.imdb.get_response") as mock_get_response:
-            mock_response = Mock()
-            mock_response.text = html_content
-            mock_get_response.return_value = mock_response
-
+        stream = mock_stream_response([html_content])
+        with patch("src.imdb.stream_response", stream):
             result = await html_api.fetch_imdb_id("1292052", mock_douban_item)
 
             assert result == "tt0111161"
-            mock_get_response.assert_called_once()
+            assert html_api.get_info()["lookups"] == 1
+            assert html_api.get_info()["last_bytes_read"] == len(html_content)
 
     @pytest.mark.asyncio
     async def test_fetch_imdb_id_not_found(self, html_api, mock_douban_item):
@@ -130,30 +201,94 @@ class TestDoubanHtmlImdbApi:
         </html>
         """
 
-        with patch("src.imdb.get_response") as mock_get_response:
-            mock_response = Mock()
-            mock_response.text = html_content
-            mock_get_response.return_value = mock_response
+        with patch("src.imdb.stream_response", mock_stream_response([html_content])):
+            result = await html_api.fetch_imdb_id("1292052", mock_douban_item)
+
+            assert result is None
+
+    @pytest.mark.asyncio
+    async def test_fetch_imdb_id_stops_reading_after_match(
+        self, html_api, mock_douban_item
+    ):
+        """Test that the rest of the page is not read once the ID is found"""
+        chunks = [
+            '<div id="info">\n<span class="pl">IMDb:</span> tt01',
+            "11161<br>\n",
+            "<p>comments</p>\n" * 100,
+            "<p>more comments</p>\n" * 100,
+        ]
+
+        stream = mock_stream_response(chunks)
+        with patch("src.imdb.stream_response", stream):
+            result = await html_api.fetch_imdb_id("1292052", mock_douban_item)
+
+            assert result == "tt0111161"
+            assert stream.consumed == chunks[:2]
+
+    @pytest.mark.asyncio
+    async def test_fetch_imdb_id_stops_reading_after_info_block(
+        self, html_api, mock_douban_item
+    ):
+        """Test that the rest of the page is not read once the info block ends"""
+        chunks = [
+            '<div id="info">\n<span class="pl">导演</span>\n',
+            "</div>\n",
+            "<p>comments</p>\n" * 100,
+        ]
 
+        stream = mock_stream_response(chunks)
+        with patch("src.imdb.stream_response", stream):
             result = await html_api.fetch_imdb_id("1292052", mock_douban_item)
 
             assert result is None
+            assert stream.consumed == chunks[:2]
 
     @pytest.mark.asyncio
     async def test_fetch_imdb_id_with_delay(self, html_api, mock_douban_item):
         """Test that random delay is applied"""
-        with patch("src.imdb.get_response") as mock_get_response:
+        with patch(
+            "src.imdb.stream_response", mock_stream_response(["IMDb: tt1234567"])
+        ):
             with patch("src.imdb.asyncio.sleep") as mock_sleep:
-                mock_response = Mock()
-                mock_response.text = "IMDb: tt1234567"
-                mock_get_response.return_value = mock_response
-
                 await html_api.fetch_imdb_id("1292052", mock_douban_item)
 
                 # Verify sleep was called
                 mock_sleep.assert_called_once()
 
 
+class TestImdbIdScanner:
+    """Test suite for ImdbIdScanner"""
+
+    @pytest.fixture
+    def scanner(self):
+        return ImdbIdScanner(re.compile(r"IMDb:.*?(\btt\d+\b)"))
+
+    @pytest.mark.parametrize("split_at", range(1, 40))
+    def test_match_split_across_chunks(self, scanner, split_at):
+        """Test that a match split at any position is found"""
+        text = '<span class="pl">IMDb:</span> tt0111161<br>\n'
+        scanner.feed(text[:split_at])
+        scanner.feed(text[split_at:])
+
+        assert scanner.done
+        assert scanner.close() == "tt0111161"
+
+    def test_partial_id_at_end_of_chunk_is_not_matched(self, scanner):
+        """Test that a truncated ID at the end of a chunk is not reported"""
+        assert not scanner.feed("IMDb: tt011")
+        assert not scanner.feed("1161")
+
+        assert scanner.close() == "tt0111161"
+
+    def test_done_after_info_block(self, scanner):
+        """Test that scanning ends when the info block closes"""
+        assert not scanner.feed("<html>\n<div>header</div>\n")
+        assert not scanner.feed('<div id="info">\n<span>导演</span>\n')
+        assert scanner.feed("</div>\n")
+
+        assert scanner.close() is None
+
+
 class TestDoubanIDatabaseImdbApi:
     """Test suite for DoubanIDatabaseImdbApi"""
 
@@ -300,11 +435,255 @@ class TestDoubanIDatabaseImdbApi:
         assert database_api.client.timeout.read == 10
 
 
+class TestImdbResolverChain:
+    """Test suite for ImdbResolverChain"""
+
+    @pytest.fixture
+    def chain(self, temp_cache_dir, monkeypatch):
+        """Provides a chain of douban-idatabase and HTML resolvers"""
+        from src import config
+
+        monkeypatch.setattr(config.app_config, "cache_base_dir", temp_cache_dir)
+        monkeypatch.setattr(
+            config.app_config, "douban_idatabase_url", "http://test-db:8000"
+        )
+        monkeypatch.setattr(config.app_config, "imdb_resolver_failure_threshold", 2)
+        monkeypatch.setattr(config.app_config, "imdb_resolver_recovery_seconds", 60)
+        monkeypatch.setattr(
+            config.app_config, "imdb_resolver_timeout_seconds", {"douban_html": 0.5}
+        )
+
+        chain = ImdbResolverChain(["douban_idatabase", "douban_html"])
+        yield chain
+        chain.cache.close()
+
+    def _mock_fetch(self, monkeypatch, resolver, side_effect):
+        calls = []
+
+        async def fetch_imdb_id(douban_id, douban_item):
+            calls.append(douban_id)
+            return await side_effect()
+
+        monkeypatch.setattr(resolver.api, "fetch_imdb_id", fetch_imdb_id)
+        return calls
+
+    @pytest.mark.asyncio
+    async def test_first_hit_wins(self, chain, mock_douban_item, monkeypatch):
+        """Test that later resolvers are not called after a hit"""
+
+        async def hit():
+            return "tt0111161"
+
+        async def unexpected():
+            raise AssertionError("should not be called")
+
+        self._mock_fetch(monkeypatch, chain.resolvers[0], hit)
+        self._mock_fetch(monkeypatch, chain.resolvers[1], unexpected)
+
+        result = await chain.get_imdb_id("1292052", mock_douban_item)
+
+        assert result == "tt0111161"
+        info = chain.get_info()["resolvers"]
+        assert info["douban_idatabase"]["hits"] == 1
+        assert info["douban_html"]["calls"] == 0
+
+    @pytest.mark.asyncio
+    async def test_falls_back_on_miss(self, chain, mock_douban_item, monkeypatch):
+        """Test that a miss falls through to the next resolver"""
+
+        async def miss():
+            return None
+
+        async def hit():
+            return "tt0111161"
+
+        self._mock_fetch(monkeypatch, chain.resolvers[0], miss)
+        self._mock_fetch(monkeypatch, chain.resolvers[1], hit)
+
+        result = await chain.get_imdb_id("1292052", mock_douban_item)
+
+        assert result == "tt0111161"
+        info = chain.get_info()["resolvers"]
+        assert info["douban_idatabase"]["misses"] == 1
+        assert info["douban_html"]["hits"] == 1
+        assert info["douban_html"]["hit_rate"] == 1
+
+    @pytest.mark.asyncio
+    async def test_error_is_not_cached_as_not_found(
+        self, chain, mock_douban_item, monkeypatch
+    ):
+        """Test that failures in every resolver raise instead of missing"""
+
+        async def error():
+            raise httpx.ConnectError("boom")
+
+        self._mock_fetch(monkeypatch, chain.resolvers[0], error)
+        self._mock_fetch(monkeypatch, chain.resolvers[1], error)
+
+        with pytest.raises(httpx.ConnectError):
+            await chain.get_imdb_id("1292052", mock_douban_item)
+
+        assert chain.cache.get("1292052", default="not_cached") == "not_cached"
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "error",
+        [httpx.ConnectError("boom"), RateLimitedError("limited", "douban.com", 60)],
+    )
+    @pytest.mark.parametrize("miss_first", [False, True])
+    async def test_miss_with_error_is_cached_briefly(
+        self, chain, mock_douban_item, monkeypatch, error, miss_first
+    ):
+        """Test that a miss is only cached briefly when another resolver failed"""
+        from src import config
+
+        monkeypatch.setattr(
+            config.app_config, "imdb_cache_ttl_id_unconfirmed_not_found_seconds", 100
+        )
+
+        async def fail():
+            raise error
+
+        async def miss():
+            return None
+
+        first, second = (miss, fail) if miss_first else (fail, miss)
+        self._mock_fetch(monkeypatch, chain.resolvers[0], first)
+        self._mock_fetch(monkeypatch, chain.resolvers[1], second)
+
+        assert await chain.get_imdb_id("1292052", mock_douban_item) is None
+        value, expire_time = chain.cache.get("1292052", expire_time=True)
+        assert value is None
+        assert expire_time == pytest.approx(time.time() + 100, abs=5)
+
+    @pytest.mark.asyncio
+    async def test_miss_with_skipped_resolver_is_cached_briefly(
+        self, chain, mock_douban_item, monkeypatch
+    ):
+        """Test that a miss is only cached briefly when a breaker skipped one"""
+        from src import config
+
+        monkeypatch.setattr(
+            config.app_config, "imdb_cache_ttl_id_unconfirmed_not_found_seconds", 100
+        )
+
+        async def miss():
+            return None
+
+        self._mock_fetch(monkeypatch, chain.resolvers[0], miss)
+        calls = self._mock_fetch(monkeypatch, chain.resolvers[1], miss)
+        chain.resolvers[1].breaker.trip()
+
+        assert await chain.get_imdb_id("1292052", mock_douban_item) is None
+        assert calls == []
+        _, expire_time = chain.cache.get("1292052", expire_time=True)
+        assert expire_time == pytest.approx(time.time() + 100, abs=5)
+
+    @pytest.mark.asyncio
+    async def test_miss_of_every_resolver(self, chain, mock_douban_item, monkeypatch):
+        """Test that a miss of every resolver is cached as not found"""
+        from src import config
+
+        monkeypatch.setattr(
+            config.app_config, "imdb_cache_ttl_id_not_found_seconds", 3600
+        )
+
+        async def miss():
+            return None
+
+        self._mock_fetch(monkeypatch, chain.resolvers[0], miss)
+        self._mock_fetch(monkeypatch, chain.resolvers[1], miss)
+
+        assert await chain.get_imdb_id("1292052", mock_douban_item) is None
+        _, expire_time = chain.cache.get("1292052", expire_time=True)
+        assert expire_time == pytest.approx(time.time() + 3600, abs=5)
+
+    @pytest.mark.asyncio
+    async def test_timeout(self, chain, mock_douban_item, monkeypatch):
+        """Test that the per-resolver timeout is applied"""
+
+        async def error():
+            raise httpx.ConnectError("boom")
+
+        async def slow():
+            await asyncio.sleep(10)
+
+        self._mock_fetch(monkeypatch, chain.resolvers[0], error)
+        self._mock_fetch(monkeypatch, chain.resolvers[1], slow)
+
+        with pytest.raises(asyncio.TimeoutError):
+            await chain.fetch_imdb_id("1292052", mock_douban_item)
+
+        assert chain.get_info()["resolvers"]["douban_html"]["timeouts"] == 1
+
+    @pytest.mark.asyncio
+    async def test_circuit_breaker_skips_failing_resolver(
+        self, chain, mock_douban_item, monkeypatch
+    ):
+        """Test that a resolver is skipped once its breaker opens"""
+
+        async def error():
+            raise httpx.ConnectError("boom")
+
+        async def hit():
+            return "tt0111161"
+
+        calls = self._mock_fetch(monkeypatch, chain.resolvers[0], error)
+        self._mock_fetch(monkeypatch, chain.resolvers[1], hit)
+
+        for _ in range(3):
+            assert await chain.fetch_imdb_id("1", mock_douban_item) == "tt0111161"
+
+        assert len(calls) == 2
+        info = chain.get_info()["resolvers"]["douban_idatabase"]
+        assert info["circuit_breaker"]["state"] == "open"
+        assert info["rejected"] == 1
+
+    @pytest.mark.asyncio
+    async def test_all_resolvers_unavailable(
+        self, chain, mock_douban_item, monkeypatch
+    ):
+        """Test that nothing is cached when every breaker is open"""
+        for resolver in chain.resolvers:
+            resolver.breaker.opened_at = time.time()
+
+        with pytest.raises(ImdbResolverUnavailableError):
+            await chain.get_imdb_id("1292052", mock_douban_item)
+
+        assert chain.cache.get("1292052", default="not_cached") == "not_cached"
+
+    @pytest.mark.asyncio
+    async def test_hedged_request(self, chain, mock_douban_item, monkeypatch):
+        """Test that the next resolver is started when the first one is slow"""
+        chain.hedge_delay_seconds = 0.01
+
+        async def slow():
+            await asyncio.sleep(10)
+
+        async def hit():
+            return "tt0111161"
+
+        self._mock_fetch(monkeypatch, chain.resolvers[0], slow)
+        self._mock_fetch(monkeypatch, chain.resolvers[1], hit)
+
+        result = await asyncio.wait_for(
+            chain.fetch_imdb_id("1292052", mock_douban_item), 1
+        )
+
+        assert result == "tt0111161"
+
+
 class TestGetImdbApi:
     """Test suite for get_imdb_api factory function"""
 
+    @pytest.fixture(autouse=True)
+    def cache_base_dir(self, temp_cache_dir, monkeypatch):
+        from src import config
+
+        monkeypatch.setattr(config.app_config, "cache_base_dir", temp_cache_dir)
+
     def test_returns_database_api_when_url_configured(self, monkeypatch):
-        """Test that DoubanIDatabaseImdbApi is returned when URL is configured"""
+        """Test that DoubanIDatabaseImdbApi is used when URL is configured"""
         from src import config
 
         monkeypatch.setattr(
@@ -315,30 +694,57 @@ class TestGetImdbApi:
 
         api = get_imdb_api()
 
-        assert isinstance(api, DoubanIDatabaseImdbApi)
+        assert isinstance(api, ImdbResolverChain)
+        assert [type(r.api) for r in api.resolvers] == [DoubanIDatabaseImdbApi]
         api.cache.close()
         # api.client.close() # Skip closing async client
 
     def test_returns_html_api_when_url_not_configured(self, monkeypatch):
-        """Test that DoubanHtmlImdbApi is returned when URL is not configured"""
+        """Test that DoubanHtmlImdbApi is used when URL is not configured"""
         from src import config
 
         monkeypatch.setattr(config.app_config, "douban_idatabase_url", None)
 
         api = get_imdb_api()
 
-        assert isinstance(api, DoubanHtmlImdbApi)
+        assert [type(r.api) for r in api.resolvers] == [DoubanHtmlImdbApi]
         api.cache.close()
         # api.client.close() # Skip closing async client
 
     def test_returns_html_api_when_url_empty_string(self, monkeypatch):
-        """Test that DoubanHtmlImdbApi is returned when URL is empty string"""
+        """Test that DoubanHtmlImdbApi is used when URL is empty string"""
         from src import config
 
         monkeypatch.setattr(config.app_config, "douban_idatabase_url", "")
 
         api = get_imdb_api()
 
-        assert isinstance(api, DoubanHtmlImdbApi)
+        assert [type(r.api) for r in api.resolvers] == [DoubanHtmlImdbApi]
         api.cache.close()
         # api.client.close() # Skip closing async client
+
+    def test_configured_resolver_order(self, monkeypatch):
+        """Test that the configured resolver order is used"""
+        from src import config
+
+        monkeypatch.setattr(
+            config.app_config, "douban_idatabase_url", "http://test-db:8000"
+        )
+        monkeypatch.setattr(
+            config.app_config, "imdb_resolvers", ["douban_idatabase", "douban_html"]
+        )
+
+        api = get_imdb_api()
+
+        assert [r.name for r in api.resolvers] == ["douban_idatabase", "douban_html"]
+        assert api.resolvers[0].api.cache is api.cache
+        api.cache.close()
+
+    def test_unknown_resolver(self, monkeypatch):
+        """Test that an unknown resolver name is rejected"""
+        from src import config
+
+        monkeypatch.setattr(config.app_config, "imdb_resolvers", ["unknown"])
+
+        with pytest.raises(ValueError):
+            get_imdb_api()
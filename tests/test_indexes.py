@@ -0,0 +1,149 @@
+import os
+import pytest
+from diskcache import Cache
+
+# Import from src package
+from src.indexes import ImdbReverseIndex, ListMembershipIndex
+from src.sync import merge_imdb_items
+
+
+def make_item(douban_id):
+    return {"url": f"https://movie.douban.com/subject/{douban_id}/"}
+
+
+class TestImdbReverseIndex:
+    """Test suite for ImdbReverseIndex class"""
+
+    @pytest.fixture
+    def index(self, temp_cache_dir):
+        index = ImdbReverseIndex(Cache(os.path.join(temp_cache_dir, "reverse")))
+        yield index
+        index.close()
+
+    def test_add(self, index):
+        """Test that several Douban IDs can map to one IMDb ID"""
+        index.add("2", "tt0000001")
+        index.add("1", "tt0000001")
+        index.add("1", "tt0000001")
+
+        assert index.get_douban_ids("tt0000001") == ["1", "2"]
+        assert index.get_douban_ids("tt0000002") == []
+
+    def test_mapping_change(self, index):
+        """Test that a changed mapping is removed from the old IMDb ID"""
+        index.add("1", "tt0000001")
+        index.add("1", "tt0000002", old_imdb_id="tt0000001")
+
+        assert index.get_douban_ids("tt0000001") == []
+        assert index.get_douban_ids("tt0000002") == ["1"]
+
+    def test_rebuild(self, index, temp_cache_dir):
+        """Test that the index can be rebuilt from an IMDb cache"""
+        imdb_cache = Cache(os.path.join(temp_cache_dir, "imdb"))
+        imdb_cache.set("1", "tt0000001")
+        imdb_cache.set("2", None, expire=3600)
+        index.add("3", "tt0000003")
+
+        index.rebuild(imdb_cache)
+
+        assert index.get_douban_ids("tt0000001") == ["1"]
+        assert index.get_douban_ids("tt0000003") == []
+        imdb_cache.close()
+
+    def test_prune(self, index, temp_cache_dir):
+        """Test that Douban IDs no longer cached with their IMDb ID are dropped"""
+        imdb_cache = Cache(os.path.join(temp_cache_dir, "imdb"))
+        imdb_cache.set("1", "tt0000001")
+        imdb_cache.set("3", "tt0000002")
+        index.add("1", "tt0000001")
+        index.add("2", "tt0000001")
+        index.add("3", "tt0000002")
+
+        assert index.prune(imdb_cache) == 1
+
+        assert index.get_douban_ids("tt0000001") == ["1"]
+        assert index.get_douban_ids("tt0000002") == ["3"]
+        imdb_cache.close()
+
+    def test_updated_by_merge(self, index, temp_cache_dir):
+        """Test that synced items are recorded in the index"""
+        imdb_cache = Cache(os.path.join(temp_cache_dir, "imdb"))
+        imdb_cache.set("1", None, expire=3600)
+
+        merge_imdb_items(
+            imdb_cache,
+            [
+                {"key": "1", "value": "tt0000001", "expire_time": None},
+                {"key": "2", "value": None, "expire_time": None},
+            ],
+            index,
+        )
+
+        assert index.get_douban_ids("tt0000001") == ["1"]
+        assert len(index.cache) == 1
+        imdb_cache.close()
+
+    def test_add_many(self, index):
+        """Test that many entries are added and moved at once"""
+        index.add("1", "tt0000001")
+
+        index.add_many(
+            [
+                ("1", "tt0000002", "tt0000001"),
+                ("2", "tt0000002", None),
+                ("3", None, None),
+                ("4", "tt0000004", None),
+            ]
+        )
+
+        assert index.get_douban_ids("tt0000001") == []
+        assert "tt0000001" not in index.cache
+        assert index.get_douban_ids("tt0000002") == ["1", "2"]
+        assert index.get_douban_ids("tt0000004") == ["4"]
+
+
+class TestListMembershipIndex:
+    """Test suite for ListMembershipIndex class"""
+
+    @pytest.fixture
+    def index(self, temp_cache_dir):
+        index = ListMembershipIndex(Cache(os.path.join(temp_cache_dir, "members")))
+        yield index
+        index.close()
+
+    def test_update(self, index):
+        """Test that subjects are mapped to the lists containing them"""
+        index.update("collection:a", [make_item("1"), make_item("2")])
+        index.update("doulist:b", [make_item("2")])
+
+        assert index.get_lists("1") == ["collection:a"]
+        assert index.get_lists("2") == ["collection:a", "doulist:b"]
+        assert index.get_members("collection:a") == ["1", "2"]
+
+    def test_update_returns_changes(self, index):
+        """Test that updating a list only touches changed subjects"""
+        index.update("collection:a", [make_item("1"), make_item("2")])
+
+        added, removed = index.update("collection:a", [make_item("2"), make_item("3")])
+
+        assert added == {"3"}
+        assert removed == {"1"}
+        assert index.get_lists("1") == []
+        assert index.get_lists("3") == ["collection:a"]
+
+    def test_remove(self, index):
+        """Test that a removed list is forgotten by its subjects"""
+        index.update("collection:a", [make_item("1"), make_item("2")])
+        index.update("doulist:b", [make_item("2")])
+
+        index.remove("collection:a")
+
+        assert index.get_list_keys() == ["doulist:b"]
+        assert index.get_lists("1") == []
+        assert index.get_lists("2") == ["doulist:b"]
+        assert index.get_members("collection:a") == []
+
+    def test_is_empty(self, index):
+        assert index.is_empty()
+        index.update("collection:a", [make_item("1")])
+        assert not index.is_empty()
@@ -0,0 +1,105 @@
+import pytest
+
+# Import from src package
+from src.list_index import ListIndex, get_genres, get_year
+
+
+def make_item(douban_id, rating=None, year=None, genres="剧情", type="movie"):
+    item = {
+        "title": f"Movie {douban_id}",
+        "url": f"https://movie.douban.com/subject/{douban_id}/",
+        "type": type,
+        "card_subtitle": f"{year or ''} / 美国 / {genres} / 导演",
+    }
+    if rating is not None:
+        item["rating"] = {"value": rating}
+    return item
+
+
+def ids(entries):
+    return [entry["url"].split("/")[-2] for entry in entries]
+
+
+class TestItemFields:
+    """Test suite for item field extraction"""
+
+    def test_get_year(self):
+        assert get_year({"year": "1994"}) == 1994
+        assert get_year({"card_subtitle": "1994 / 美国 / 剧情"}) == 1994
+        assert get_year({"title": "x"}) is None
+
+    def test_get_genres(self):
+        assert get_genres({"genres": ["剧情"]}) == ["剧情"]
+        assert get_genres({"card_subtitle": "1994 / 美国 / 剧情 犯罪 / x"}) == [
+            "剧情",
+            "犯罪",
+        ]
+        assert get_genres({"card_subtitle": "1994"}) == []
+
+
+class TestListIndex:
+    """Test suite for ListIndex class"""
+
+    @pytest.fixture
+    def index(self):
+        return ListIndex(
+            [
+                make_item("1", 8.5, 1994, "剧情 犯罪"),
+                make_item("2", 9.0, 2001, "动画"),
+                make_item("3", 7.0, 2010, "剧情"),
+                make_item("4", None, 2020, "剧情"),
+                make_item("5", 8.5, 1980, "喜剧"),
+                make_item("6", 9.5, 2000, "剧情", type="tv"),
+            ]
+        )
+
+    def test_keeps_only_movies(self, index):
+        assert len(index) == 5
+        assert ids(index.query()) == ["1", "2", "3", "4", "5"]
+
+    def test_min_rating_keeps_list_order(self, index):
+        assert ids(index.query(min_rating=8.5)) == ["1", "2", "5"]
+
+    def test_top(self, index):
+        """Test that top returns the best rated matches in rating order"""
+        assert ids(index.query(top=2)) == ["2", "1"]
+        assert ids(index.query(top=10, min_rating=8)) == ["2", "1", "5"]
+
+    def test_top_with_offset(self, index):
+        assert ids(index.query(top=3, offset=1)) == ["1", "5"]
+        assert ids(index.query(top=3, offset=1, limit=1)) == ["1"]
+
+    def test_year_range(self, index):
+        assert ids(index.query(year_from=1990, year_to=2010)) == ["1", "2", "3"]
+        assert ids(index.query(year_to=1990)) == ["5"]
+
+    def test_genre(self, index):
+        assert ids(index.query(genre="剧情")) == ["1", "3", "4"]
+        assert ids(index.query(genre="科幻")) == []
+
+    def test_combined_filters(self, index):
+        assert ids(index.query(genre="剧情", min_rating=8)) == ["1"]
+        assert ids(index.query(genre="剧情", year_from=2000, top=1)) == ["3"]
+
+    def test_offset_and_limit(self, index):
+        assert ids(index.query(offset=1, limit=2)) == ["2", "3"]
+        assert ids(index.query(offset=10)) == []
+
+    def test_top_does_not_walk_lower_rated_entries(self):
+        """Test that a top-N query stops after N matches"""
+        index = ListIndex([make_item(str(i), 5 + i / 1000) for i in range(5000)])
+        walked = []
+        original = index.entries.__class__.__getitem__
+
+        class Entries(list):
+            def __getitem__(self, i):
+                walked.append(i)
+                return original(self, i)
+
+        index.entries = Entries(index.entries)
+
+        result = index.query(top=50, min_rating=8.0)
+
+        assert ids(result)[0] == "4999"
+        assert len(result) == 50
+        assert len(walked) == 50
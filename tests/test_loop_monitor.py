@@ -0,0 +1,77 @@
+import asyncio
+import time
+import pytest
+
+# Import from src package
+from src.loop_monitor import LoopMonitor
+
+
+def block_loop(seconds):
+    time.sleep(seconds)
+
+
+async def run_monitor(monitor, work):
+    task = asyncio.create_task(monitor.run())
+    try:
+        await asyncio.sleep(0.05)
+        await work()
+        await asyncio.sleep(0.05)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+class TestLoopMonitor:
+    """Test suite for LoopMonitor class"""
+
+    @pytest.mark.asyncio
+    async def test_measures_lag(self):
+        """Test that lag stays low while the loop is free"""
+        monitor = LoopMonitor(interval_seconds=0.01, block_threshold_seconds=0.1)
+
+        async def work():
+            await asyncio.sleep(0.1)
+
+        await run_monitor(monitor, work)
+
+        info = monitor.get_info()
+        assert len(monitor.lags) > 0
+        assert info["lag_seconds"]["p50"] < 0.05
+        assert info["blocks"] == 0
+        assert info["last_block"] is None
+        assert monitor.stopped.is_set()
+
+    @pytest.mark.asyncio
+    async def test_captures_blocking_stack(self):
+        """Test that a blocking call is reported with its stack"""
+        monitor = LoopMonitor(interval_seconds=0.01, block_threshold_seconds=0.05)
+
+        async def work():
+            block_loop(0.2)
+
+        await run_monitor(monitor, work)
+
+        info = monitor.get_info()
+        assert info["blocks"] == 1
+        assert info["lag_seconds"]["max"] >= 0.15
+        assert "in block_loop" in info["last_block"]["location"]
+        assert info["last_block"]["lag_seconds"] >= 0.15
+
+        blocks = monitor.get_blocks()
+        assert len(blocks) == 1
+        assert "beat" not in blocks[0]
+        assert any("in work" in line for line in blocks[0]["stack"])
+
+    @pytest.mark.asyncio
+    async def test_reports_each_block_once(self):
+        """Test that separate blocks are reported separately, once each"""
+        monitor = LoopMonitor(interval_seconds=0.01, block_threshold_seconds=0.05)
+
+        async def work():
+            block_loop(0.2)
+            await asyncio.sleep(0.05)
+            block_loop(0.1)
+
+        await run_monitor(monitor, work)
+
+        assert monitor.get_info()["blocks"] == 2
@@ -0,0 +1,352 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+# Import from src package
+from src.config import app_config
+
+
+def make_item(douban_id, type="movie"):
+    return {
+        "title": f"Movie {douban_id}",
+        "url": f"https://movie.douban.com/subject/{douban_id}/",
+        "type": type,
+    }
+
+
+class FakeImdbApi:
+    def __init__(self, cached):
+        self.cached = cached
+        self.fetched = []
+        self.update_listeners = []
+
+    async def get_cached_imdb_ids(self, douban_ids):
+        return {_: self.cached[_] for _ in douban_ids if _ in self.cached}
+
+    async def get_imdb_id(self, douban_id, douban_item):
+        self.fetched.append(douban_id)
+        return f"tt{douban_id}"
+
+
+class FakeBackgroundResolver:
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        self.pending = {}
+
+    def submit(self, douban_id, douban_item):
+        if len(self.pending) < self.max_pending:
+            self.pending[douban_id] = douban_item
+
+    def is_pending(self, douban_id):
+        return douban_id in self.pending
+
+
+@pytest.fixture(scope="session")
+def main(tmp_path_factory):
+    """The app, with its caches in a temporary directory."""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(
+            app_config, "cache_base_dir", str(tmp_path_factory.mktemp("cache"))
+        )
+        monkeypatch.setattr(app_config, "enable_bootstrap", False)
+
+        async def import_main():
+            from src import main
+
+            return main
+
+        # The background tasks started on import are cancelled with the loop.
+        return asyncio.run(import_main())
+
+
+def new_client(main) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=main.app), base_url="http://doudarr"
+    )
+
+
+class TestConvertItems:
+    """Test suite for convert_items"""
+
+    @pytest.mark.asyncio
+    async def test_resolves_uncached_items(self, main, monkeypatch):
+        """Test that uncached items are resolved upstream"""
+        imdb_api = FakeImdbApi({"1": "tt1"})
+        monkeypatch.setattr(main, "imdb_api", imdb_api)
+
+        items, degraded = await main.convert_items([make_item("1"), make_item("2")])
+
+        assert [_["imdb_id"] for _ in items] == ["tt1", "tt2"]
+        assert not degraded
+
+    @pytest.mark.asyncio
+    async def test_cache_only(self, main, monkeypatch):
+        """Test that only cached IMDb IDs are used for stale lists"""
+        imdb_api = FakeImdbApi({"1": "tt1"})
+        monkeypatch.setattr(main, "imdb_api", imdb_api)
+
+        items, degraded = await main.convert_items(
+            [make_item("1"), make_item("2")], cache_only=True
+        )
+
+        assert [_["imdb_id"] for _ in items] == ["tt1", None]
+        assert degraded
+        assert imdb_api.fetched == []
+
+
+class TestEnsureIndex:
+    """Test suite for BaseApi._ensure_index"""
+
+    def test_expires_with_list(self, main):
+        """Test that the index expires with the list it's built from"""
+        list_api = main.collection_api
+        list_api.get_cache().set("ensured", [make_item("1")], expire=100)
+
+        list_api._ensure_index("ensured", [make_item("1")])
+
+        _, expire_time = list_api.index_cache.get("ensured", expire_time=True)
+        assert expire_time == pytest.approx(time.time() + 100, abs=5)
+
+    def test_list_expired_meanwhile(self, main):
+        """Test that the index still expires if the list is already gone"""
+        list_api = main.collection_api
+
+        list_api._ensure_index("expired", [make_item("1")])
+
+        _, expire_time = list_api.index_cache.get("expired", expire_time=True)
+        assert expire_time == pytest.approx(
+            time.time() + app_config.list_cache_ttl_seconds, abs=5
+        )
+
+
+class TestChanges:
+    """Test suite for the list change feed"""
+
+    @pytest.mark.asyncio
+    async def test_only_movies(self, main, monkeypatch):
+        """Test that only movies are reported added or removed"""
+        monkeypatch.setattr(main, "imdb_api", FakeImdbApi({}))
+        list_api = main.collection_api
+
+        list_api._store("changes", [make_item("1"), make_item("2", "tv")])
+        result, _ = await main.changes(list_api, "changes", 0, None)
+
+        assert [_["imdb_id"] for _ in result["added"]] == ["tt1"]
+        assert result["removed"] == []
+
+        list_api._store("changes", [make_item("3", "tv")])
+        result, _ = await main.changes(list_api, "changes", result["version"], None)
+
+        assert result["added"] == []
+        assert result["removed"] == [{"douban_id": "1", "imdb_id": None}]
+
+    @pytest.mark.asyncio
+    async def test_wait_timeout(self, main, monkeypatch):
+        """Test that waiting for a change that doesn't come leaves nothing behind"""
+        monkeypatch.setattr(main, "imdb_api", FakeImdbApi({}))
+        list_api = main.collection_api
+        list_api._store("unchanged", [make_item("1")])
+        version = list_api.change_log.get_version("collection:unchanged")
+
+        result, _ = await main.changes(list_api, "unchanged", version, 0.01)
+
+        assert result["version"] == version
+        assert list_api.change_log.events == {}
+
+
+class TestLookup:
+    """Test suite for the /lookup endpoints"""
+
+    @pytest.mark.asyncio
+    async def test_lists_of_every_type(self, main):
+        """Test that lists of every type are found by Douban ID"""
+        # Also with backends that don't share state between instances.
+        assert main.collection_api.membership_index is main.doulist_api.membership_index
+        assert main.collection_api.change_log is main.doulist_api.change_log
+        main.collection_api._store("lookup", [make_item("77")])
+        main.doulist_api._store("lookup", [make_item("77")])
+
+        async with new_client(main) as client:
+            response = await client.get("/lookup/douban/77")
+
+        assert response.status_code == 200
+        assert response.json()["lists"] == [
+            {"type": "collection", "id": "lookup"},
+            {"type": "doulist", "id": "lookup"},
+        ]
+
+
+class TestStats:
+    """Test suite for the /stats endpoint"""
+
+    @pytest.mark.asyncio
+    async def test_cache_sizes(self, main):
+        """Test that the cache sizes are reported"""
+        async with new_client(main) as client:
+            response = await client.get("/stats")
+
+        assert response.status_code == 200
+        assert set(response.json()["cache_size"]) == {"collection", "doulist", "imdb"}
+
+
+class TestSync:
+    """Test suite for the /sync endpoint"""
+
+    @pytest.fixture(autouse=True)
+    def apikey(self, monkeypatch):
+        monkeypatch.setattr(app_config, "apikey", "secret")
+
+    async def post(self, main, body, apikey="secret"):
+        async with new_client(main) as client:
+            return await client.post(f"/sync?apikey={apikey}", content=body)
+
+    @pytest.mark.asyncio
+    async def test_merges_items(self, main):
+        """Test that synced items are merged into the IMDb cache"""
+        items = [
+            {"key": "sync-1", "value": "tt0000001", "expire_time": None},
+            {"key": "sync-2", "value": None, "expire_time": time.time() + 100},
+        ]
+
+        response = await self.post(main, json.dumps(items))
+
+        assert response.status_code == 200
+        assert response.json()["written"] == 2
+        assert main.imdb_api.get_cache().get("sync-1") == "tt0000001"
+        assert main.imdb_api.reverse_index.get_douban_ids("tt0000001") == ["sync-1"]
+
+    @pytest.mark.asyncio
+    async def test_invalidates_aggregates(self, main):
+        """Test that cached aggregates are dropped by a sync that writes"""
+        key = main.aggregate_cache.get_key(["collection:a"], "union", None)
+        main.aggregate_cache.set(key, ["collection:a"], [])
+
+        items = [{"key": "sync-3", "value": "tt0000003", "expire_time": None}]
+        response = await self.post(main, json.dumps(items))
+
+        assert response.status_code == 200
+        assert main.aggregate_cache.get(key) is None
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "body",
+        [
+            "not json",
+            json.dumps({"key": "1"}),
+            json.dumps(["1"]),
+            json.dumps([{"key": "1", "value": "tt0000001"}]),
+            json.dumps([{"key": 1, "value": "tt0000001", "expire_time": None}]),
+        ],
+    )
+    async def test_rejects_invalid_items(self, main, body):
+        """Test that malformed syncs are rejected without writing anything"""
+        response = await self.post(main, body)
+
+        assert response.status_code == 400
+        assert main.imdb_api.get_cache().get("1") is None
+
+    @pytest.mark.asyncio
+    async def test_requires_apikey(self, main):
+        """Test that syncs need the API key"""
+        response = await self.post(main, "[]", apikey="wrong")
+
+        assert response.status_code == 403
+
+
+class TestResolve:
+    """Test suite for the /resolve endpoint"""
+
+    @pytest.fixture(autouse=True)
+    def apikey(self, monkeypatch):
+        monkeypatch.setattr(app_config, "apikey", "secret")
+
+    @pytest.fixture
+    def imdb_api(self, main, monkeypatch):
+        imdb_api = FakeImdbApi({"1": "tt1", "4": ""})
+        monkeypatch.setattr(main, "imdb_api", imdb_api)
+        return imdb_api
+
+    @pytest.fixture
+    def background_resolver(self, main, monkeypatch):
+        # Room for one queued ID, the next ones are dropped.
+        background_resolver = FakeBackgroundResolver(1)
+        monkeypatch.setattr(main, "background_resolver", background_resolver)
+        return background_resolver
+
+    async def post(self, main, entries, params="", apikey="secret"):
+        async with new_client(main) as client:
+            return await client.post(
+                f"/resolve?apikey={apikey}{params}", content=json.dumps(entries)
+            )
+
+    @pytest.mark.asyncio
+    async def test_json(self, main, imdb_api, background_resolver):
+        """Test that cached IDs are returned and the others queued or dropped"""
+        response = await self.post(
+            main, ["1", {"douban_id": "2", "title": "Movie 2"}, "3", "4"]
+        )
+
+        assert response.status_code == 200
+        assert response.json() == [
+            {"douban_id": "1", "imdb_id": "tt1", "status": "found"},
+            {"douban_id": "2", "imdb_id": None, "status": "pending"},
+            {"douban_id": "3", "imdb_id": None, "status": "dropped"},
+            {"douban_id": "4", "imdb_id": None, "status": "not_found"},
+        ]
+        assert background_resolver.pending == {"2": {"title": "Movie 2"}}
+
+    @pytest.mark.asyncio
+    async def test_stream(self, main, imdb_api, background_resolver):
+        """Test that queued IDs are streamed once they are resolved"""
+
+        async def resolve_later():
+            while not imdb_api.update_listeners:
+                await asyncio.sleep(0.01)
+            for listener in list(imdb_api.update_listeners):
+                listener("2", "tt2")
+
+        resolver = asyncio.create_task(resolve_later())
+        response = await self.post(main, ["1", "2", "3"], "&stream=true&wait=5")
+        await resolver
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert [json.loads(_) for _ in response.text.splitlines()] == [
+            {"douban_id": "1", "imdb_id": "tt1", "status": "found"},
+            {"douban_id": "3", "imdb_id": None, "status": "dropped"},
+            {"douban_id": "2", "imdb_id": "tt2", "status": "found"},
+        ]
+        assert imdb_api.update_listeners == []
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "entries",
+        [
+            ["1", "../2"],
+            [{"douban_id": "2?x=1"}],
+            ["１２"],
+            [""],
+            [1],
+            {"douban_id": "1"},
+        ],
+    )
+    async def test_rejects_invalid_ids(
+        self, main, imdb_api, background_resolver, entries
+    ):
+        """Test that anything but lists of numeric Douban IDs is rejected"""
+        response = await self.post(main, entries)
+
+        assert response.status_code == 400
+        assert background_resolver.pending == {}
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("apikey", ["", "wrong"])
+    async def test_requires_apikey(self, main, imdb_api, background_resolver, apikey):
+        """Test that requests without the API key are refused"""
+        response = await self.post(main, ["2"], apikey=apikey)
+
+        assert response.status_code == 403
+        assert background_resolver.pending == {}
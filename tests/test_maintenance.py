@@ -0,0 +1,116 @@
+import os
+import time
+from datetime import datetime
+import pytest
+from diskcache import Cache
+
+# Import from src package
+from src.cache_layout import migrating_caches, open_cache
+from src.maintenance import CacheMaintenance, get_compaction_delay, migrate_caches
+
+
+class TestGetCompactionDelay:
+    """Test suite for get_compaction_delay"""
+
+    @pytest.mark.parametrize(
+        "now,hours,expected",
+        [
+            (datetime(2024, 1, 1, 3, 30), [4], 1800),
+            (datetime(2024, 1, 1, 4, 30), [4], 23.5 * 3600),
+            (datetime(2024, 1, 1, 23, 0), [0, 12], 3600),
+            (datetime(2024, 1, 1, 4, 0), [4, 5], 3600),
+        ],
+    )
+    def test_next_window(self, now, hours, expected):
+        """Test that the delay runs to the start of the next window"""
+        assert get_compaction_delay(now, hours) == expected
+
+    def test_no_window(self):
+        """Test that there's nothing to schedule without windows"""
+        assert get_compaction_delay(datetime(2024, 1, 1), []) is None
+
+
+class TestCacheMaintenance:
+    """Test suite for CacheMaintenance class"""
+
+    @pytest.fixture
+    def cache(self, temp_cache_dir):
+        cache = Cache(os.path.join(temp_cache_dir, "collection"))
+        yield cache
+        cache.close()
+
+    def test_expires_entries(self, cache):
+        """Test that expired entries are swept"""
+        cache.set("fresh", "value")
+        cache.set("stale", "value", expire=0.01)
+        time.sleep(0.02)
+
+        maintenance = CacheMaintenance({"collection": cache})
+        result = maintenance.run_once(compact=False)
+
+        assert result["collection"]["expired"] == 1
+        assert "fresh" in cache
+        assert len(cache) == 1
+
+    def test_culls_to_size_limit(self, cache):
+        """Test that entries are culled when the cache exceeds its size limit"""
+        cache.reset("cull_limit", 0)
+        cache.reset("size_limit", 100 * 1024)
+        for i in range(10):
+            cache.set(i, os.urandom(64 * 1024))
+        assert len(cache) == 10
+
+        maintenance = CacheMaintenance({"collection": cache})
+        result = maintenance.run_once(compact=False)
+
+        assert result["collection"]["culled"] > 0
+        assert len(cache) < 10
+
+    def test_compaction_reclaims_bytes(self, cache):
+        """Test that compaction reports reclaimed bytes"""
+        cache.reset("cull_limit", 0)
+        for i in range(2000):
+            cache.set(i, "x" * 1000, expire=0.01)
+        time.sleep(0.02)
+
+        maintenance = CacheMaintenance({"collection": cache})
+        result = maintenance.run_once(compact=True)
+
+        assert result["collection"]["expired"] == 2000
+        assert result["collection"]["compacted"]
+        assert result["collection"]["bytes_reclaimed"] > 0
+
+    def test_get_info(self, cache):
+        """Test that stats are accumulated across runs"""
+        cache.set("stale", "value", expire=0.01)
+        time.sleep(0.02)
+
+        maintenance = CacheMaintenance({"collection": cache})
+        maintenance.run_once(compact=False)
+        maintenance.run_once(compact=False)
+
+        info = maintenance.get_info()
+        assert info["runs"] == 2
+        assert info["totals"]["expired"] == 1
+        assert info["last_duration_seconds"] is not None
+
+
+class TestMigrateCaches:
+    """Test suite for migrate_caches"""
+
+    @pytest.mark.asyncio
+    async def test_migrates_caches(self, temp_cache_dir):
+        """Test that caches in another layout are migrated in the background"""
+        directory = os.path.join(temp_cache_dir, "imdb")
+        legacy = open_cache(directory, 1)
+        for i in range(250):
+            legacy.set(str(i), f"tt{i}")
+        legacy.close()
+        cache = open_cache(directory, 2)
+
+        await migrate_caches()
+
+        assert migrating_caches == []
+        assert cache.legacies == []
+        assert len(cache.current) == 250
+        cache.close()
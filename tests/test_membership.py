@@ -0,0 +1,94 @@
+import time
+import pytest
+from diskcache import Cache
+
+# Import from src package
+from src.membership import BloomFilter, CachedKeyFilter
+
+
+@pytest.fixture
+def cache(temp_cache_dir):
+    cache = Cache(temp_cache_dir)
+    yield cache
+    cache.close()
+
+
+class TestBloomFilter:
+    """Test suite for BloomFilter"""
+
+    def test_no_false_negatives(self):
+        """Test that every added key is found"""
+        bloom = BloomFilter(1000, 0.01)
+        keys = [str(i) for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+
+        assert all(key in bloom for key in keys)
+        assert bloom.count == 1000
+
+    def test_false_positive_rate(self):
+        """Test that keys that were not added are rarely found"""
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(str(i))
+
+        false_positives = len([i for i in range(1000, 11000) if str(i) in bloom])
+
+        assert false_positives < 300
+
+
+class TestCachedKeyFilter:
+    """Test suite for CachedKeyFilter"""
+
+    def test_not_ready(self):
+        """Test that nothing is known before the filter is built"""
+        key_filter = CachedKeyFilter()
+
+        assert not key_filter.ready
+        assert not key_filter.is_cached("1")
+
+    def test_build(self, cache):
+        """Test that the filter knows the cached keys after a build"""
+        cache.set("permanent", "tt1")
+        cache.set("expiring", None, expire=100)
+        cache.set("expired", None, expire=0.01)
+        time.sleep(0.02)
+        key_filter = CachedKeyFilter()
+
+        key_filter.build(cache)
+
+        assert key_filter.ready
+        assert key_filter.is_cached("permanent")
+        assert key_filter.is_cached("expiring")
+        assert not key_filter.is_cached("expired")
+        assert not key_filter.is_cached("missing")
+        info = key_filter.get_info()
+        assert info["permanent_keys"] == 1
+        assert info["expiring_keys"] == 1
+
+    def test_add(self, cache):
+        """Test that writes are recorded, and expiring keys drop out"""
+        key_filter = CachedKeyFilter()
+        key_filter.build(cache)
+
+        key_filter.add("permanent", None)
+        key_filter.add("expiring", time.time() + 0.01)
+
+        assert key_filter.is_cached("permanent")
+        assert key_filter.is_cached("expiring")
+        time.sleep(0.02)
+        assert not key_filter.is_cached("expiring")
+
+    def test_add_during_build(self, cache, monkeypatch):
+        """Test that writes made while the cache is scanned are kept"""
+        key_filter = CachedKeyFilter()
+
+        def read_keys(cache):
+            key_filter.add("written", None)
+            return []
+
+        monkeypatch.setattr("src.membership.read_keys", read_keys)
+
+        key_filter.build(cache)
+
+        assert key_filter.is_cached("written")
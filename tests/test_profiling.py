@@ -0,0 +1,100 @@
+import asyncio
+import marshal
+import threading
+import time
+import pytest
+
+# Import from src package
+from src.profiling import (
+    ProfilerBusyError,
+    profile_cpu_collapsed,
+    profile_cpu_pstats,
+    profile_memory,
+    sample_stacks,
+)
+
+
+def busy_function(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+class TestProfiling:
+    """Test suite for the profiling helpers"""
+
+    def test_sample_stacks(self):
+        """Test that samples show the functions a thread is running"""
+        thread = threading.Thread(target=busy_function, args=(0.3,))
+        thread.start()
+        try:
+            stacks = sample_stacks(thread.ident, 0.1, interval=0.001)
+        finally:
+            thread.join()
+
+        assert stacks
+        stack, _ = stacks.most_common(1)[0]
+        assert stack.split(";")[-1].startswith("busy_function (test_profiling.py:")
+
+    @pytest.mark.asyncio
+    async def test_profile_cpu_collapsed(self):
+        """Test that the event loop is sampled while it runs other work"""
+
+        done = False
+
+        async def work():
+            while not done:
+                # Longer than the GIL switch interval, so the sampler gets to
+                # see it.
+                busy_function(0.05)
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(work())
+        result = await profile_cpu_collapsed(0.2)
+        done = True
+        await task
+
+        lines = result.splitlines()
+        assert lines
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            assert int(count) > 0
+        assert "busy_function" in result
+
+    @pytest.mark.asyncio
+    async def test_profile_cpu_pstats(self):
+        """Test that the cProfile result is in the pstats format"""
+
+        async def work():
+            busy_function(0.01)
+
+        task = asyncio.create_task(work())
+        stats = marshal.loads(await profile_cpu_pstats(0.05))
+        await task
+
+        functions = [function for _, _, function in stats]
+        assert "busy_function" in functions
+
+    @pytest.mark.asyncio
+    async def test_profile_memory(self):
+        """Test that allocations made between the snapshots are reported"""
+        kept = []
+
+        async def work():
+            await asyncio.sleep(0.01)
+            kept.append([bytearray(1024) for _ in range(100)])
+
+        task = asyncio.create_task(work())
+        result = await profile_memory(0.05, 5)
+        await task
+
+        assert "test_profiling.py" in result.splitlines()[0]
+
+    @pytest.mark.asyncio
+    async def test_one_profile_at_a_time(self):
+        """Test that a second profile is rejected while one is running"""
+        task = asyncio.create_task(profile_cpu_collapsed(0.1))
+        await asyncio.sleep(0.01)
+        with pytest.raises(ProfilerBusyError):
+            await profile_memory(0.01, 5)
+        await task
@@ -0,0 +1,170 @@
+import asyncio
+import json
+import os
+import pytest
+
+# Import from src package
+from src.resolve import BulkResolver, parse_list_spec, read_list_specs
+
+
+def make_item(douban_id, type="movie"):
+    return {
+        "title": f"Movie {douban_id}",
+        "url": f"https://movie.douban.com/subject/{douban_id}/",
+        "type": type,
+    }
+
+
+class FakeListApi:
+    def __init__(self, lists):
+        self.lists = lists
+        self.fetched = []
+
+    async def get_items(self, id):
+        self.fetched.append(id)
+        if id not in self.lists:
+            raise Exception(f"List {id} not found")
+        return self.lists[id]
+
+
+class FakeImdbApi:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.resolved = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def get_imdb_id(self, douban_id, douban_item):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.001)
+            if douban_id in self.failing:
+                raise Exception("boom")
+            self.resolved.append(douban_id)
+            return f"tt{douban_id}"
+        finally:
+            self.in_flight -= 1
+
+
+class TestParseListSpec:
+    """Test suite for list spec parsing"""
+
+    @pytest.mark.parametrize(
+        "spec,expected",
+        [
+            ("collection:movie_weekly_best", ("collection", "movie_weekly_best")),
+            ("doulist:43556565", ("doulist", "43556565")),
+            (
+                "https://m.douban.com/subject_collection/movie_weekly_best",
+                ("collection", "movie_weekly_best"),
+            ),
+            ("https://www.douban.com/doulist/43556565/", ("doulist", "43556565")),
+        ],
+    )
+    def test_valid(self, spec, expected):
+        assert parse_list_spec(spec) == expected
+
+    @pytest.mark.parametrize("spec", ["unknown:1", "collection:", "https://x.com/a"])
+    def test_invalid(self, spec):
+        with pytest.raises(ValueError):
+            parse_list_spec(spec)
+
+    def test_read_from_file(self, temp_cache_dir):
+        """Test that specs are read from a file and deduplicated"""
+        path = os.path.join(temp_cache_dir, "lists.txt")
+        with open(path, "w") as f:
+            f.write("# comment\ndoulist:1\n\ncollection:a\n")
+
+        lists = read_list_specs(["collection:a"], path)
+
+        assert lists == [("collection", "a"), ("doulist", "1")]
+
+
+class TestBulkResolver:
+    """Test suite for BulkResolver class"""
+
+    @pytest.fixture
+    def state_path(self, temp_cache_dir):
+        return os.path.join(temp_cache_dir, "resolve_state.json")
+
+    @pytest.fixture
+    def list_apis(self):
+        return {
+            "collection": FakeListApi(
+                {
+                    "a": [make_item("1"), make_item("2"), make_item("3", "tv")],
+                    "b": [make_item("2"), make_item("4")],
+                }
+            ),
+            "doulist": FakeListApi({"1": [make_item(str(i)) for i in range(10, 30)]}),
+        }
+
+    @pytest.mark.asyncio
+    async def test_resolves_movies_once(self, list_apis, state_path):
+        """Test that each movie is resolved once across lists"""
+        imdb_api = FakeImdbApi()
+        resolver = BulkResolver(list_apis, imdb_api, 4, state_path)
+
+        progress = await resolver.run([("collection", "a"), ("collection", "b")])
+
+        assert sorted(imdb_api.resolved) == ["1", "2", "4"]
+        assert progress["items_total"] == 3
+        assert progress["items_resolved"] == 3
+        assert progress["lists_done"] == 2
+
+    @pytest.mark.asyncio
+    async def test_bounded_concurrency(self, list_apis, state_path):
+        """Test that no more than `concurrency` lookups run at once"""
+        imdb_api = FakeImdbApi()
+        resolver = BulkResolver(list_apis, imdb_api, 3, state_path)
+
+        await resolver.run([("doulist", "1")])
+
+        assert len(imdb_api.resolved) == 20
+        assert imdb_api.max_in_flight == 3
+
+    @pytest.mark.asyncio
+    async def test_resumes_from_state(self, list_apis, state_path):
+        """Test that finished lists are skipped on the next run"""
+        resolver = BulkResolver(list_apis, FakeImdbApi(failing=["4"]), 4, state_path)
+        progress = await resolver.run([("collection", "a"), ("collection", "b")])
+
+        assert progress["items_failed"] == 1
+        assert progress["lists_failed"] == 1
+        with open(state_path) as f:
+            assert json.load(f)["done_lists"] == ["collection:a"]
+
+        imdb_api = FakeImdbApi()
+        resolver = BulkResolver(list_apis, imdb_api, 4, state_path)
+        progress = await resolver.run([("collection", "a"), ("collection", "b")])
+
+        assert list_apis["collection"].fetched == ["a", "b", "b"]
+        assert progress["lists_done"] == 2
+
+    @pytest.mark.asyncio
+    async def test_shared_item_failure(self, state_path):
+        """Test that a failed item shared by lists keeps all of them unfinished"""
+        list_apis = {
+            "collection": FakeListApi(
+                {"a": [make_item("1"), make_item("2")], "b": [make_item("2")]}
+            )
+        }
+        resolver = BulkResolver(list_apis, FakeImdbApi(failing=["2"]), 4, state_path)
+
+        progress = await resolver.run([("collection", "a"), ("collection", "b")])
+
+        assert progress["items_total"] == 2
+        assert progress["items_failed"] == 1
+        assert progress["lists_failed"] == 2
+        assert not os.path.exists(state_path)
+
+    @pytest.mark.asyncio
+    async def test_failed_list_fetch(self, list_apis, state_path):
+        """Test that a list which can't be fetched doesn't stop the run"""
+        resolver = BulkResolver(list_apis, FakeImdbApi(), 4, state_path)
+
+        progress = await resolver.run([("collection", "missing"), ("collection", "a")])
+
+        assert progress["lists_failed"] == 1
+        assert progress["lists_done"] == 1
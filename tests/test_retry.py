@@ -0,0 +1,161 @@
+import httpx
+import pytest
+
+# Import from src package
+from src import utils
+from src.retry import BACKGROUND, Retrier, RetryBudget, current_priority
+from src.throttler import RateLimitedError
+
+
+class FlakyHandler:
+    def __init__(self, failures, status_code=503):
+        self.failures = failures
+        self.status_code = status_code
+        self.requests = 0
+
+    def __call__(self, request):
+        self.requests += 1
+        if self.requests <= self.failures:
+            if self.status_code is None:
+                raise httpx.ConnectError("Connection reset", request=request)
+            return httpx.Response(self.status_code, request=request)
+        return httpx.Response(200, json={"ok": True}, request=request)
+
+
+@pytest.fixture
+def retrier(monkeypatch):
+    from src import config
+
+    monkeypatch.setattr(config.app_config, "retry_backoff_base_seconds", 0.001)
+    monkeypatch.setattr(
+        config.app_config,
+        "retry_max_attempts",
+        {"interactive": 2, "background": 4},
+    )
+    monkeypatch.setattr(
+        config.app_config,
+        "retry_budget_per_minute",
+        {"interactive": 10, "background": 10, "api.example.com/background": 2},
+    )
+    retrier = Retrier()
+    monkeypatch.setattr(utils, "retrier", retrier)
+    return retrier
+
+
+def new_client(handler):
+    return httpx.AsyncClient(
+        transport=httpx.MockTransport(handler), base_url="https://example.com"
+    )
+
+
+class TestRetrier:
+    """Test suite for Retrier class"""
+
+    @pytest.mark.asyncio
+    async def test_retries_transient_errors(self, retrier):
+        """Test that 5xx responses and connection errors are retried"""
+        for status_code in [503, None]:
+            handler = FlakyHandler(1, status_code)
+            async with new_client(handler) as client:
+                assert await utils.get_json(client, "/") == {"ok": True}
+            assert handler.requests == 2
+
+        assert retrier.get_info()["example.com"]["retries"] == 2
+        assert retrier.get_info()["example.com"]["recovered"] == 2
+
+    @pytest.mark.asyncio
+    async def test_does_not_retry_other_errors(self, retrier):
+        """Test that client errors are not retried"""
+        handler = FlakyHandler(1, 404)
+        async with new_client(handler) as client:
+            with pytest.raises(httpx.HTTPStatusError):
+                await utils.get_json(client, "/")
+
+        assert handler.requests == 1
+        assert retrier.get_info() == {}
+
+    @pytest.mark.asyncio
+    async def test_attempts_per_priority(self, retrier):
+        """Test that background requests get more attempts than interactive ones"""
+        handler = FlakyHandler(3)
+        async with new_client(handler) as client:
+            with pytest.raises(httpx.HTTPStatusError):
+                await utils.get_json(client, "/")
+            assert handler.requests == 2
+            assert retrier.get_info()["example.com"]["gave_up"] == 1
+
+            handler.requests = 0
+            token = current_priority.set(BACKGROUND)
+            try:
+                assert await utils.get_json(client, "/") == {"ok": True}
+            finally:
+                current_priority.reset(token)
+        assert handler.requests == 4
+
+    @pytest.mark.asyncio
+    async def test_budget_per_host(self, retrier):
+        """Test that retries stop once the budget of the host is spent"""
+        handler = FlakyHandler(100)
+        token = current_priority.set(BACKGROUND)
+        try:
+            async with httpx.AsyncClient(
+                transport=httpx.MockTransport(handler),
+                base_url="https://api.example.com",
+            ) as client:
+                with pytest.raises(httpx.HTTPStatusError):
+                    await utils.get_json(client, "/")
+        finally:
+            current_priority.reset(token)
+
+        assert handler.requests == 3
+        info = retrier.get_info()["api.example.com"]
+        assert info["retries"] == 2
+        assert info["out_of_budget"] == 1
+
+    @pytest.mark.asyncio
+    async def test_stream_response(self, retrier):
+        """Test that opening a streamed response is retried"""
+        handler = FlakyHandler(1, None)
+        async with new_client(handler) as client:
+            async with utils.stream_response(client, "/") as response:
+                assert await response.aread() == b'{"ok":true}'
+
+        assert handler.requests == 2
+
+    @pytest.mark.asyncio
+    async def test_never_retries_rate_limits_or_non_idempotent(self, retrier):
+        """Test that rate limits and non-idempotent requests are not retried"""
+        calls = []
+
+        async def rate_limited():
+            calls.append(1)
+            raise RateLimitedError("Rate limited", "example.com", 10)
+
+        async def failing():
+            calls.append(1)
+            raise httpx.ReadTimeout("Timed out")
+
+        url = httpx.URL("https://example.com/")
+        with pytest.raises(RateLimitedError):
+            await retrier.run("GET", url, rate_limited)
+        with pytest.raises(httpx.ReadTimeout):
+            await retrier.run("POST", url, failing)
+
+        assert len(calls) == 2
+
+
+class TestRetryBudget:
+    """Test suite for RetryBudget class"""
+
+    def test_refills(self, monkeypatch):
+        """Test that spent retries are refilled over time"""
+        now = [1000.0]
+        monkeypatch.setattr("src.retry.time.monotonic", lambda: now[0])
+        budget = RetryBudget(per_minute=2)
+
+        assert budget.try_spend()
+        assert budget.try_spend()
+        assert not budget.try_spend()
+        now[0] += 30
+        assert budget.try_spend()
+        assert not budget.try_spend()
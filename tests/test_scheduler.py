@@ -0,0 +1,208 @@
+import asyncio
+import pytest
+from contextlib import asynccontextmanager
+
+# Import from src package
+from src.refresh import ListRefresher
+from src.scheduler import JITTER_RATIO, Scheduler
+
+
+async def wait_for(condition, timeout=1):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Timed out")
+
+
+@asynccontextmanager
+async def running(scheduler):
+    task = asyncio.create_task(scheduler.run())
+    try:
+        yield
+    finally:
+        task.cancel()
+        await asyncio.gather(task, *scheduler.tasks, return_exceptions=True)
+
+
+class TestScheduler:
+    """Test suite for Scheduler class"""
+
+    @pytest.mark.asyncio
+    async def test_reruns_recurring_jobs(self):
+        """Test that a recurring job runs again about an interval later"""
+        scheduler = Scheduler()
+        async with running(scheduler):
+            runs = []
+
+            async def job():
+                runs.append(asyncio.get_running_loop().time())
+
+            scheduler.add_recurring("job", job, 0.05)
+            await wait_for(lambda: len(runs) >= 3)
+
+            for earlier, later in zip(runs, runs[1:]):
+                assert later - earlier >= 0.05 * (1 - JITTER_RATIO) - 0.005
+            info = scheduler.get_info()["jobs"]["job"]
+            assert info["last_outcome"] == "ok"
+            assert info["next_run_time"] is not None
+
+    @pytest.mark.asyncio
+    async def test_runs_jobs_in_order(self):
+        """Test that jobs run in the order of their run times"""
+        scheduler = Scheduler()
+        async with running(scheduler):
+            runs = []
+
+            async def job(name):
+                runs.append(name)
+
+            scheduler.add_once("later", lambda: job("later"), 0.05)
+            scheduler.add_once("sooner", lambda: job("sooner"), 0.01)
+            await wait_for(lambda: len(runs) == 2)
+
+            assert runs == ["sooner", "later"]
+            info = scheduler.get_info()["jobs"]["later"]
+            assert info["last_outcome"] == "ok"
+            assert info["next_run_time"] is None
+
+    @pytest.mark.asyncio
+    async def test_reschedules_pending_jobs(self):
+        """Test that adding a pending one-off job again only moves its run time"""
+        scheduler = Scheduler()
+        async with running(scheduler):
+            runs = []
+
+            async def job():
+                runs.append(1)
+
+            scheduler.add_once("job", job, 10)
+            scheduler.add_once("job", job, 0)
+            await wait_for(lambda: runs)
+            await asyncio.sleep(0.05)
+
+            assert runs == [1]
+
+    @pytest.mark.asyncio
+    async def test_reschedules_running_jobs(self):
+        """Test that a job rescheduled while running runs again afterwards"""
+        scheduler = Scheduler()
+        async with running(scheduler):
+            runs = []
+            release = asyncio.Event()
+
+            async def job():
+                runs.append(1)
+                await release.wait()
+
+            scheduler.add_once("job", job)
+            await wait_for(lambda: runs)
+            scheduler.add_once("job", job)
+            await asyncio.sleep(0.05)
+            assert runs == [1]
+
+            release.set()
+            await wait_for(lambda: len(runs) == 2)
+
+    @pytest.mark.asyncio
+    async def test_records_failures(self):
+        """Test that failed runs are recorded and recurring jobs keep running"""
+        scheduler = Scheduler()
+        async with running(scheduler):
+            runs = []
+
+            async def job():
+                runs.append(1)
+                raise RuntimeError("boom")
+
+            scheduler.add_recurring("job", job, 0.01)
+            await wait_for(lambda: len(runs) >= 2)
+
+            info = scheduler.get_info()["jobs"]["job"]
+            assert info["last_outcome"] == "failed"
+            assert info["last_error"] == "boom"
+            assert info["failures"] >= 2
+
+    @pytest.mark.asyncio
+    async def test_counts_hidden_jobs(self):
+        """Test that hidden jobs are only counted"""
+        scheduler = Scheduler()
+        async with running(scheduler):
+
+            async def job():
+                pass
+
+            scheduler.add_once("hidden:1", job, visible=False)
+            scheduler.add_once("hidden:2", job, 10, visible=False)
+            await wait_for(lambda: scheduler.get_info()["hidden_jobs"]["ok"] == 1)
+
+            info = scheduler.get_info()
+            assert info["jobs"] == {}
+            assert info["hidden_jobs"]["pending"] == 1
+
+
+class FakeListApi:
+    def __init__(self):
+        self.refreshed = []
+        self.update_listeners = []
+
+    async def refresh_items(self, id):
+        self.refreshed.append(id)
+        for listener in self.update_listeners:
+            listener(f"doulist:{id}", set(), set())
+
+
+class TestListRefresher:
+    """Test suite for ListRefresher class"""
+
+    @pytest.fixture
+    def refresher(self, monkeypatch):
+        from src import config
+
+        monkeypatch.setattr(config.app_config, "list_cache_ttl_seconds", 0.05)
+        monkeypatch.setattr(config.app_config, "list_refresh_ahead_seconds", 0.04)
+        list_api = FakeListApi()
+        refresher = ListRefresher(Scheduler(), {"doulist": list_api})
+        list_api.update_listeners.append(refresher.on_fetched)
+        return refresher
+
+    @pytest.mark.asyncio
+    async def test_refreshes_requested_lists(self, refresher):
+        """Test that a list requested since it was fetched is refetched"""
+        list_api = refresher.list_apis["doulist"]
+        async with running(refresher.scheduler):
+            refresher.on_fetched("doulist:1", set(), set())
+            refresher.on_requested("doulist:1")
+            await wait_for(lambda: list_api.refreshed)
+
+            # Not requested again since the refresh.
+            await wait_for(lambda: refresher.skipped == 1)
+        assert list_api.refreshed == ["1"]
+        assert refresher.get_info()["refreshed"] == 1
+        assert refresher.get_info()["tracked_lists"] == 0
+
+    @pytest.mark.asyncio
+    async def test_skips_lists_not_requested(self, refresher):
+        """Test that a list not requested since it was fetched is left to expire"""
+        async with running(refresher.scheduler):
+            refresher.on_requested("doulist:1")
+            refresher.on_fetched("doulist:1", set(), set())
+            await wait_for(lambda: refresher.skipped == 1)
+
+        assert refresher.list_apis["doulist"].refreshed == []
+
+    def test_ignores_lists_not_fetched(self, refresher):
+        """Test that requests for lists that were never fetched aren't kept"""
+        refresher.on_requested("doulist:invalid")
+
+        assert refresher.requested == {}
+
+    @pytest.mark.asyncio
+    async def test_disabled(self, refresher, monkeypatch):
+        """Test that nothing is scheduled when refreshing ahead is disabled"""
+        from src import config
+
+        monkeypatch.setattr(config.app_config, "list_refresh_ahead_seconds", 0)
+        refresher.on_fetched("doulist:1", set(), set())
+
+        assert refresher.scheduler.get_info()["hidden_jobs"]["pending"] == 0
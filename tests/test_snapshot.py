@@ -0,0 +1,134 @@
+import gzip
+import io
+import json
+import os
+import time
+import pytest
+from diskcache import Cache
+
+# Import from src package
+from src.snapshot import (
+    SNAPSHOT_FORMAT,
+    SNAPSHOT_VERSION,
+    SnapshotError,
+    export_snapshot,
+    import_snapshot,
+)
+
+
+class TestSnapshot:
+    """Test suite for snapshot export and import"""
+
+    @pytest.fixture
+    def source_cache(self, temp_cache_dir):
+        cache = Cache(os.path.join(temp_cache_dir, "source"))
+        yield cache
+        cache.close()
+
+    @pytest.fixture
+    def target_cache(self, temp_cache_dir):
+        cache = Cache(os.path.join(temp_cache_dir, "target"))
+        yield cache
+        cache.close()
+
+    def _export(self, cache):
+        f = io.BytesIO()
+        count = export_snapshot(cache, f)
+        f.seek(0)
+        return count, f
+
+    def test_export_format(self, source_cache):
+        """Test that the snapshot has a versioned header and sorted entries"""
+        source_cache.set("3", "tt0000003")
+        source_cache.set("1", "tt0000001")
+        source_cache.set("2", None, expire=3600)
+
+        count, f = self._export(source_cache)
+
+        assert count == 3
+        lines = gzip.decompress(f.read()).decode().splitlines()
+        header = json.loads(lines[0])
+        assert header["format"] == SNAPSHOT_FORMAT
+        assert header["version"] == SNAPSHOT_VERSION
+        entries = [json.loads(line) for line in lines[1:]]
+        assert [entry[0] for entry in entries] == ["1", "2", "3"]
+        assert entries[0][1:] == ["tt0000001", None]
+        assert entries[1][1] is None
+        assert entries[1][2] > time.time()
+
+    def test_round_trip_keeps_expire_time(self, source_cache, target_cache):
+        """Test that values and expire times survive a round trip"""
+        source_cache.set("1", "tt0000001")
+        source_cache.set("2", None, expire=3600)
+        _, expected_expire_time = source_cache.get("2", expire_time=True)
+
+        _, f = self._export(source_cache)
+        result = import_snapshot(target_cache, f)
+
+        assert result["total"] == 2
+        assert result["new_count"] == 2
+        assert target_cache.get("1", expire_time=True) == ("tt0000001", None)
+        value, expire_time = target_cache.get("2", expire_time=True)
+        assert value is None
+        assert expire_time == pytest.approx(expected_expire_time, abs=1)
+
+    def test_import_keeps_newer_local_data(self, source_cache, target_cache):
+        """Test that a snapshot doesn't override permanent local mappings"""
+        source_cache.set("1", None, expire=3600)
+        target_cache.set("1", "tt0000001")
+
+        _, f = self._export(source_cache)
+        result = import_snapshot(target_cache, f)
+
+        assert result["count"] == 0
+        assert target_cache.get("1") == "tt0000001"
+
+    def test_import_restores_cull_limit(self, source_cache, target_cache):
+        """Test that culling is re-enabled after the import"""
+        source_cache.set("1", "tt0000001")
+        cull_limit = target_cache.cull_limit
+
+        _, f = self._export(source_cache)
+        import_snapshot(target_cache, f)
+
+        assert target_cache.cull_limit == cull_limit
+
+    def test_import_rejects_unknown_format(self, target_cache):
+        """Test that files which are not snapshots are rejected"""
+        f = io.BytesIO(gzip.compress(b'{"format": "something-else"}\n'))
+
+        with pytest.raises(SnapshotError):
+            import_snapshot(target_cache, f)
+
+    def test_import_rejects_unknown_version(self, target_cache):
+        """Test that snapshots with an unknown version are rejected"""
+        header = {"format": SNAPSHOT_FORMAT, "version": SNAPSHOT_VERSION + 1}
+        f = io.BytesIO(gzip.compress(json.dumps(header).encode() + b"\n"))
+
+        with pytest.raises(SnapshotError):
+            import_snapshot(target_cache, f)
+
+    @pytest.mark.parametrize(
+        "line",
+        [
+            b"not json\n",
+            b'["1", "tt1"]\n',
+            b'[1, "tt1", null]\n',
+            b'["1", 1, null]\n',
+            b'["1", "tt1", "soon"]\n',
+        ],
+    )
+    def test_import_is_all_or_nothing(
+        self, source_cache, target_cache, monkeypatch, line
+    ):
+        """Test that an invalid entry anywhere in the file imports nothing"""
+        monkeypatch.setattr("src.sync.MERGE_BATCH_SIZE", 1)
+        source_cache.set("1", "tt1")
+        source_cache.set("2", "tt2")
+        _, f = self._export(source_cache)
+        with gzip.GzipFile(fileobj=f, mode="rb") as g:
+            data = g.read() + line
+        with pytest.raises(SnapshotError, match="Line 4"):
+            import_snapshot(target_cache, io.BytesIO(gzip.compress(data)))
+
+        assert len(target_cache) == 0
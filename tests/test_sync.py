@@ -0,0 +1,126 @@
+import time
+import pytest
+from diskcache import Cache
+
+# Import from src package
+from src.cache_layout import open_cache
+from src.membership import CachedKeyFilter
+from src.sync import merge_imdb_items
+
+
+@pytest.fixture
+def cache(temp_cache_dir):
+    cache = Cache(temp_cache_dir)
+    yield cache
+    cache.close()
+
+
+def make_item(key, value, expire_time=None):
+    return {"key": key, "value": value, "expire_time": expire_time}
+
+
+class TestMergeImdbItems:
+    """Test suite for merge_imdb_items"""
+
+    def test_newer_expiry_wins(self, cache):
+        """Test the merge rules and the returned statistics"""
+        now = time.time()
+        cache.set("kept", None, expire=1000)
+        cache.set("replaced", None, expire=100)
+        cache.set("permanent", "tt3")
+        cache.set("same", "tt4")
+
+        stats = merge_imdb_items(
+            cache,
+            [
+                make_item("new", "tt1"),
+                make_item("kept", "tt2", now + 500),
+                make_item("replaced", "tt5", now + 500),
+                make_item("permanent", "tt6"),
+                make_item("same", "tt4"),
+                make_item("expired", "tt7", now - 1),
+            ],
+        )
+
+        assert cache.get("new") == "tt1"
+        assert cache.get("kept") is None
+        assert cache.get("replaced") == "tt5"
+        assert cache.get("permanent") == "tt6"
+        assert cache.get("same") == "tt4"
+        assert "expired" not in cache
+        _, expire_time = cache.get("replaced", expire_time=True)
+        assert expire_time == pytest.approx(now + 500)
+        assert stats["received"] == 6
+        assert stats["written"] == 3
+        assert stats["new"] == 1
+        assert stats["unchanged"] == 1
+        assert stats["expired"] == 1
+        assert stats["outdated"] == 1
+        assert stats["duration_seconds"] >= 0
+
+    def test_batches(self, cache, monkeypatch):
+        """Test that items spanning several batches are all merged"""
+        monkeypatch.setattr("src.sync.MERGE_BATCH_SIZE", 3)
+
+        stats = merge_imdb_items(
+            cache, (make_item(str(i), f"tt{i}") for i in range(10))
+        )
+
+        assert stats["written"] == 10
+        assert len(cache) == 10
+        assert cache.get("9") == "tt9"
+
+    def test_sharded_cache(self, temp_cache_dir):
+        """Test that items are merged into the shards they belong to"""
+        cache = open_cache(temp_cache_dir, 4)
+        cache.set("0", "tt0")
+
+        stats = merge_imdb_items(
+            cache, [make_item(str(i), f"tt{i}") for i in range(20)]
+        )
+
+        assert stats["unchanged"] == 1
+        assert stats["new"] == 19
+        assert len(cache) == 20
+        assert cache.get("19") == "tt19"
+        cache.close()
+
+    def test_duplicate_keys(self, cache):
+        """Test that the rules apply between items of the same batch"""
+        now = time.time()
+
+        merge_imdb_items(
+            cache,
+            [make_item("a", "tt1", now + 500), make_item("a", "tt2", now + 100)],
+        )
+
+        assert cache.get("a") == "tt1"
+
+    def test_key_filter(self, cache):
+        """Test that merged keys are added to the key filter"""
+        cache.set("a", "tt1")
+        key_filter = CachedKeyFilter()
+        key_filter.build(cache)
+
+        stats = merge_imdb_items(
+            cache,
+            [make_item("a", "tt1"), make_item("b", "tt2")],
+            key_filter=key_filter,
+        )
+
+        assert stats["unchanged"] == 1
+        assert stats["new"] == 1
+        assert key_filter.is_cached("b")
+
+    def test_key_filter_misses_external_writes(self, cache):
+        """Test that keys written after the key filter was built are still read"""
+        key_filter = CachedKeyFilter()
+        key_filter.build(cache)
+        cache.set("a", "tt1")
+
+        stats = merge_imdb_items(
+            cache, [make_item("a", None, time.time() + 100)], key_filter=key_filter
+        )
+
+        assert stats["written"] == 0
+        assert cache.get("a") == "tt1"
@@ -1,9 +1,11 @@
+import httpx
 import pytest
 import time
 from unittest.mock import Mock, patch
 
 # Import from src package
-from src.throttler import Throttler
+from src.egress import ROUTE_EXTENSION, EgressRoute, EgressTransport
+from src.throttler import RateLimitedError, Throttler
 
 
 class TestThrottler:
@@ -30,7 +32,7 @@ class TestThrottler:
         request.url.host = "test.example.com"
 
         # Set rate limit
-        throttler.next_call_time["test.example.com"] = time.time() + 10
+        throttler._open("test.example.com", 10)
 
         # Should raise exception
         with pytest.raises(Exception) as exc_info:
@@ -46,7 +48,7 @@ class TestThrottler:
         request.url.host = "test.example.com"
 
         # Set rate limit in the past
-        throttler.next_call_time["test.example.com"] = time.time() - 1
+        throttler._open("test.example.com", -1)
 
         # Should not raise exception
         await throttler._on_request(request)
@@ -67,7 +69,7 @@ class TestThrottler:
 
             assert "Rate limited" in str(exc_info.value)
             assert "movie.douban.com" in str(exc_info.value)
-            assert throttler.next_call_time["movie.douban.com"] > time.time()
+            assert throttler.is_rate_limited("movie.douban.com")
 
     @pytest.mark.asyncio
     async def test_on_response_302_non_rate_limit(self, throttler):
@@ -95,7 +97,7 @@ class TestThrottler:
         assert "api.example.com" in str(exc_info.value)
 
         # Check that wait time is set correctly (approximately 120 seconds)
-        wait_time = throttler.next_call_time["api.example.com"] - time.time()
+        wait_time = throttler.get_info()["api.example.com"]["wait_time"]
         assert 119 <= wait_time <= 121
 
     @pytest.mark.asyncio
@@ -113,7 +115,7 @@ class TestThrottler:
         assert "Rate limited" in str(exc_info.value)
 
         # Check that wait time is set correctly (approximately 300 seconds)
-        wait_time = throttler.next_call_time["api.example.com"] - time.time()
+        wait_time = throttler.get_info()["api.example.com"]["wait_time"]
         assert 299 <= wait_time <= 301
 
     @pytest.mark.asyncio
@@ -130,7 +132,7 @@ class TestThrottler:
         assert "Rate limited" in str(exc_info.value)
 
         # Check that default 60 second wait time is used
-        wait_time = throttler.next_call_time["api.example.com"] - time.time()
+        wait_time = throttler.get_info()["api.example.com"]["wait_time"]
         assert 59 <= wait_time <= 61
 
     @pytest.mark.asyncio
@@ -145,7 +147,7 @@ class TestThrottler:
         await throttler._on_response(response)
 
         # Should not set rate limit
-        assert "api.example.com" not in throttler.next_call_time
+        assert "api.example.com" not in throttler.get_info()
 
     def test_get_event_hooks(self, throttler):
         """Test that event hooks are properly configured"""
@@ -164,7 +166,7 @@ class TestThrottler:
 
     def test_get_info_with_active_rate_limit(self, throttler):
         """Test get_info with active rate limit"""
-        throttler.next_call_time["test.example.com"] = time.time() + 100
+        throttler._open("test.example.com", 100)
 
         info = throttler.get_info()
 
@@ -174,7 +176,7 @@ class TestThrottler:
 
     def test_get_info_with_expired_rate_limit(self, throttler):
         """Test get_info with expired rate limit"""
-        throttler.next_call_time["test.example.com"] = time.time() - 10
+        throttler._open("test.example.com", -10)
 
         info = throttler.get_info()
 
@@ -184,10 +186,217 @@ class TestThrottler:
 
     def test_multiple_hosts_independent(self, throttler):
         """Test that rate limiting is tracked independently per host"""
-        throttler.next_call_time["host1.com"] = time.time() + 100
-        throttler.next_call_time["host2.com"] = time.time() - 10
+        throttler._open("host1.com", 100)
+        throttler._open("host2.com", -10)
 
         info = throttler.get_info()
 
         assert info["host1.com"]["is_rate_limited"] is True
         assert info["host2.com"]["is_rate_limited"] is False
+
+    def test_check_fails_fast(self, throttler):
+        """Test that check raises RateLimitedError while a host is open"""
+        throttler._open("test.example.com", 10)
+
+        with pytest.raises(RateLimitedError) as exc_info:
+            throttler.check("test.example.com")
+
+        assert exc_info.value.host == "test.example.com"
+        assert 0 < exc_info.value.wait_time <= 10
+        # Other hosts are not affected
+        throttler.check("other.example.com")
+
+    @pytest.mark.asyncio
+    async def test_half_open_allows_single_probe(self, throttler):
+        """Test that only one probe request goes through once the wait is over"""
+        request = Mock()
+        request.url.host = "test.example.com"
+        throttler._open("test.example.com", -1)
+
+        await throttler._on_request(request)
+        with pytest.raises(RateLimitedError):
+            await throttler._on_request(request)
+        assert throttler.get_info()["test.example.com"]["state"] == "half_open"
+
+    @pytest.mark.asyncio
+    async def test_successful_probe_closes_host(self, throttler):
+        """Test that a response without a rate limit closes a half-open host"""
+        request = Mock()
+        request.url.host = "test.example.com"
+        response = Mock()
+        response.status_code = 200
+        response.headers = {}
+        response.url.host = "test.example.com"
+        throttler._open("test.example.com", -1)
+
+        await throttler._on_request(request)
+        await throttler._on_response(response)
+
+        assert "test.example.com" not in throttler.get_info()
+        await throttler._on_request(request)
+        await throttler._on_request(request)
+
+    @pytest.mark.asyncio
+    async def test_rate_limited_probe_reopens_host(self, throttler):
+        """Test that a rate limited probe opens the host again"""
+        request = Mock()
+        request.url.host = "test.example.com"
+        response = Mock()
+        response.status_code = 429
+        response.headers = {"Retry-After": "30"}
+        response.url.host = "test.example.com"
+        throttler._open("test.example.com", -1)
+
+        await throttler._on_request(request)
+        with pytest.raises(RateLimitedError):
+            await throttler._on_response(response)
+
+        assert throttler.get_info()["test.example.com"]["state"] == "open"
+        with pytest.raises(RateLimitedError):
+            await throttler._on_request(request)
+
+    @pytest.mark.asyncio
+    async def test_response_while_open_keeps_host_open(self, throttler):
+        """Test that a late response doesn't close a host that is still open"""
+        response = Mock()
+        response.status_code = 200
+        response.headers = {}
+        response.url.host = "test.example.com"
+        throttler._open("test.example.com", 10)
+
+        await throttler._on_response(response)
+
+        assert throttler.is_rate_limited("test.example.com")
+
+
+class TestRoutedThrottler:
+    """Test suite for Throttler class with several egress routes"""
+
+    @pytest.fixture
+    def throttler(self):
+        return Throttler(["default", "hk", "jp"])
+
+    def new_request(self):
+        return httpx.Request("GET", "https://m.douban.com/")
+
+    async def rate_limit(self, throttler, request):
+        response = httpx.Response(429, headers={"Retry-After": "100"}, request=request)
+        with pytest.raises(RateLimitedError) as exc_info:
+            await throttler._on_response(response)
+        return exc_info.value
+
+    @pytest.mark.asyncio
+    async def test_round_robin(self, throttler):
+        """Test that requests go through the routes in turn"""
+        routes = []
+        for _ in range(4):
+            request = self.new_request()
+            await throttler._on_request(request)
+            routes.append(request.extensions[ROUTE_EXTENSION])
+
+        assert routes == ["default", "hk", "jp", "default"]
+
+    @pytest.mark.asyncio
+    async def test_skips_rate_limited_routes(self, throttler):
+        """Test that a rate limited route is skipped while the others carry on"""
+        request = self.new_request()
+        await throttler._on_request(request)
+        error = await self.rate_limit(throttler, request)
+
+        # Other routes are available right away.
+        assert error.wait_time == 0
+        assert 99 <= throttler.get_info()["m.douban.com"]["wait_time"] <= 101
+        assert throttler.available_routes("m.douban.com") == 2
+        throttler.check("m.douban.com")
+        routes = []
+        for _ in range(4):
+            request = self.new_request()
+            await throttler._on_request(request)
+            routes.append(request.extensions[ROUTE_EXTENSION])
+        assert routes == ["hk", "jp", "hk", "jp"]
+
+    @pytest.mark.asyncio
+    async def test_all_routes_rate_limited(self, throttler):
+        """Test that requests fail fast once every route is rate limited"""
+        for _ in range(3):
+            request = self.new_request()
+            await throttler._on_request(request)
+            error = await self.rate_limit(throttler, request)
+
+        assert 99 <= error.wait_time <= 101
+        assert throttler.is_rate_limited("m.douban.com")
+        assert throttler.available_routes("m.douban.com") == 1
+        with pytest.raises(RateLimitedError):
+            await throttler._on_request(self.new_request())
+        info = throttler.get_info()
+        assert info["m.douban.com@hk"]["state"] == "open"
+        assert info["m.douban.com@jp"]["state"] == "open"
+
+    @pytest.mark.asyncio
+    async def test_other_hosts_use_default_route(self, throttler):
+        """Test that hosts outside Douban are not spread over the routes"""
+        for _ in range(2):
+            request = httpx.Request("GET", "https://api.example.com/")
+            await throttler._on_request(request)
+
+            assert ROUTE_EXTENSION not in request.extensions
+        error = await self.rate_limit(throttler, request)
+
+        assert 99 <= error.wait_time <= 101
+        assert throttler.is_rate_limited("api.example.com")
+        assert list(throttler.get_info()) == ["api.example.com"]
+
+
+class TestEgressTransport:
+    """Test suite for EgressTransport class"""
+
+    @pytest.mark.asyncio
+    async def test_route_cookies(self):
+        """Test that each route sends and keeps its own cookies"""
+        seen = []
+
+        def handler(request):
+            seen.append(request.headers.get("Cookie"))
+            return httpx.Response(200, headers={"Set-Cookie": "bid=abc; Path=/"})
+
+        routes = [
+            EgressRoute("default", None, None),
+            EgressRoute("hk", None, "secret"),
+        ]
+        for route in routes:
+            route.transport = httpx.MockTransport(handler)
+        async with httpx.AsyncClient(transport=EgressTransport(routes)) as client:
+            await client.get(
+                "https://m.douban.com/", extensions={ROUTE_EXTENSION: "hk"}
+            )
+            await client.get(
+                "https://m.douban.com/", extensions={ROUTE_EXTENSION: "hk"}
+            )
+            await client.get("https://m.douban.com/")
+            await client.get("https://m.douban.com/")
+            assert len(client.cookies) == 0
+
+        assert seen == ["dbcl2=secret", "dbcl2=secret; bid=abc", None, "bid=abc"]
+
+    @pytest.mark.asyncio
+    async def test_other_hosts_use_default_route(self):
+        """Test that hosts outside Douban ignore the requested route"""
+        used = []
+
+        def new_route(name):
+            route = EgressRoute(name, None, None)
+            route.transport = httpx.MockTransport(
+                lambda request: used.append(name) or httpx.Response(200)
+            )
+            return route
+
+        transport = EgressTransport([new_route("default"), new_route("hk")])
+        async with httpx.AsyncClient(transport=transport) as client:
+            await client.get(
+                "https://www.douban.com/", extensions={ROUTE_EXTENSION: "hk"}
+            )
+            await client.get(
+                "https://imdb.example/", extensions={ROUTE_EXTENSION: "hk"}
+            )
+
+        assert used == ["hk", "default"]
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import httpx
+import pytest
+
+# Import from src package
+from src import tracing
+from src.tracing import Tracer, TracingTransport, span
+
+
+@pytest.fixture
+def tracer(monkeypatch):
+    """Provides a fresh Tracer used by the span helpers"""
+    tracer = Tracer(buffer_size=2)
+    monkeypatch.setattr(tracing, "tracer", tracer)
+    return tracer
+
+
+class TestTracer:
+    """Test suite for Tracer class"""
+
+    def test_nested_spans(self, tracer):
+        """Test that nested spans are exported as one trace"""
+        with tracing.trace("root", list="doulist:1"):
+            with span("child") as child:
+                child.set_attribute("items", 3)
+                with span("grandchild"):
+                    pass
+
+        traces = tracer.get_traces()
+        assert len(traces) == 1
+        trace = tracer.get_trace(traces[0]["trace_id"])
+        names = [_["name"] for _ in trace["spans"]]
+        assert names == ["root", "child", "grandchild"]
+        root, child, grandchild = trace["spans"]
+        assert root["parent_id"] is None
+        assert root["attributes"] == {"list": "doulist:1"}
+        assert child["parent_id"] == root["span_id"]
+        assert child["attributes"] == {"items": 3}
+        assert grandchild["parent_id"] == child["span_id"]
+
+    def test_error_recorded(self, tracer):
+        """Test that a span records the error raised within it"""
+        with pytest.raises(ValueError):
+            with tracing.trace("root"):
+                raise ValueError("boom")
+
+        trace = tracer.get_trace(tracer.get_traces()[0]["trace_id"])
+        assert "boom" in trace["spans"][0]["error"]
+
+    def test_ring_buffer(self, tracer):
+        """Test that only the last traces are kept, newest first"""
+        for name in ("a", "b", "c"):
+            with tracing.trace(name):
+                pass
+
+        assert [_["name"] for _ in tracer.get_traces()] == ["c", "b"]
+        assert [_["name"] for _ in tracer.get_traces(limit=1)] == ["c"]
+
+    @pytest.mark.asyncio
+    async def test_critical_path(self, tracer):
+        """Test that the critical path follows the slowest concurrent child"""
+
+        async def work(name, seconds):
+            with span(name):
+                await asyncio.sleep(seconds)
+
+        with tracing.trace("root"):
+            await asyncio.gather(work("fast", 0.01), work("slow", 0.05))
+
+        trace = tracer.get_trace(tracer.get_traces()[0]["trace_id"])
+        assert [_["name"] for _ in trace["critical_path"]] == ["root", "slow"]
+
+    @pytest.mark.asyncio
+    async def test_spans_after_export_dropped(self, tracer):
+        """Test that spans of tasks outliving their trace are dropped"""
+
+        async def late():
+            await asyncio.sleep(0.01)
+            with span("late"):
+                pass
+
+        with tracing.trace("root"):
+            task = asyncio.create_task(late())
+        await task
+
+        traces = tracer.get_traces()
+        assert [_["name"] for _ in traces] == ["root"]
+
+    def test_max_spans(self, tracer, monkeypatch):
+        """Test that spans beyond the limit are counted but not kept"""
+        monkeypatch.setattr(tracing, "MAX_SPANS_PER_TRACE", 2)
+        with tracing.trace("root"):
+            for _ in range(5):
+                with span("child"):
+                    pass
+
+        trace = tracer.get_trace(tracer.get_traces()[0]["trace_id"])
+        assert len(trace["spans"]) == 3
+        assert trace["dropped_spans"] == 3
+
+    def test_file_export(self, monkeypatch, temp_cache_dir):
+        """Test that traces are appended to the JSON lines file"""
+        path = os.path.join(temp_cache_dir, "traces.jsonl")
+        monkeypatch.setattr(tracing, "tracer", Tracer(0, path))
+        with tracing.trace("a"):
+            pass
+        with tracing.trace("b"):
+            pass
+
+        with open(path) as f:
+            traces = [json.loads(line) for line in f]
+        assert [_["name"] for _ in traces] == ["a", "b"]
+        assert tracing.tracer.get_traces() == []
+
+    def test_disabled(self, monkeypatch):
+        """Test that nothing is recorded when tracing is disabled"""
+        monkeypatch.setattr(tracing, "tracer", Tracer(0))
+        with tracing.trace("root") as root:
+            assert root is None
+        assert tracing.tracer.active == {}
+
+    def test_spans_outside_trace_dropped(self, tracer):
+        """Test that spans without a trace, e.g. of background jobs, are dropped"""
+        with span("background") as background:
+            with span("child") as child:
+                pass
+
+        assert background is None
+        assert child is None
+        assert tracer.get_traces() == []
+
+    @pytest.mark.asyncio
+    async def test_http_transport(self, tracer):
+        """Test that HTTP requests are recorded only within a trace"""
+
+        def handler(request):
+            if request.url.path == "/fail":
+                raise httpx.ConnectError("boom", request=request)
+            return httpx.Response(200)
+
+        transport = TracingTransport(httpx.MockTransport(handler))
+        async with httpx.AsyncClient(transport=transport) as client:
+            await client.get("https://m.douban.com/")
+            assert tracer.get_traces() == []
+
+            with tracing.trace("root"):
+                await client.get("https://m.douban.com/ok")
+                with pytest.raises(httpx.ConnectError):
+                    await client.get("https://m.douban.com/fail")
+
+        trace = tracer.get_trace(tracer.get_traces()[0]["trace_id"])
+        ok, fail = trace["spans"][1:]
+        assert ok["name"] == "http"
+        assert ok["attributes"]["url"] == "https://m.douban.com/ok"
+        assert ok["attributes"]["status_code"] == 200
+        assert fail["attributes"]["url"] == "https://m.douban.com/fail"
+        assert "boom" in fail["error"]